@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark the LLM proxy against the mock provider.
+
+Sends concurrent chat completions and reports throughput, end-to-end latency
+and the proxy's own overhead (the x-quanxai-overhead-ms header, i.e. time
+spent in the gateway outside the upstream call). Without --url the app runs
+in-process; a temporary API key is created on the configured database.
+
+Bedrock models are spread over regions by the proxy; to compare that with
+fixed-region routing, slow down the home region of the mock provider and
+run with REGION_ROUTING_ENABLED=true and false:
+
+    MOCK_REGION_LATENCY_MS='{"us-east-1": 300, "us-west-2": 80, "eu-west-1": 150}' \
+    python scripts/bench_proxy.py --model bedrock/anthropic.claude-3-haiku-20240307-v1:0
+
+Usage: python scripts/bench_proxy.py [--requests 2000] [--concurrency 50]
+                                     [--model gpt-4o] [--url http://127.0.0.1:8000 --key sk-...]
+"""
+import sys
+import os
+
+# Add the src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+from sqlmodel import Session, select
+
+from quanxai.database import APIKey, Team, engine
+from quanxai.services.keys import hash_key
+
+
+def create_bench_key() -> str:
+    """Add an API key for the benchmark and return the raw key."""
+    raw_key = f"sk-quanxai-bench-{os.urandom(12).hex()}"
+    with Session(engine) as session:
+        team = session.exec(select(Team)).first()
+        if team is None:
+            sys.exit("No teams found; run scripts/seed_data.py first")
+        session.add(APIKey(
+            key_hash=hash_key(raw_key),
+            key_prefix=f"sk-{raw_key[12:16]}-****",
+            alias="Proxy benchmark key",
+            team_id=team.id,
+            rate_limit_rpm=1_000_000,
+            rate_limit_tpm=1_000_000_000,
+            max_parallel_requests=10_000,
+        ))
+        session.commit()
+    return raw_key
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+async def run(client: httpx.AsyncClient, key: str, model: str, requests: int, concurrency: int) -> None:
+    latencies: List[float] = []
+    overheads: List[float] = []
+    regions: Counter = Counter()
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(
+                "/v1/chat/completions",
+                headers={"Authorization": f"Bearer {key}"},
+                json={"model": model, "messages": [{"role": "user", "content": f"Benchmark request {i}"}]},
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+            elif "x-quanxai-overhead-ms" in response.headers:
+                overheads.append(float(response.headers["x-quanxai-overhead-ms"]))
+            if "x-quanxai-region" in response.headers:
+                regions[response.headers["x-quanxai-region"]] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(f"Requests:   {requests} ({errors} errors) in {elapsed:.2f}s = {requests / elapsed:,.0f} req/s")
+    print(f"Latency:    p50 {percentile(latencies, 50):.2f} ms  p95 {percentile(latencies, 95):.2f} ms"
+          f"  p99 {percentile(latencies, 99):.2f} ms")
+    if overheads:
+        print(f"Overhead:   p50 {percentile(overheads, 50):.2f} ms  p99 {percentile(overheads, 99):.2f} ms"
+              f"  mean {statistics.mean(overheads):.2f} ms")
+    if regions:
+        print("Regions:    " + "  ".join(f"{region} {count}" for region, count in regions.most_common()))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LLM proxy")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--url", help="Running QuanXAI server (default: in-process)")
+    parser.add_argument("--key", help="API key to use with --url")
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.key:
+            sys.exit("--key is required with --url")
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            await run(client, args.key, args.model, args.requests, args.concurrency)
+        return
+
+    from quanxai.main import app
+
+    key = create_bench_key()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://quanxai", timeout=60) as client:
+            # Warm up pools and caches before measuring
+            await run(client, key, args.model, min(50, args.requests), 1)
+            print("---")
+            await run(client, key, args.model, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
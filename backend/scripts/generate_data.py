@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Bulk data generator for benchmarking QuanXAI on large tables.
+
+Generates usage logs (with their tag links and AWS usage logs), guardrail
+violations and audit logs in vectorized NumPy batches and bulk-inserts them
+(COPY on Postgres, executemany elsewhere). Scale 1 is the seed script's
+volume, about 283k usage logs over 30 days; scale 35 is ~10M rows. The same
+seed and end date always produce the same rows, whatever the worker count.
+
+Reference data (organization, teams, users, keys, tags, guardrails, AWS
+products) is taken from the database, and seeded first if it is empty.
+
+Usage: python scripts/generate_data.py [--scale 10] [--days 30] [--seed 42]
+                                       [--workers 4] [--batch-size 50000]
+                                       [--end 2026-01-31] [--defer-indexes]
+                                       [--skip-rollups]
+"""
+import sys
+import os
+
+# Add the src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import argparse
+import csv
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from quanxai.database.engine import engine, create_db_and_tables
+from quanxai.database.models import (
+    Organization, Team, User, APIKey, UsageLog, UsageLogTag,
+    Tag, Guardrail, GuardrailViolation, AuditLog, AWSProduct, AWSUsageLog,
+)
+from quanxai.services.rollups import rebuild_usage_rollups
+
+import seed_data
+from seed_data import MODEL_COSTS, MODEL_DISTRIBUTION, TARGET_SUCCESS_RATE, TARGET_TOTAL_REQUESTS
+
+# Rows per unit of scale for the smaller tables (matching seed_data.py)
+VIOLATIONS_PER_SCALE = 200
+AUDIT_LOGS_PER_SCALE = 500
+
+BASE_LATENCY_MS = {
+    "gpt-4": 2500, "gpt-4o": 1500, "claude-3-sonnet": 1800, "claude-3-haiku": 800,
+    "bedrock/claude-3-sonnet": 1900, "bedrock/claude-3-haiku": 850, "llama-3-70b": 1200, "gemini-pro": 1500,
+}
+
+AWS_REGIONS = ["us-east-1", "us-west-2", "eu-west-1"]
+COST_ALLOCATION_TAGS = ["production", "development", "staging"]
+BUSINESS_UNITS = ["Engineering", "Data Science", "Product"]
+VIOLATION_TYPES = ["hate_speech", "pii_detected", "prompt_injection", "toxic_language", "self_harm", "violence"]
+SEVERITIES = ["low", "medium", "high"]
+AUDIT_ACTIONS = ["create", "update", "delete", "block", "unblock", "regenerate"]
+AUDIT_ENTITY_TYPES = ["key", "team", "user", "model", "budget", "guardrail"]
+
+TABLES = {
+    model.__tablename__: model.__table__
+    for model in (UsageLog, UsageLogTag, AWSUsageLog, GuardrailViolation, AuditLog)
+}
+
+# Column-oriented batch: table name -> column name -> values
+Batch = Dict[str, Dict[str, list]]
+
+
+# =============================================================================
+# Reference data
+# =============================================================================
+
+def load_reference(session: Session, seed: int) -> Dict[str, Any]:
+    """IDs the generated rows point at, seeding reference entities if needed."""
+    org = session.exec(select(Organization)).first()
+    if org is None:
+        print("No reference data found, seeding organization, teams, users and keys...")
+        random.seed(seed)
+        org = seed_data.seed_organization(session)
+        teams = seed_data.seed_teams(session, org)
+        users = seed_data.seed_users(session, teams)
+        tags = seed_data.seed_tags(session, org)
+        api_keys = seed_data.seed_api_keys(session, org, teams, users, tags)
+        seed_data.seed_guardrails(session, org)
+        seed_data.seed_budgets(session, org, teams, users, api_keys)
+        seed_data.seed_aws_products(session, org)
+
+    user_keys = session.exec(
+        select(APIKey.id, APIKey.user_id, User.team_id)
+        .join(User, User.id == APIKey.user_id)
+        .order_by(APIKey.id)
+    ).all()
+    users = session.exec(select(User.id, User.email, User.name).order_by(User.id)).all()
+    teams = session.exec(select(Team.id, Team.name).order_by(Team.id)).all()
+    keys = session.exec(select(APIKey.id, APIKey.alias).order_by(APIKey.id)).all()
+
+    return {
+        "organization_id": org.id,
+        "user_keys": [tuple(k) for k in user_keys],
+        "users": [tuple(u) for u in users],
+        "teams": [tuple(t) for t in teams],
+        "keys": [tuple(k) for k in keys],
+        "tag_ids": list(session.exec(select(Tag.id).order_by(Tag.id)).all()),
+        "guardrail_ids": list(session.exec(select(Guardrail.id).order_by(Guardrail.id)).all()),
+        "bedrock_product_ids": list(session.exec(
+            select(AWSProduct.id).where(AWSProduct.service == "bedrock").order_by(AWSProduct.id)
+        ).all()),
+    }
+
+
+# =============================================================================
+# Vectorized generators
+# =============================================================================
+
+def uuids(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n random (version 4) UUID strings drawn from rng."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    h = raw.tobytes().hex()
+    return np.array([
+        f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}"
+        for i in range(0, 32 * n, 32)
+    ], dtype=object)
+
+
+def pick(rng: np.random.Generator, values: List[Any], n: int) -> np.ndarray:
+    """n uniform choices from values, as an object array."""
+    return np.array(values, dtype=object)[rng.integers(0, len(values), n)]
+
+
+def timestamps(start: np.datetime64, offsets_us: np.ndarray) -> List[datetime]:
+    """Python datetimes for microsecond offsets from start."""
+    return (start + offsets_us.astype("timedelta64[us]")).astype("datetime64[us]").tolist()
+
+
+def generate_usage(rng: np.random.Generator, ref: Dict[str, Any], day: datetime, n: int) -> Batch:
+    """Usage logs for one day, with their usage_log_tags and aws_usage_logs rows."""
+    models = list(MODEL_DISTRIBUTION)
+    weights = np.array([MODEL_DISTRIBUTION[m]["percentage"] for m in models])
+    model_idx = rng.choice(len(models), size=n, p=weights / weights.sum())
+    model = np.array(models, dtype=object)[model_idx]
+    provider = np.array([MODEL_DISTRIBUTION[m]["provider"] for m in models], dtype=object)[model_idx]
+
+    key_idx = rng.integers(0, len(ref["user_keys"]), n)
+    key_id, user_id, team_id = (np.array(column, dtype=object)[key_idx] for column in zip(*ref["user_keys"]))
+
+    prompt_tokens = rng.integers(100, 3001, n)
+    completion_tokens = rng.integers(50, 1501, n)
+    input_cost = np.array([MODEL_COSTS[m][0] for m in models])[model_idx]
+    output_cost = np.array([MODEL_COSTS[m][1] for m in models])[model_idx]
+    prompt_cost = prompt_tokens / 1_000_000 * input_cost
+    completion_cost = completion_tokens / 1_000_000 * output_cost
+
+    cache_read = np.where(rng.random(n) < 0.2, rng.integers(0, prompt_tokens // 3 + 1), 0)
+    cache_creation = np.where(rng.random(n) < 0.1, rng.integers(0, 301, n), 0)
+    is_success = rng.random(n) < TARGET_SUCCESS_RATE
+    latency = (np.array([BASE_LATENCY_MS.get(m, 2000) for m in models])[model_idx] * rng.uniform(0.5, 2.0, n))
+
+    # Business hours, 08:00:00 to 20:59:59
+    offsets = rng.integers(8 * 3600 * 10**6, 21 * 3600 * 10**6, n)
+    created_at = timestamps(np.datetime64(day, "us"), offsets)
+
+    # Zero to two tags per log, as JSON looked up from a precomputed table
+    tag_ids = ref["tag_ids"]
+    t = len(tag_ids)
+    tag_count = rng.integers(0, 3, n)
+    first_tag = rng.integers(0, t, n)
+    second_tag = rng.integers(0, t, n)
+    tag_json = np.array(
+        [json.dumps([a]) for a in tag_ids]
+        + [json.dumps([a, b]) for a in tag_ids for b in tag_ids]
+        + [None],
+        dtype=object,
+    )
+    tags = tag_json[np.select(
+        [tag_count == 1, tag_count == 2],
+        [first_tag, t + first_tag * t + second_tag],
+        default=len(tag_json) - 1,
+    )]
+
+    ids = uuids(rng, n)
+    created = np.array(created_at, dtype=object)
+    tag_array = np.array(tag_ids, dtype=object)
+    first_link = tag_count >= 1
+    second_link = (tag_count == 2) & (second_tag != first_tag)
+
+    bedrock = provider == "bedrock"
+    m = int(bedrock.sum())
+
+    return {
+        "usage_logs": {
+            "id": ids.tolist(),
+            "request_id": uuids(rng, n).tolist(),
+            "api_key_id": key_id.tolist(),
+            "organization_id": [ref["organization_id"]] * n,
+            "team_id": team_id.tolist(),
+            "user_id": user_id.tolist(),
+            "model_requested": model.tolist(),
+            "model_used": model.tolist(),
+            "provider": provider.tolist(),
+            "prompt_tokens": prompt_tokens.tolist(),
+            "completion_tokens": completion_tokens.tolist(),
+            "total_tokens": (prompt_tokens + completion_tokens).tolist(),
+            "cache_read_tokens": cache_read.tolist(),
+            "cache_creation_tokens": cache_creation.tolist(),
+            "prompt_cost_usd": prompt_cost.tolist(),
+            "completion_cost_usd": completion_cost.tolist(),
+            "total_cost_usd": (prompt_cost + completion_cost).tolist(),
+            "latency_ms": latency.astype(np.int64).tolist(),
+            "is_streaming": (rng.random(n) < 0.3).tolist(),
+            "is_success": is_success.tolist(),
+            "error_type": np.where(is_success, None, "rate_limit").tolist(),
+            "status_code": np.where(is_success, 200, 429).tolist(),
+            "tags": tags.tolist(),
+            "created_at": created_at,
+        },
+        "usage_log_tags": {
+            "usage_log_id": np.concatenate([ids[first_link], ids[second_link]]).tolist(),
+            "tag_id": np.concatenate([tag_array[first_tag[first_link]], tag_array[second_tag[second_link]]]).tolist(),
+            "created_at": np.concatenate([created[first_link], created[second_link]]).tolist(),
+        },
+        "aws_usage_logs": {
+            "id": uuids(rng, m).tolist(),
+            "usage_log_id": ids[bedrock].tolist(),
+            "aws_product_id": pick(rng, ref["bedrock_product_ids"], m).tolist(),
+            "region": pick(rng, AWS_REGIONS, m).tolist(),
+            "cross_region": (rng.random(m) < 0.1).tolist(),
+            "cost_allocation_tag": pick(rng, COST_ALLOCATION_TAGS, m).tolist(),
+            "business_unit": pick(rng, BUSINESS_UNITS, m).tolist(),
+            "project_id": np.char.add("proj-", rng.integers(1000, 10000, m).astype(str)).tolist(),
+            "created_at": created[bedrock].tolist(),
+        } if ref["bedrock_product_ids"] else {},
+    }
+
+
+def generate_violations(rng: np.random.Generator, ref: Dict[str, Any], start: datetime, span_us: int, n: int) -> Batch:
+    """Guardrail violations spread uniformly over the window."""
+    confidence = np.round(rng.uniform(0.7, 1.0, n), 2)
+    return {
+        "guardrail_violations": {
+            "id": uuids(rng, n).tolist(),
+            "guardrail_id": pick(rng, ref["guardrail_ids"], n).tolist(),
+            "request_id": uuids(rng, n).tolist(),
+            "api_key_id": pick(rng, [k[0] for k in ref["keys"]], n).tolist(),
+            "violation_type": pick(rng, VIOLATION_TYPES, n).tolist(),
+            "severity": pick(rng, SEVERITIES, n).tolist(),
+            "blocked": (rng.random(n) > 0.3).tolist(),
+            "details": [json.dumps({"matched_pattern": "example pattern", "confidence": c}) for c in confidence.tolist()],
+            "created_at": timestamps(np.datetime64(start, "us"), rng.integers(0, span_us, n)),
+        },
+    }
+
+
+def generate_audit_logs(rng: np.random.Generator, ref: Dict[str, Any], start: datetime, span_us: int, n: int) -> Batch:
+    """Audit log entries spread uniformly over the window."""
+    actor = rng.integers(0, len(ref["users"]), n)
+    actor_id, actor_email, _ = (np.array(column, dtype=object)[actor] for column in zip(*ref["users"]))
+    entity_type = pick(rng, AUDIT_ENTITY_TYPES, n)
+
+    # Keys, teams and users point at real rows; other entity types are synthetic
+    entity_id = uuids(rng, n)
+    entity_name = np.char.add("Entity ", rng.integers(1, 101, n).astype(str)).astype(object)
+    for kind, rows in (("key", ref["keys"]), ("team", ref["teams"]), ("user", [(u[0], u[2]) for u in ref["users"]])):
+        mask = entity_type == kind
+        chosen = rng.integers(0, len(rows), int(mask.sum()))
+        entity_id[mask] = np.array([r[0] for r in rows], dtype=object)[chosen]
+        entity_name[mask] = np.array([r[1] for r in rows], dtype=object)[chosen]
+
+    return {
+        "audit_logs": {
+            "id": uuids(rng, n).tolist(),
+            "actor_id": actor_id.tolist(),
+            "actor_type": ["user"] * n,
+            "actor_email": actor_email.tolist(),
+            "action": pick(rng, AUDIT_ACTIONS, n).tolist(),
+            "entity_type": entity_type.tolist(),
+            "entity_id": entity_id.tolist(),
+            "entity_name": entity_name.tolist(),
+            "details": np.where(rng.random(n) > 0.5, json.dumps({"reason": "Routine maintenance"}), None).tolist(),
+            "ip_address": np.char.add("192.168.1.", rng.integers(1, 256, n).astype(str)).tolist(),
+            "organization_id": [ref["organization_id"]] * n,
+            "created_at": timestamps(np.datetime64(start, "us"), rng.integers(0, span_us, n)),
+        },
+    }
+
+
+GENERATORS = {
+    "usage": generate_usage,
+    "violations": generate_violations,
+    "audit": generate_audit_logs,
+}
+
+
+# =============================================================================
+# Bulk insert
+# =============================================================================
+
+def bulk_insert(conn, batch: Batch) -> Dict[str, int]:
+    """Insert a batch in one transaction; returns rows written per table."""
+    counts = {}
+    for name, columns in batch.items():
+        if not columns:
+            continue
+        names = list(columns)
+        rows = list(zip(*columns.values()))
+        if not rows:
+            continue
+        if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            cursor.copy_expert(f"COPY {name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.close()
+        else:
+            conn.execute(insert(TABLES[name]), [dict(zip(names, row)) for row in rows])
+        counts[name] = len(rows)
+    return counts
+
+
+# =============================================================================
+# Tasks
+# =============================================================================
+
+Task = Tuple[str, tuple, np.random.SeedSequence]
+
+_reference: Optional[Dict[str, Any]] = None
+_write_in_worker = False
+
+
+def _init_worker(reference: Dict[str, Any], write_in_worker: bool) -> None:
+    global _reference, _write_in_worker
+    _reference = reference
+    _write_in_worker = write_in_worker
+    # Connections inherited from the parent must not be reused
+    engine.dispose(close=False)
+
+
+def _run_task(task: Task):
+    kind, args, seed_seq = task
+    batch = GENERATORS[kind](np.random.default_rng(seed_seq), _reference, *args)
+    if not _write_in_worker:
+        return batch
+    with engine.begin() as conn:
+        return bulk_insert(conn, batch)
+
+
+def plan_tasks(scale: float, days: int, end: datetime, batch_size: int, seed: int) -> List[Task]:
+    """Split the load into batches, each with its own child seed."""
+    plan_seed, task_seed = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(plan_seed)
+
+    # Requests per day: weekdays twice as busy as weekends, +/-20% noise
+    day_starts = [end - timedelta(days=d) for d in range(days, 0, -1)]
+    weights = np.array([1.2 if d.weekday() < 5 else 0.6 for d in day_starts]) * rng.uniform(0.8, 1.2, days)
+    per_day = rng.multinomial(int(TARGET_TOTAL_REQUESTS * scale), weights / weights.sum())
+
+    specs = []
+    for day, n in zip(day_starts, per_day.tolist()):
+        for offset in range(0, n, batch_size):
+            specs.append(("usage", (day, min(batch_size, n - offset))))
+
+    start = end - timedelta(days=days)
+    span_us = days * 86400 * 10**6
+    for kind, total in (("violations", int(VIOLATIONS_PER_SCALE * scale)), ("audit", int(AUDIT_LOGS_PER_SCALE * scale))):
+        for offset in range(0, total, batch_size):
+            specs.append((kind, (start, span_us, min(batch_size, total - offset))))
+
+    return [(kind, args, s) for (kind, args), s in zip(specs, task_seed.spawn(len(specs)))]
+
+
+def set_indexes(create: bool) -> None:
+    """Drop or recreate the secondary indexes of the generated tables."""
+    for table in TABLES.values():
+        for index in table.indexes:
+            if create:
+                index.create(engine, checkfirst=True)
+            else:
+                index.drop(engine, checkfirst=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate large synthetic datasets")
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 = ~283k usage logs")
+    parser.add_argument("--days", type=int, default=30, help="Days of history to generate")
+    parser.add_argument("--end", type=lambda s: datetime.strptime(s, "%Y-%m-%d"), default=None,
+                        help="Last generated day is the day before this date (default: today)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows per generated batch")
+    parser.add_argument("--defer-indexes", action="store_true", help="Drop indexes during the load, rebuild after")
+    parser.add_argument("--skip-rollups", action="store_true", help="Do not rebuild usage rollups afterwards")
+    args = parser.parse_args()
+
+    end = args.end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        reference = load_reference(session, args.seed)
+
+    tasks = plan_tasks(args.scale, args.days, end, args.batch_size, args.seed)
+    # SQLite has a single writer, so workers only generate and the parent
+    # inserts; elsewhere each worker writes its own batches in parallel
+    write_in_worker = args.workers > 1 and engine.dialect.name != "sqlite"
+    print(f"Generating {len(tasks)} batches with {args.workers} worker(s)...")
+
+    if args.defer_indexes:
+        set_indexes(create=False)
+
+    totals: Dict[str, int] = {}
+    started = time.perf_counter()
+
+    def record(counts: Dict[str, int]) -> None:
+        for name, count in counts.items():
+            totals[name] = totals.get(name, 0) + count
+        rows = sum(totals.values())
+        print(f"  {rows:,} rows ({rows / (time.perf_counter() - started):,.0f} rows/s)", end="\r")
+
+    if args.workers > 1:
+        with Pool(args.workers, initializer=_init_worker, initargs=(reference, write_in_worker)) as pool:
+            for result in pool.imap_unordered(_run_task, tasks):
+                if write_in_worker:
+                    record(result)
+                else:
+                    with engine.begin() as conn:
+                        record(bulk_insert(conn, result))
+    else:
+        _init_worker(reference, write_in_worker=True)
+        for task in tasks:
+            record(_run_task(task))
+
+    elapsed = time.perf_counter() - started
+    print()
+    for name, count in totals.items():
+        print(f"  {name}: {count:,}")
+    print(f"Inserted {sum(totals.values()):,} rows in {elapsed:.1f}s ({sum(totals.values()) / elapsed:,.0f} rows/s)")
+
+    if args.defer_indexes:
+        print("Rebuilding indexes...")
+        set_indexes(create=True)
+
+    if not args.skip_rollups:
+        print("Building usage rollups...")
+        with Session(engine) as session:
+            days = rebuild_usage_rollups(session)
+        print(f"  Rebuilt rollups for {days} days")
+
+
+if __name__ == "__main__":
+    main()
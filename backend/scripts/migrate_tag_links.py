@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Backfill the usage_log_tags and api_key_tags association tables.
+
+Creates the tables if needed and rebuilds them from the JSON tags columns on
+usage_logs and api_keys. Safe to re-run; existing links are replaced.
+
+Usage: python scripts/migrate_tag_links.py
+"""
+import sys
+import os
+
+# Add the src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlmodel import Session
+from quanxai.database.engine import engine, create_db_and_tables
+from quanxai.services.tagging import backfill_tag_links
+
+
+def main():
+    """Create and backfill the tag association tables."""
+    create_db_and_tables()
+
+    with Session(engine) as session:
+        counts = backfill_tag_links(session)
+
+    print(f"Linked {counts['api_key_tags']} key tags and {counts['usage_log_tags']} usage log tags")
+
+
+if __name__ == "__main__":
+    main()
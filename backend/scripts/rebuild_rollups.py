@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Rebuild the hourly and daily usage rollups from usage_logs.
+
+Run after importing logs out of band, or to backfill rollups on an existing
+database. Without --days every day with logs is rebuilt and the dashboards
+start reading from the rollups. Rollups are derived data, so a full rebuild
+also drops and recreates the rollup tables to pick up schema changes.
+
+Usage: python scripts/rebuild_rollups.py [--days N]
+"""
+import sys
+import os
+
+# Add the src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import argparse
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, SQLModel
+from quanxai.database.engine import engine, create_db_and_tables
+from quanxai.database.models import UsageRollupDaily, UsageRollupHourly, UsageRollupState
+from quanxai.services.rollups import rebuild_usage_rollups
+
+
+def main():
+    """Rebuild usage rollups for all days or the last N days."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, help="only rebuild the last N days")
+    args = parser.parse_args()
+
+    if not args.days:
+        rollup_tables = [
+            UsageRollupHourly.__table__,
+            UsageRollupDaily.__table__,
+            UsageRollupState.__table__,
+        ]
+        SQLModel.metadata.drop_all(engine, tables=rollup_tables)
+    create_db_and_tables()
+
+    start = end = None
+    if args.days:
+        end = datetime.utcnow()
+        start = end - timedelta(days=args.days)
+
+    with Session(engine) as session:
+        days = rebuild_usage_rollups(session, start, end)
+
+    print(f"Rebuilt usage rollups for {days} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,8 @@ from quanxai.database.models import (
     Tag, Guardrail, GuardrailViolation, Budget, AuditLog,
     AWSProduct, AWSUsageLog, CacheEntry, CacheMetrics
 )
+from quanxai.services.rollups import rebuild_usage_rollups
+from quanxai.services.tagging import backfill_tag_links
 
 
 # =============================================================================
@@ -779,6 +781,8 @@ def seed_usage_logs(
 
     requests_per_day = TARGET_TOTAL_REQUESTS // days
     user_api_keys = [(k, raw) for k, raw in api_keys if k.user_id is not None]
+    team_by_user = {u.id: u.team_id for u in users}
+    bedrock_products = [p for p in aws_products if p.service == "bedrock"]
 
     total_spend = 0
     total_requests = 0
@@ -805,12 +809,7 @@ def seed_usage_logs(
             api_key, _ = random.choice(user_api_keys)
             user_id = api_key.user_id
 
-            # Find user's team
-            team_id = None
-            for u in users:
-                if u.id == user_id:
-                    team_id = u.team_id
-                    break
+            team_id = team_by_user.get(user_id)
 
             prompt_tokens = random.randint(100, 3000)
             completion_tokens = random.randint(50, 1500)
@@ -869,8 +868,8 @@ def seed_usage_logs(
             total_tokens += total_tok
 
             # Create AWS usage log for bedrock models
-            if provider == "bedrock" and aws_products:
-                aws_product = random.choice([p for p in aws_products if p.service == "bedrock"])
+            if provider == "bedrock" and bedrock_products:
+                aws_product = random.choice(bedrock_products)
                 aws_log = AWSUsageLog(
                     id=str(uuid4()),
                     usage_log_id=log.id,
@@ -915,6 +914,11 @@ def main():
         if existing_orgs:
             print("Database already contains data. Clearing existing data...")
             # Clear in reverse order of dependencies
+            session.exec(text("DELETE FROM usage_rollup_state"))
+            session.exec(text("DELETE FROM usage_rollups_daily"))
+            session.exec(text("DELETE FROM usage_rollups_hourly"))
+            session.exec(text("DELETE FROM usage_log_tags"))
+            session.exec(text("DELETE FROM api_key_tags"))
             session.exec(text("DELETE FROM aws_usage_logs"))
             session.exec(text("DELETE FROM cache_metrics"))
             session.exec(text("DELETE FROM cache_entries"))
@@ -947,6 +951,14 @@ def main():
         seed_cache_entries(session, org)
         seed_usage_logs(session, org, teams, users, api_keys, tags, bedrock_products + sagemaker_products, days=30)
 
+        print("Linking tags...")
+        counts = backfill_tag_links(session)
+        print(f"  Linked {counts['api_key_tags']} key tags and {counts['usage_log_tags']} usage log tags")
+
+        print("Building usage rollups...")
+        days = rebuild_usage_rollups(session)
+        print(f"  Rebuilt rollups for {days} days")
+
     print()
     print("=" * 60)
     print("Seeding complete!")
@@ -1,6 +1,6 @@
 """Application configuration."""
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 import os
 
 
@@ -13,9 +13,156 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./quanxai.db"
 
+    # Run dashboard reads on an async engine (aiosqlite/asyncpg) instead of
+    # the threadpool; ASYNC_DATABASE_URL defaults to DATABASE_URL with the
+    # async driver swapped in
+    DATABASE_ASYNC: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+
+    # SQL logging: echo every statement, or only log statements slower
+    # than SLOW_QUERY_MS
+    SQL_ECHO: bool = False
+    SLOW_QUERY_MS: Optional[int] = None
+
+    # Connection pool (Postgres)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: Optional[int] = None
+
+    # SQLite pragmas applied to every connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # Serve dashboard aggregates from usage rollups once they are built
+    ROLLUPS_ENABLED: bool = True
+
     # LLM Provider Keys (optional - for actual API calls)
     OPENAI_API_KEY: Optional[str] = None
     ANTHROPIC_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+    ANTHROPIC_BASE_URL: str = "https://api.anthropic.com/v1"
+    # AWS Bedrock's OpenAI-compatible endpoint, "{region}" filled in per request
+    BEDROCK_API_KEY: Optional[str] = None
+    BEDROCK_BASE_URL: str = "https://bedrock-runtime.{region}.amazonaws.com/openai/v1"
+    BEDROCK_DEFAULT_REGION: str = "us-east-1"
+
+    # LLM proxy (/v1/chat/completions). Models no configured provider claims
+    # go to PROXY_DEFAULT_PROVIDER; "mock" is served in-process unless
+    # MOCK_PROVIDER_URL points at a standalone mock provider
+    PROXY_DEFAULT_PROVIDER: Optional[str] = "mock"
+    PROXY_LOG_PAYLOADS: bool = False
+    # Share one upstream call between identical concurrent requests
+    PROXY_COALESCE_REQUESTS: bool = True
+    MOCK_PROVIDER_URL: Optional[str] = None
+    MOCK_PROVIDER_LATENCY_MS: int = 0
+    MOCK_PROVIDER_TOKEN_LATENCY_MS: int = 0  # Between streamed tokens
+    MOCK_PROVIDER_ERROR_RATE: float = 0.0  # Share of completions failing with a 500
+    # Share of completions taking MOCK_PROVIDER_TAIL_LATENCY_MS longer
+    MOCK_PROVIDER_TAIL_RATE: float = 0.0
+    MOCK_PROVIDER_TAIL_LATENCY_MS: int = 0
+    # Extra latency and share of 429 responses per region the mock serves
+    MOCK_REGION_LATENCY_MS: Dict[str, int] = {}
+    MOCK_REGION_THROTTLE_RATE: Dict[str, float] = {}
+
+    # Bedrock models go to the region of their AWSProduct deployments with
+    # the lowest expected latency, falling back to another region when
+    # throttled; false pins them to their home region. Latency averages
+    # decay over REGION_LATENCY_DECAY_S, and an idle region gets a request
+    # every REGION_PROBE_INTERVAL_S to keep its average current
+    REGION_ROUTING_ENABLED: bool = True
+    REGION_LATENCY_DECAY_S: float = 10.0
+    REGION_PROBE_INTERVAL_S: float = 5.0
+    REGION_COOLDOWN_S: float = 5.0  # Region skipped after a throttle or failure
+    REGION_CATALOG_TTL_S: float = 60.0
+
+    # Virtual key resolution cache; unknown keys are remembered for the
+    # shorter negative TTL. With RATE_LIMIT_BACKEND=redis, key changes are
+    # pushed to every worker over RATE_LIMIT_REDIS_URL; otherwise other
+    # workers only see them once KEY_CACHE_LOCAL_TTL_S runs out
+    KEY_CACHE_TTL_S: float = 60.0
+    KEY_CACHE_LOCAL_TTL_S: float = 5.0
+    KEY_CACHE_NEGATIVE_TTL_S: float = 5.0
+    KEY_CACHE_MAX_SIZE: int = 100_000
+
+    # Per-key RPM/TPM/parallel limits: "memory" enforces them per worker
+    # process, "redis" shares them between workers, "none" turns them off
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Write-behind log ingestion: flush when INGEST_BATCH_SIZE records are
+    # queued or INGEST_FLUSH_INTERVAL_MS after the first; producers wait
+    # while INGEST_QUEUE_SIZE records are pending
+    INGEST_QUEUE_SIZE: int = 100_000
+    INGEST_BATCH_SIZE: int = 5000
+    INGEST_FLUSH_INTERVAL_MS: int = 50
+
+    # Key and budget spend is counted in memory and written this often
+    SPEND_FLUSH_INTERVAL_S: float = 5.0
+
+    # Response cache hit/miss counts are written this often
+    CACHE_STATS_FLUSH_INTERVAL_S: float = 10.0
+
+    # Prompt embedding for semantic caching: "hashing" (built in) or a
+    # "package.module:function" mapping a list of texts to unit vectors
+    SEMANTIC_CACHE_EMBEDDER: str = "hashing"
+
+    # Compiled guardrail plans are rebuilt after this long, picking up
+    # changes made through other processes
+    GUARDRAIL_PLAN_TTL_S: float = 60.0
+    # Default timeout of a during_call guardrail check
+    GUARDRAIL_TIMEOUT_MS: int = 2000
+
+    # Circuit breakers per provider and model (and region): open when
+    # CIRCUIT_FAILURE_RATE of at least CIRCUIT_MIN_REQUESTS calls in the last
+    # CIRCUIT_WINDOW_S failed, reject calls for CIRCUIT_OPEN_S, then let
+    # CIRCUIT_HALF_OPEN_PROBES through to test the upstream. Calls slower
+    # than CIRCUIT_SLOW_CALL_MS, if set, count as failures
+    CIRCUIT_BREAKERS_ENABLED: bool = True
+    CIRCUIT_WINDOW_S: int = 30
+    CIRCUIT_MIN_REQUESTS: int = 20
+    CIRCUIT_FAILURE_RATE: float = 0.5
+    CIRCUIT_OPEN_S: float = 30.0
+    CIRCUIT_HALF_OPEN_PROBES: int = 1
+    CIRCUIT_SLOW_CALL_MS: Optional[int] = None
+
+    # Models whose non-streaming requests are hedged ("*" for all): sent a
+    # second time, to the next region of their Bedrock deployment, when not
+    # answered after the model's rolling HEDGE_QUANTILE latency over the
+    # last HEDGE_WINDOW_S. Requests with no other region are not hedged. At
+    # most HEDGE_MAX_RATE of a model's requests are hedged, and none before
+    # HEDGE_MIN_SAMPLES latencies are known
+    HEDGE_MODELS: List[str] = []
+    HEDGE_QUANTILE: float = 0.9
+    HEDGE_MAX_RATE: float = 0.1
+    HEDGE_MIN_SAMPLES: int = 50
+    HEDGE_WINDOW_S: float = 60.0
+
+    # Upstream requests in flight per provider (UPSTREAM_MAX_CONNECTIONS
+    # unless set here), shared between teams by weighted fair queuing. Team
+    # weights come from SCHEDULER_TEAM_WEIGHTS (by team ID or name), else one
+    # per SCHEDULER_BUDGET_PER_WEIGHT_USD of monthly budget, at least 1.
+    # Batch requests leave SCHEDULER_INTERACTIVE_RESERVE of the slots free
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_CONCURRENCY: Dict[str, int] = {}
+    SCHEDULER_TEAM_WEIGHTS: Dict[str, float] = {}
+    SCHEDULER_BUDGET_PER_WEIGHT_USD: float = 1000.0
+    SCHEDULER_INTERACTIVE_RESERVE: float = 0.2
+    SCHEDULER_QUEUE_TIMEOUT_S: float = 30.0
+    SCHEDULER_WEIGHTS_TTL_S: float = 60.0
+    SCHEDULER_METRICS_WINDOW_S: float = 60.0
+
+    # Pooled upstream connections, per provider
+    UPSTREAM_MAX_CONNECTIONS: int = 200
+    UPSTREAM_MAX_KEEPALIVE: int = 50
+    UPSTREAM_KEEPALIVE_EXPIRY_S: float = 60.0
+    UPSTREAM_CONNECT_TIMEOUT_S: float = 5.0
+    UPSTREAM_TIMEOUT_S: float = 600.0
+    UPSTREAM_HTTP2: bool = True
 
     # CORS
     CORS_ORIGINS: list[str] = ["http://localhost:3000", "http://127.0.0.1:3000"]
@@ -1,12 +1,17 @@
 """Database module."""
-from .engine import engine, create_db_and_tables, get_session
+from .engine import engine, async_engine, create_db_and_tables, get_session, get_session_runner, run_in_session, SessionRunner
 from .models import (
     Organization,
     Team,
     User,
     APIKey,
     UsageLog,
+    UsageRollupHourly,
+    UsageRollupDaily,
+    UsageRollupState,
     Tag,
+    UsageLogTag,
+    APIKeyTag,
     Guardrail,
     GuardrailViolation,
     Budget,
@@ -19,14 +24,23 @@ from .models import (
 
 __all__ = [
     "engine",
+    "async_engine",
     "create_db_and_tables",
     "get_session",
+    "get_session_runner",
+    "run_in_session",
+    "SessionRunner",
     "Organization",
     "Team",
     "User",
     "APIKey",
     "UsageLog",
+    "UsageRollupHourly",
+    "UsageRollupDaily",
+    "UsageRollupState",
     "Tag",
+    "UsageLogTag",
+    "APIKeyTag",
     "Guardrail",
     "GuardrailViolation",
     "Budget",
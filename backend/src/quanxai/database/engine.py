@@ -1,20 +1,183 @@
 """Database engine and session management."""
+import logging
+import time
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine, make_url
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Optional, TypeVar
 
 from quanxai.config import settings
 
-# SQLite requires check_same_thread=False for FastAPI
-connect_args = {"check_same_thread": False}
-engine = create_engine(settings.DATABASE_URL, connect_args=connect_args, echo=settings.DEBUG)
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Async driver for each sync database backend
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    """The async-driver equivalent of a sync database URL."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """create_engine keyword arguments for the backend of ``url``."""
+    parsed = make_url(url)
+    options: Dict[str, Any] = {"echo": settings.SQL_ECHO}
+
+    if parsed.get_backend_name() == "sqlite":
+        # Connections are shared across the threadpool's threads
+        if parsed.get_driver_name() != "aiosqlite":
+            options["connect_args"] = {"check_same_thread": False}
+        return options
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if settings.DB_STATEMENT_TIMEOUT_MS and parsed.get_backend_name() == "postgresql":
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def _start_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    if elapsed_ms >= settings.SLOW_QUERY_MS:
+        logger.warning("Slow query (%.0f ms): %s", elapsed_ms, " ".join(statement.split()))
+
+
+def instrument_engine(sync_engine: Engine) -> None:
+    """Attach SQLite pragmas and the slow-query log to an engine."""
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+    if settings.SLOW_QUERY_MS is not None:
+        event.listen(sync_engine, "before_cursor_execute", _start_timer)
+        event.listen(sync_engine, "after_cursor_execute", _log_slow_query)
+
+
+def make_engine(url: str) -> Engine:
+    """Engine for ``url`` configured from settings."""
+    new_engine = create_engine(url, **engine_options(url))
+    instrument_engine(new_engine)
+    return new_engine
+
+
+def make_async_engine(url: str):
+    """Async engine for ``url`` configured from settings."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    new_engine = create_async_engine(url, **engine_options(url))
+    instrument_engine(new_engine.sync_engine)
+    return new_engine
+
+
+engine = make_engine(settings.DATABASE_URL)
+
+async_engine = None
+if settings.DATABASE_ASYNC:
+    async_engine = make_async_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL))
+
+
+def _add_missing_columns() -> None:
+    # Only nullable columns can be added to a table that has rows
+    existing = inspect(engine)
+    tables = set(existing.get_table_names())
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            present = {column["name"] for column in existing.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
 
 
 def create_db_and_tables():
-    """Create all database tables."""
+    """Create all database tables, and any nullable columns or indexes missing from existing ones."""
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 
 def get_session() -> Generator[Session, None, None]:
     """Dependency that provides a database session."""
     with Session(engine) as session:
         yield session
+
+
+class SessionRunner:
+    """Runs session-based code from ``async def`` endpoints.
+
+    On the async engine the function gets the sync view of an AsyncSession
+    (``run_sync``), so driver I/O never blocks the event loop; otherwise it
+    runs with a regular Session in the threadpool, as sync endpoints do.
+    """
+
+    def __init__(self, session: Optional[Session] = None, async_session: Optional[AsyncSession] = None):
+        self.session = session
+        self.async_session = async_session
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Call ``fn(session, *args, **kwargs)``."""
+        if self.async_session is not None:
+            return await self.async_session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+async def run_in_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Call ``fn(session, *args, **kwargs)`` on a new session, from async code."""
+    if async_engine is not None:
+        async with AsyncSession(async_engine) as session:
+            return await session.run_sync(fn, *args, **kwargs)
+
+    def call() -> T:
+        with Session(engine) as session:
+            return fn(session, *args, **kwargs)
+
+    return await run_in_threadpool(call)
+
+
+async def get_session_runner() -> AsyncGenerator[SessionRunner, None]:
+    """Dependency that provides a SessionRunner on the configured engine."""
+    if async_engine is not None:
+        async with AsyncSession(async_engine) as session:
+            yield SessionRunner(async_session=session)
+    else:
+        session = Session(engine)
+        try:
+            yield SessionRunner(session=session)
+        finally:
+            await run_in_threadpool(session.close)
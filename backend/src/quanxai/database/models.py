@@ -1,4 +1,5 @@
 """SQLModel database models."""
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
 from datetime import datetime
@@ -105,6 +106,9 @@ class APIKey(SQLModel, table=True):
 class UsageLog(SQLModel, table=True):
     """Usage log for every LLM API call."""
     __tablename__ = "usage_logs"
+    __table_args__ = (
+        Index("ix_usage_logs_created_at_id", "created_at", "id"),
+    )
 
     id: str = Field(default_factory=generate_uuid, primary_key=True)
     request_id: str = Field(index=True, unique=True)
@@ -130,11 +134,22 @@ class UsageLog(SQLModel, table=True):
     # Cost (USD)
     prompt_cost_usd: float = Field(default=0.0)
     completion_cost_usd: float = Field(default=0.0)
-    total_cost_usd: float = Field(default=0.0)
+    total_cost_usd: float = Field(default=0.0)  # Including hedge_cost_usd
+    # Hedged requests only: the call that answered ("primary" | "hedge") and
+    # the estimated cost of the one that was cancelled
+    hedge: Optional[str] = None
+    hedge_cost_usd: Optional[float] = None
 
     # Performance
     latency_ms: int = Field(default=0)
+    # Time spent waiting for an upstream slot, included in latency_ms
+    queue_time_ms: Optional[int] = None
     is_streaming: bool = Field(default=False)
+    # Streamed responses only: time to the first token, mean gap between
+    # tokens, and tokens per second after the first
+    time_to_first_token_ms: Optional[int] = None
+    inter_token_latency_ms: Optional[float] = None
+    output_tokens_per_second: Optional[float] = None
     is_success: bool = Field(default=True, index=True)
     error_type: Optional[str] = None
     error_message: Optional[str] = None
@@ -148,6 +163,58 @@ class UsageLog(SQLModel, table=True):
     tags: Optional[str] = None  # JSON array of tag IDs for cost allocation
 
 
+class UsageRollupBase(SQLModel):
+    """Pre-aggregated UsageLog totals for one time bucket and dimension set."""
+    bucket_start: datetime = Field(index=True)
+
+    # Dimensions (same names as UsageLog so filters apply to either)
+    organization_id: str = Field(index=True)
+    team_id: Optional[str] = Field(default=None, index=True)
+    user_id: Optional[str] = Field(default=None, index=True)
+    api_key_id: Optional[str] = Field(default=None, index=True)
+    model_used: str = Field(index=True)
+    provider: str = Field(index=True)
+
+    # Measures
+    requests: int = Field(default=0)
+    errors: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    total_tokens: int = Field(default=0)
+    cache_read_tokens: int = Field(default=0)
+    cache_creation_tokens: int = Field(default=0)
+    total_cost_usd: float = Field(default=0.0)
+    latency_sum_ms: int = Field(default=0)
+    hedged_requests: Optional[int] = Field(default=0)
+    hedge_wins: Optional[int] = Field(default=0)
+    hedge_cost_usd: Optional[float] = Field(default=0.0)
+    latency_sketch: Optional[str] = None  # JSON LatencySketch of latency_ms
+    ttft_sketch: Optional[str] = None  # JSON LatencySketch of time_to_first_token_ms
+    throughput_sketch: Optional[str] = None  # JSON LatencySketch of output_tokens_per_second
+
+
+class UsageRollupHourly(UsageRollupBase, table=True):
+    """Hourly UsageLog rollup."""
+    __tablename__ = "usage_rollups_hourly"
+
+    id: str = Field(default_factory=generate_uuid, primary_key=True)
+
+
+class UsageRollupDaily(UsageRollupBase, table=True):
+    """Daily UsageLog rollup."""
+    __tablename__ = "usage_rollups_daily"
+
+    id: str = Field(default_factory=generate_uuid, primary_key=True)
+
+
+class UsageRollupState(SQLModel, table=True):
+    """Marks rollups as complete once a backfill has run."""
+    __tablename__ = "usage_rollup_state"
+
+    id: str = Field(default="usage", primary_key=True)
+    rebuilt_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Tag(SQLModel, table=True):
     """Tag for cost allocation and routing."""
     __tablename__ = "tags"
@@ -162,6 +229,29 @@ class Tag(SQLModel, table=True):
     is_active: bool = Field(default=True)
 
 
+class UsageLogTag(SQLModel, table=True):
+    """Links a usage log to one of its tags (mirrors UsageLog.tags)."""
+    __tablename__ = "usage_log_tags"
+    __table_args__ = (
+        Index("ix_usage_log_tags_tag_id_created_at", "tag_id", "created_at"),
+    )
+
+    usage_log_id: str = Field(foreign_key="usage_logs.id", primary_key=True)
+    tag_id: str = Field(foreign_key="tags.id", primary_key=True)
+    created_at: datetime  # Copy of UsageLog.created_at for per-tag range scans
+
+
+class APIKeyTag(SQLModel, table=True):
+    """Links an API key to one of its tags (mirrors APIKey.tags)."""
+    __tablename__ = "api_key_tags"
+    __table_args__ = (
+        Index("ix_api_key_tags_tag_id_api_key_id", "tag_id", "api_key_id"),
+    )
+
+    api_key_id: str = Field(foreign_key="api_keys.id", primary_key=True)
+    tag_id: str = Field(foreign_key="tags.id", primary_key=True)
+
+
 class Guardrail(SQLModel, table=True):
     """Guardrail configuration for content moderation."""
     __tablename__ = "guardrails"
@@ -185,6 +275,9 @@ class Guardrail(SQLModel, table=True):
 class GuardrailViolation(SQLModel, table=True):
     """Log of guardrail violations/blocks."""
     __tablename__ = "guardrail_violations"
+    __table_args__ = (
+        Index("ix_guardrail_violations_created_at_id", "created_at", "id"),
+    )
 
     id: str = Field(default_factory=generate_uuid, primary_key=True)
     guardrail_id: str = Field(foreign_key="guardrails.id", index=True)
@@ -228,6 +321,9 @@ class Budget(SQLModel, table=True):
 class AuditLog(SQLModel, table=True):
     """Audit log for tracking all administrative actions."""
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("ix_audit_logs_created_at_id", "created_at", "id"),
+    )
 
     id: str = Field(default_factory=generate_uuid, primary_key=True)
 
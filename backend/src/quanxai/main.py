@@ -5,6 +5,7 @@ from contextlib import asynccontextmanager
 
 from quanxai.config import settings
 from quanxai.database import create_db_and_tables
+from quanxai.services.pagination import NEXT_CURSOR_HEADER
 from quanxai.routers import (
     organizations_router,
     teams_router,
@@ -19,7 +20,20 @@ from quanxai.routers import (
     tags_router,
     audit_router,
     cache_router,
+    proxy_router,
 )
+from quanxai.services.circuit_breakers import CircuitBreakers
+from quanxai.services.coalescing import SingleFlight
+from quanxai.services.errors import ProxyError, proxy_error_handler
+from quanxai.services.hedging import Hedger
+from quanxai.services.ingestion import IngestionQueue
+from quanxai.services.keys import KeyInvalidations, key_cache
+from quanxai.services.providers import ProviderPool
+from quanxai.services.rate_limits import make_rate_limiter
+from quanxai.services.regions import RegionRouter
+from quanxai.services.response_cache import ResponseCache
+from quanxai.services.scheduling import FairScheduler
+from quanxai.services.spend import SpendTracker
 
 
 @asynccontextmanager
@@ -28,8 +42,36 @@ async def lifespan(app: FastAPI):
     # Startup: create database tables
     create_db_and_tables()
     print("Database tables created successfully")
+    # Pooled upstream clients live for the whole app
+    app.state.providers = ProviderPool()
+    app.state.rate_limiter = make_rate_limiter()
+    # Key changes reach the other workers through the rate limiter's Redis
+    app.state.key_invalidations = None
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        app.state.key_invalidations = KeyInvalidations(key_cache, settings.RATE_LIMIT_REDIS_URL)
+        app.state.key_invalidations.start()
+    # Usage logs are written in batches by a background task
+    app.state.ingestion = IngestionQueue()
+    app.state.ingestion.start()
+    # Live spend counters for budget checks, resumed from the database
+    app.state.spend = SpendTracker()
+    await app.state.spend.start()
+    app.state.response_cache = ResponseCache()
+    app.state.response_cache.start()
+    app.state.single_flight = SingleFlight()
+    app.state.breakers = CircuitBreakers()
+    app.state.regions = RegionRouter(app.state.breakers)
+    app.state.hedger = Hedger()
+    app.state.scheduler = FairScheduler()
     yield
-    # Shutdown: cleanup if needed
+    # Shutdown: close upstream connections, flush queued logs and spend
+    await app.state.providers.aclose()
+    await app.state.rate_limiter.aclose()
+    if app.state.key_invalidations is not None:
+        await app.state.key_invalidations.aclose()
+    await app.state.ingestion.close()
+    await app.state.spend.close()
+    await app.state.response_cache.close()
 
 
 app = FastAPI(
@@ -46,6 +88,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Register routers
@@ -62,6 +105,9 @@ app.include_router(budgets_router, prefix="/api/budgets", tags=["Budgets"])
 app.include_router(tags_router, prefix="/api/tags", tags=["Tags"])
 app.include_router(audit_router, prefix="/api/audit", tags=["Audit Logs"])
 app.include_router(cache_router, prefix="/api/cache", tags=["Cache"])
+app.include_router(proxy_router, prefix="/v1", tags=["LLM Proxy"])
+
+app.add_exception_handler(ProxyError, proxy_error_handler)
 
 
 @app.get("/")
@@ -0,0 +1,143 @@
+"""Local OpenAI-compatible LLM provider for development and benchmarks.
+
+Answers ``/v1/chat/completions`` with a canned completion, streamed word
+by word (MOCK_PROVIDER_TOKEN_LATENCY_MS apart) when asked to, and
+``/v1/moderations`` by flagging a few fixed words, after
+MOCK_PROVIDER_LATENCY_MS, so the proxy can be exercised without provider
+keys. It also stands in for every Bedrock region (named by the
+x-mock-region header), adding MOCK_REGION_LATENCY_MS and throttling
+MOCK_REGION_THROTTLE_RATE of completions per region. MOCK_PROVIDER_ERROR_RATE
+of completions fail with a 500, to simulate a provider incident, and
+MOCK_PROVIDER_TAIL_RATE take MOCK_PROVIDER_TAIL_LATENCY_MS longer, to
+simulate a latency tail. The proxy serves it
+in-process by default; to run it standalone:
+
+    uvicorn quanxai.mock_provider:app --port 9000
+    MOCK_PROVIDER_URL=http://127.0.0.1:9000/v1
+"""
+import asyncio
+import json
+import random
+import time
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from quanxai.config import settings
+from quanxai.services.providers import MOCK_REGION_HEADER
+
+app = FastAPI(title="QuanXAI Mock Provider")
+
+MOCK_COMPLETION = "This is a mock response from the QuanXAI mock provider."
+
+# Moderation categories and the words that flag them
+MOCK_FLAGGED_WORDS = {
+    "violence": ("kill", "attack"),
+    "hate": ("hate",),
+    "self-harm": ("hurt myself",),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+async def stream_completion(payload: dict, prompt_tokens: int):
+    """SSE chunks of MOCK_COMPLETION, one word per chunk."""
+    completion_id = f"chatcmpl-{uuid4().hex}"
+    created = int(time.time())
+    model = payload.get("model", "mock")
+
+    def event(delta: dict, finish_reason=None, usage=None) -> bytes:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+        }
+        if usage is not None:
+            chunk["usage"] = usage
+        return b"data: " + json.dumps(chunk, separators=(",", ":")).encode() + b"\n\n"
+
+    yield event({"role": "assistant", "content": ""})
+    words = MOCK_COMPLETION.split(" ")
+    for i, word in enumerate(words):
+        if i and settings.MOCK_PROVIDER_TOKEN_LATENCY_MS:
+            await asyncio.sleep(settings.MOCK_PROVIDER_TOKEN_LATENCY_MS / 1000)
+        yield event({"content": word if i == 0 else " " + word})
+    yield event({}, finish_reason="stop")
+    if (payload.get("stream_options") or {}).get("include_usage"):
+        yield event(None, usage={
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        })
+    yield b"data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Return a fixed completion with usage counts derived from the prompt."""
+    payload = await request.json()
+    region = request.headers.get(MOCK_REGION_HEADER)
+    latency_ms = settings.MOCK_PROVIDER_LATENCY_MS + settings.MOCK_REGION_LATENCY_MS.get(region, 0)
+    if random.random() < settings.MOCK_PROVIDER_TAIL_RATE:
+        latency_ms += settings.MOCK_PROVIDER_TAIL_LATENCY_MS
+    if latency_ms:
+        await asyncio.sleep(latency_ms / 1000)
+    if random.random() < settings.MOCK_PROVIDER_ERROR_RATE:
+        return JSONResponse(
+            {"error": {"message": "The mock provider had an error", "type": "server_error"}},
+            status_code=500,
+        )
+    if random.random() < settings.MOCK_REGION_THROTTLE_RATE.get(region, 0.0):
+        return JSONResponse(
+            {"error": {"message": f"Too many requests in {region}", "type": "throttling_error"}},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+
+    prompt = " ".join(str(m.get("content", "")) for m in payload.get("messages", []))
+    prompt_tokens = estimate_tokens(prompt)
+    if payload.get("stream"):
+        return StreamingResponse(stream_completion(payload, prompt_tokens), media_type="text/event-stream")
+    completion_tokens = estimate_tokens(MOCK_COMPLETION)
+    return {
+        "id": f"chatcmpl-{uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": MOCK_COMPLETION},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.post("/v1/moderations")
+async def moderations(request: Request):
+    """Flag the categories of MOCK_FLAGGED_WORDS found in each input."""
+    payload = await request.json()
+    if settings.MOCK_PROVIDER_LATENCY_MS:
+        await asyncio.sleep(settings.MOCK_PROVIDER_LATENCY_MS / 1000)
+
+    inputs = payload.get("input", "")
+    results = []
+    for text in inputs if isinstance(inputs, list) else [inputs]:
+        text = str(text).lower()
+        categories = {name: any(w in text for w in words) for name, words in MOCK_FLAGGED_WORDS.items()}
+        results.append({
+            "flagged": any(categories.values()),
+            "categories": categories,
+            "category_scores": {name: 0.99 if hit else 0.01 for name, hit in categories.items()},
+        })
+    return {"id": f"modr-{uuid4().hex}", "model": payload.get("model", "mock-moderation"), "results": results}
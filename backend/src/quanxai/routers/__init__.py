@@ -12,6 +12,7 @@ from .budgets import router as budgets_router
 from .tags import router as tags_router
 from .audit import router as audit_router
 from .cache import router as cache_router
+from .proxy import router as proxy_router
 
 __all__ = [
     "organizations_router",
@@ -27,4 +28,5 @@ __all__ = [
     "tags_router",
     "audit_router",
     "cache_router",
+    "proxy_router",
 ]
@@ -1,11 +1,20 @@
 """Analytics endpoints for dashboard."""
 from fastapi import APIRouter, Depends, Query
-from sqlmodel import Session, select, func
+from sqlmodel import Session, select
 from typing import Optional, List
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
-from quanxai.database import get_session, UsageLog, Organization, Team, User
+from quanxai.database import get_session_runner, SessionRunner, UsageLog, Organization, Team, User
+from quanxai.services.rollups import (
+    latency_sketch,
+    latency_sketches,
+    usage_breakdown,
+    usage_series,
+    usage_totals,
+)
+from quanxai.services.sketch import LatencySketch, latency_fields, percentile_fields
+from quanxai.services.timeseries import Bucket, bucket_label
 
 router = APIRouter()
 
@@ -18,6 +27,10 @@ class KPIMetrics(BaseModel):
     avg_cost_per_request: float
     success_rate: float
     avg_latency_ms: float
+    p50_latency_ms: float
+    p90_latency_ms: float
+    p95_latency_ms: float
+    p99_latency_ms: float
 
 
 class SpendTrendPoint(BaseModel):
@@ -92,464 +105,332 @@ def get_date_range(range_str: str) -> tuple[datetime, datetime]:
     return start_date, end_date
 
 
-@router.get("/organization", response_model=OrganizationAnalytics)
-def get_organization_analytics(
-    range: str = Query("last30days"),
-    session: Session = Depends(get_session)
-):
-    """Get organization-level analytics for dashboard."""
-    start_date, end_date = get_date_range(range)
-
-    # Get KPIs
-    result = session.exec(
-        select(
-            func.count(UsageLog.id).label("total_requests"),
-            func.sum(UsageLog.total_tokens).label("total_tokens"),
-            func.sum(UsageLog.total_cost_usd).label("total_cost"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
-        )
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-    ).first()
-
-    success_count = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .where(UsageLog.is_success == True)
-    ).first() or 0
-
-    total_requests = result.total_requests or 0
-    total_cost = float(result.total_cost or 0)
-    total_tokens = result.total_tokens or 0
-    avg_latency = float(result.avg_latency or 0)
-
-    kpis = KPIMetrics(
+KPI_METRICS = ["requests", "tokens", "spend", "latency_sum", "successes"]
+
+
+def build_kpis(totals: dict, latency: LatencySketch) -> KPIMetrics:
+    """Build KPI metrics from usage totals of KPI_METRICS and a latency sketch."""
+    total_requests = totals["requests"]
+    total_cost = float(totals["spend"])
+
+    return KPIMetrics(
         total_spend=total_cost,
         total_requests=total_requests,
-        tokens_processed=total_tokens,
+        tokens_processed=totals["tokens"],
         avg_cost_per_request=total_cost / total_requests if total_requests > 0 else 0,
-        success_rate=(success_count / total_requests * 100) if total_requests > 0 else 100,
-        avg_latency_ms=avg_latency,
+        success_rate=(totals["successes"] / total_requests * 100) if total_requests > 0 else 100,
+        avg_latency_ms=totals["latency_sum"] / total_requests if total_requests > 0 else 0,
+        **latency_fields(latency),
     )
 
-    # Get spend trend by day
-    spend_trend = []
-    current_date = start_date
-    while current_date <= end_date:
-        next_date = current_date + timedelta(days=1)
-        day_result = session.exec(
-            select(
-                func.sum(UsageLog.total_cost_usd).label("spend"),
-                func.count(UsageLog.id).label("requests"),
+
+@router.get("/organization", response_model=OrganizationAnalytics)
+async def get_organization_analytics(
+    range: str = Query("last30days"),
+    bucket: Bucket = Query("day"),
+    db: SessionRunner = Depends(get_session_runner)
+):
+    """Get organization-level analytics for dashboard."""
+    def read(session: Session):
+        start_date, end_date = get_date_range(range)
+
+        # Get KPIs
+        kpis = build_kpis(
+            usage_totals(session, start_date, end_date, KPI_METRICS),
+            latency_sketch(session, start_date, end_date),
+        )
+        total_cost = kpis.total_spend
+
+        # Get spend trend per bucket
+        spend_trend = [
+            SpendTrendPoint(
+                date=bucket_label(bucket_start, bucket),
+                spend=float(values["spend"]),
+                requests=values["requests"],
             )
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < next_date)
-        ).first()
+            for bucket_start, values in usage_series(
+                session, start_date, end_date, ["spend", "requests"], bucket=bucket
+            )
+        ]
 
-        spend_trend.append(SpendTrendPoint(
-            date=current_date.strftime("%Y-%m-%d"),
-            spend=float(day_result.spend or 0),
-            requests=day_result.requests or 0,
-        ))
-        current_date = next_date
-
-    # Get cost by model
-    model_results = session.exec(
-        select(
-            UsageLog.model_used,
-            func.sum(UsageLog.total_cost_usd).label("cost"),
-            func.count(UsageLog.id).label("requests"),
+        # Get cost by model
+        model_results = usage_breakdown(
+            session, start_date, end_date, ["spend", "requests"], group_by=["model_used"]
         )
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .group_by(UsageLog.model_used)
-        .order_by(func.sum(UsageLog.total_cost_usd).desc())
-    ).all()
-
-    cost_by_model = []
-    for r in model_results:
-        cost_by_model.append(ModelCost(
-            name=r.model_used,
-            value=float(r.cost or 0),
-            percentage=(float(r.cost or 0) / total_cost * 100) if total_cost > 0 else 0,
-            requests=r.requests or 0,
-        ))
-
-    return OrganizationAnalytics(
-        kpis=kpis,
-        spend_trend=spend_trend,
-        cost_by_model=cost_by_model,
-    )
+        model_results.sort(key=lambda r: r["spend"], reverse=True)
+
+        cost_by_model = []
+        for r in model_results:
+            cost_by_model.append(ModelCost(
+                name=r["model_used"],
+                value=float(r["spend"]),
+                percentage=(float(r["spend"]) / total_cost * 100) if total_cost > 0 else 0,
+                requests=r["requests"],
+            ))
+
+        return OrganizationAnalytics(
+            kpis=kpis,
+            spend_trend=spend_trend,
+            cost_by_model=cost_by_model,
+        )
+
+    return await db.run(read)
 
 
 @router.get("/teams/{team_id}", response_model=TeamAnalytics)
-def get_team_analytics(
+async def get_team_analytics(
     team_id: str,
     range: str = Query("last7days"),
-    session: Session = Depends(get_session)
+    bucket: Bucket = Query("day"),
+    db: SessionRunner = Depends(get_session_runner)
 ):
     """Get team-level analytics."""
-    start_date, end_date = get_date_range(range)
-
-    team = session.get(Team, team_id)
-    if not team:
-        team_name = "Unknown Team"
-        budget = 5000.0
-    else:
-        team_name = team.name
-        budget = team.monthly_budget_usd
-
-    # Get KPIs for team
-    result = session.exec(
-        select(
-            func.count(UsageLog.id).label("total_requests"),
-            func.sum(UsageLog.total_tokens).label("total_tokens"),
-            func.sum(UsageLog.total_cost_usd).label("total_cost"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
-            func.sum(UsageLog.cache_read_tokens).label("cache_read"),
-            func.sum(UsageLog.cache_creation_tokens).label("cache_creation"),
+    def read(session: Session):
+        start_date, end_date = get_date_range(range)
+
+        team = session.get(Team, team_id)
+        if not team:
+            team_name = "Unknown Team"
+            budget = 5000.0
+        else:
+            team_name = team.name
+            budget = team.monthly_budget_usd
+
+        # Get KPIs for team, per member so active members come from the same query
+        by_member = usage_breakdown(
+            session, start_date, end_date, KPI_METRICS, group_by=["user_id"], filters={"team_id": team_id}
+        )
+        totals = {name: sum(r[name] for r in by_member) for name in KPI_METRICS}
+        active_members = sum(1 for r in by_member if r["user_id"] is not None)
+
+        kpis = build_kpis(totals, latency_sketch(session, start_date, end_date, filters={"team_id": team_id}))
+        total_cost = kpis.total_spend
+        total_tokens = kpis.tokens_processed
+
+        # Daily spend and cache metrics over time, from one grouped query
+        series = usage_series(
+            session,
+            start_date,
+            end_date,
+            ["spend", "requests", "cache_read", "cache_creation"],
+            bucket=bucket,
+            filters={"team_id": team_id},
         )
-        .where(UsageLog.team_id == team_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-    ).first()
-
-    success_count = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.team_id == team_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .where(UsageLog.is_success == True)
-    ).first() or 0
-
-    active_members = session.exec(
-        select(func.count(func.distinct(UsageLog.user_id)))
-        .where(UsageLog.team_id == team_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-    ).first() or 0
-
-    total_requests = result.total_requests or 0
-    total_cost = float(result.total_cost or 0)
-    total_tokens = result.total_tokens or 0
-    avg_latency = float(result.avg_latency or 0)
-    cache_read = result.cache_read or 0
-    cache_creation = result.cache_creation or 0
-
-    kpis = KPIMetrics(
-        total_spend=total_cost,
-        total_requests=total_requests,
-        tokens_processed=total_tokens,
-        avg_cost_per_request=total_cost / total_requests if total_requests > 0 else 0,
-        success_rate=(success_count / total_requests * 100) if total_requests > 0 else 100,
-        avg_latency_ms=avg_latency,
-    )
-
-    # Daily spend
-    daily_spend = []
-    current_date = start_date
-    while current_date <= end_date:
-        next_date = current_date + timedelta(days=1)
-        day_result = session.exec(
-            select(
-                func.sum(UsageLog.total_cost_usd).label("spend"),
-                func.count(UsageLog.id).label("requests"),
-            )
-            .where(UsageLog.team_id == team_id)
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < next_date)
-        ).first()
 
-        daily_spend.append(SpendTrendPoint(
-            date=current_date.strftime("%Y-%m-%d"),
-            spend=float(day_result.spend or 0),
-            requests=day_result.requests or 0,
-        ))
-        current_date = next_date
-
-    # Cache metrics over time
-    cache_metrics = []
-    current_date = start_date
-    while current_date <= end_date:
-        next_date = current_date + timedelta(days=1)
-        cache_result = session.exec(
-            select(
-                func.sum(UsageLog.cache_read_tokens).label("cache_read"),
-                func.sum(UsageLog.cache_creation_tokens).label("cache_creation"),
-            )
-            .where(UsageLog.team_id == team_id)
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < next_date)
-        ).first()
+        daily_spend = []
+        cache_metrics = []
+        for bucket_start, values in series:
+            date = bucket_label(bucket_start, bucket)
+            daily_spend.append(SpendTrendPoint(
+                date=date,
+                spend=float(values["spend"]),
+                requests=values["requests"],
+            ))
+            cache_metrics.append({
+                "date": date,
+                "cache_read": values["cache_read"],
+                "cache_creation": values["cache_creation"],
+            })
+
+        token_efficiency = total_tokens / total_cost if total_cost > 0 else 0
+
+        return TeamAnalytics(
+            team_id=team_id,
+            team_name=team_name,
+            kpis=kpis,
+            budget=budget,
+            budget_used_percentage=(total_cost / budget * 100) if budget > 0 else 0,
+            active_members=active_members,
+            token_efficiency=token_efficiency,
+            daily_spend=daily_spend,
+            cache_metrics=cache_metrics,
+        )
 
-        cache_metrics.append({
-            "date": current_date.strftime("%Y-%m-%d"),
-            "cache_read": cache_result.cache_read or 0,
-            "cache_creation": cache_result.cache_creation or 0,
-        })
-        current_date = next_date
-
-    token_efficiency = total_tokens / total_cost if total_cost > 0 else 0
-
-    return TeamAnalytics(
-        team_id=team_id,
-        team_name=team_name,
-        kpis=kpis,
-        budget=budget,
-        budget_used_percentage=(total_cost / budget * 100) if budget > 0 else 0,
-        active_members=active_members,
-        token_efficiency=token_efficiency,
-        daily_spend=daily_spend,
-        cache_metrics=cache_metrics,
-    )
+    return await db.run(read)
 
 
 @router.get("/models/{model_id}")
-def get_model_analytics(
+async def get_model_analytics(
     model_id: str,
     range: str = Query("last30days"),
-    session: Session = Depends(get_session)
+    bucket: Bucket = Query("day"),
+    db: SessionRunner = Depends(get_session_runner)
 ):
-    """Get model-level analytics."""
-    start_date, end_date = get_date_range(range)
-
-    # Get KPIs for model
-    result = session.exec(
-        select(
-            func.count(UsageLog.id).label("total_requests"),
-            func.sum(UsageLog.total_tokens).label("total_tokens"),
-            func.sum(UsageLog.total_cost_usd).label("total_cost"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
-            func.sum(UsageLog.cache_read_tokens).label("cache_read"),
+    """Get model-level analytics.
+
+    ``streaming`` has time-to-first-token and output throughput percentiles
+    of the model's streamed requests, ``hedging`` how many requests were
+    hedged, how many the hedge answered and what the hedges cost.
+    """
+    def read(session: Session):
+        start_date, end_date = get_date_range(range)
+
+        # Get KPIs for model
+        totals = usage_totals(
+            session,
+            start_date,
+            end_date,
+            KPI_METRICS + ["cache_read", "hedged", "hedge_wins", "hedge_spend"],
+            filters={"model_used": model_id},
         )
-        .where(UsageLog.model_used == model_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-    ).first()
-
-    success_count = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.model_used == model_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .where(UsageLog.is_success == True)
-    ).first() or 0
-
-    failed_count = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.model_used == model_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .where(UsageLog.is_success == False)
-    ).first() or 0
-
-    total_requests = result.total_requests or 0
-    total_cost = float(result.total_cost or 0)
-    total_tokens = result.total_tokens or 0
-    avg_latency = float(result.avg_latency or 0)
-    cache_read = result.cache_read or 0
-
-    # Get provider
-    provider_result = session.exec(
-        select(UsageLog.provider)
-        .where(UsageLog.model_used == model_id)
-        .limit(1)
-    ).first()
-
-    # Success vs failed over time
-    success_vs_failed = []
-    current_date = start_date
-    while current_date <= end_date:
-        next_date = current_date + timedelta(days=1)
-        success = session.exec(
-            select(func.count(UsageLog.id))
-            .where(UsageLog.model_used == model_id)
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < next_date)
-            .where(UsageLog.is_success == True)
-        ).first() or 0
+        kpis = build_kpis(totals, latency_sketch(session, start_date, end_date, filters={"model_used": model_id}))
+        ttft = latency_sketch(session, start_date, end_date, filters={"model_used": model_id}, measure="ttft")
+        throughput = latency_sketch(
+            session, start_date, end_date, filters={"model_used": model_id}, measure="throughput"
+        )
+        total_tokens = kpis.tokens_processed
+        cache_read = totals["cache_read"]
 
-        failed = session.exec(
-            select(func.count(UsageLog.id))
+        # Get provider
+        provider_result = session.exec(
+            select(UsageLog.provider)
             .where(UsageLog.model_used == model_id)
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < next_date)
-            .where(UsageLog.is_success == False)
-        ).first() or 0
-
-        success_vs_failed.append({
-            "date": current_date.strftime("%Y-%m-%d"),
-            "success": success,
-            "failed": failed,
-        })
-        current_date = next_date
-
-    # Requests per day
-    requests_per_day = []
-    current_date = start_date
-    while current_date <= end_date:
-        next_date = current_date + timedelta(days=1)
-        day_result = session.exec(
-            select(
-                func.sum(UsageLog.total_cost_usd).label("spend"),
-                func.count(UsageLog.id).label("requests"),
-            )
-            .where(UsageLog.model_used == model_id)
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < next_date)
+            .limit(1)
         ).first()
 
-        requests_per_day.append({
-            "date": current_date.strftime("%Y-%m-%d"),
-            "spend": float(day_result.spend or 0),
-            "requests": day_result.requests or 0,
-        })
-        current_date = next_date
-
-    cache_hit_rate = (cache_read / total_tokens * 100) if total_tokens > 0 else 0
-
-    return {
-        "model_id": model_id,
-        "model_name": model_id,
-        "provider": provider_result or "unknown",
-        "kpis": {
-            "total_spend": total_cost,
-            "total_requests": total_requests,
-            "tokens_processed": total_tokens,
-            "avg_cost_per_request": total_cost / total_requests if total_requests > 0 else 0,
-            "success_rate": (success_count / total_requests * 100) if total_requests > 0 else 100,
-            "avg_latency_ms": avg_latency,
-        },
-        "cache_hit_rate": cache_hit_rate,
-        "success_vs_failed": success_vs_failed,
-        "requests_per_day": requests_per_day,
-    }
+        # Success vs failed and requests over time, from one grouped query
+        series = usage_series(
+            session,
+            start_date,
+            end_date,
+            ["successes", "errors", "spend", "requests"],
+            bucket=bucket,
+            filters={"model_used": model_id},
+        )
+
+        success_vs_failed = []
+        requests_per_day = []
+        for bucket_start, values in series:
+            date = bucket_label(bucket_start, bucket)
+            success_vs_failed.append({
+                "date": date,
+                "success": values["successes"],
+                "failed": values["errors"],
+            })
+            requests_per_day.append({
+                "date": date,
+                "spend": float(values["spend"]),
+                "requests": values["requests"],
+            })
+
+        cache_hit_rate = (cache_read / total_tokens * 100) if total_tokens > 0 else 0
+
+        return {
+            "model_id": model_id,
+            "model_name": model_id,
+            "provider": provider_result or "unknown",
+            "kpis": kpis.model_dump(),
+            "cache_hit_rate": cache_hit_rate,
+            "streaming": {
+                "requests": ttft.count,
+                **percentile_fields(ttft, "ttft_ms"),
+                **percentile_fields(throughput, "output_tokens_per_second"),
+            },
+            "hedging": {
+                "requests": totals["hedged"],
+                "hedge_wins": totals["hedge_wins"],
+                "spend": float(totals["hedge_spend"]),
+            },
+            "success_vs_failed": success_vs_failed,
+            "requests_per_day": requests_per_day,
+        }
+
+    return await db.run(read)
 
 
 @router.get("/users/{user_id}")
-def get_user_analytics(
+async def get_user_analytics(
     user_id: str,
     range: str = Query("last30days"),
-    session: Session = Depends(get_session)
+    bucket: Bucket = Query("week"),
+    db: SessionRunner = Depends(get_session_runner)
 ):
     """Get user-level analytics."""
-    start_date, end_date = get_date_range(range)
-
-    user = session.get(User, user_id)
-    if user:
-        user_name = user.name
-        email = user.email
-        role = user.role or "Developer"
-        team = session.get(Team, user.team_id)
-        team_name = team.name if team else "Unknown"
-    else:
-        user_name = "Unknown User"
-        email = "unknown@example.com"
-        role = "Developer"
-        team_name = "Unknown"
-
-    # Get KPIs for user
-    result = session.exec(
-        select(
-            func.count(UsageLog.id).label("total_requests"),
-            func.sum(UsageLog.total_tokens).label("total_tokens"),
-            func.sum(UsageLog.total_cost_usd).label("total_cost"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
-            func.sum(UsageLog.cache_read_tokens).label("cache_read"),
+    def read(session: Session):
+        start_date, end_date = get_date_range(range)
+
+        user = session.get(User, user_id)
+        if user:
+            user_name = user.name
+            email = user.email
+            role = user.role or "Developer"
+            team = session.get(Team, user.team_id)
+            team_name = team.name if team else "Unknown"
+        else:
+            user_name = "Unknown User"
+            email = "unknown@example.com"
+            role = "Developer"
+            team_name = "Unknown"
+
+        # Get KPIs for user
+        totals = usage_totals(
+            session, start_date, end_date, KPI_METRICS + ["cache_read"], filters={"user_id": user_id}
         )
-        .where(UsageLog.user_id == user_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-    ).first()
-
-    success_count = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.user_id == user_id)
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .where(UsageLog.is_success == True)
-    ).first() or 0
-
-    total_requests = result.total_requests or 0
-    total_cost = float(result.total_cost or 0)
-    total_tokens = result.total_tokens or 0
-    avg_latency = float(result.avg_latency or 0)
-    cache_read = result.cache_read or 0
-
-    cache_hit_rate = (cache_read / total_tokens * 100) if total_tokens > 0 else 0
-
-    # Activity by week
-    activity_timeline = []
-    current_date = start_date
-    while current_date <= end_date:
-        week_end = current_date + timedelta(days=7)
-        week_result = session.exec(
-            select(func.count(UsageLog.id))
-            .where(UsageLog.user_id == user_id)
-            .where(UsageLog.created_at >= current_date)
-            .where(UsageLog.created_at < week_end)
-        ).first() or 0
-
-        activity_timeline.append({
-            "week_start": current_date.strftime("%Y-%m-%d"),
-            "requests": week_result,
-        })
-        current_date = week_end
-
-    return {
-        "user_id": user_id,
-        "user_name": user_name,
-        "email": email,
-        "role": role,
-        "team_name": team_name,
-        "kpis": {
-            "total_spend": total_cost,
-            "total_requests": total_requests,
-            "tokens_processed": total_tokens,
-            "avg_cost_per_request": total_cost / total_requests if total_requests > 0 else 0,
-            "success_rate": (success_count / total_requests * 100) if total_requests > 0 else 100,
-            "avg_latency_ms": avg_latency,
-        },
-        "cache_hit_rate": cache_hit_rate,
-        "activity_timeline": activity_timeline,
-    }
+        kpis = build_kpis(totals, latency_sketch(session, start_date, end_date, filters={"user_id": user_id}))
+        total_tokens = kpis.tokens_processed
+        cache_read = totals["cache_read"]
+
+        cache_hit_rate = (cache_read / total_tokens * 100) if total_tokens > 0 else 0
+
+        # Activity per bucket (weekly by default)
+        activity_timeline = [
+            {
+                "week_start": bucket_label(bucket_start, bucket),
+                "requests": values["requests"],
+            }
+            for bucket_start, values in usage_series(
+                session, start_date, end_date, ["requests"], bucket=bucket, filters={"user_id": user_id}
+            )
+        ]
+
+        return {
+            "user_id": user_id,
+            "user_name": user_name,
+            "email": email,
+            "role": role,
+            "team_name": team_name,
+            "kpis": kpis.model_dump(),
+            "cache_hit_rate": cache_hit_rate,
+            "activity_timeline": activity_timeline,
+        }
+
+    return await db.run(read)
 
 
 @router.get("/models")
-def list_models_analytics(
+async def list_models_analytics(
     range: str = Query("last30days"),
-    session: Session = Depends(get_session)
+    db: SessionRunner = Depends(get_session_runner)
 ):
     """List all models with their analytics."""
-    start_date, end_date = get_date_range(range)
-
-    model_results = session.exec(
-        select(
-            UsageLog.model_used,
-            UsageLog.provider,
-            func.sum(UsageLog.total_cost_usd).label("cost"),
-            func.count(UsageLog.id).label("requests"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
+    def read(session: Session):
+        start_date, end_date = get_date_range(range)
+
+        model_results = usage_breakdown(
+            session,
+            start_date,
+            end_date,
+            ["spend", "requests", "latency_sum"],
+            group_by=["model_used", "provider"],
         )
-        .where(UsageLog.created_at >= start_date)
-        .where(UsageLog.created_at <= end_date)
-        .group_by(UsageLog.model_used, UsageLog.provider)
-        .order_by(func.sum(UsageLog.total_cost_usd).desc())
-    ).all()
-
-    total_cost = sum(float(r.cost or 0) for r in model_results)
-
-    models = []
-    for r in model_results:
-        models.append({
-            "id": r.model_used,
-            "name": r.model_used,
-            "provider": r.provider,
-            "total_spend": float(r.cost or 0),
-            "percentage": (float(r.cost or 0) / total_cost * 100) if total_cost > 0 else 0,
-            "requests": r.requests or 0,
-            "avg_latency_ms": float(r.avg_latency or 0),
-        })
-
-    return models
+        model_results.sort(key=lambda r: r["spend"], reverse=True)
+        latency_by_model = latency_sketches(session, start_date, end_date, group_by=["model_used", "provider"])
+
+        total_cost = sum(float(r["spend"]) for r in model_results)
+
+        models = []
+        for r in model_results:
+            models.append({
+                "id": r["model_used"],
+                "name": r["model_used"],
+                "provider": r["provider"],
+                "total_spend": float(r["spend"]),
+                "percentage": (float(r["spend"]) / total_cost * 100) if total_cost > 0 else 0,
+                "requests": r["requests"],
+                "avg_latency_ms": r["latency_sum"] / r["requests"] if r["requests"] > 0 else 0,
+                **latency_fields(latency_by_model.get((r["model_used"], r["provider"]))),
+            })
+
+        return models
+
+    return await db.run(read)
@@ -1,12 +1,15 @@
 """Audit Logs API endpoints."""
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlmodel import Session, select, func
-from typing import Optional, List
+from typing import Optional, List, Sequence
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 import json
 
 from quanxai.database import get_session, AuditLog
+from quanxai.services.export import ExportFormat, export_response
+from quanxai.services.pagination import NEXT_CURSOR_HEADER, paginate
+from quanxai.services.timeseries import Bucket, bucket_label, time_series
 
 router = APIRouter()
 
@@ -55,22 +58,17 @@ class AuditMetrics(BaseModel):
     most_common_action: str
 
 
-@router.get("/", response_model=List[AuditLogResponse])
-def list_audit_logs(
-    organization_id: Optional[str] = Query(None),
-    actor_id: Optional[str] = Query(None),
-    action: Optional[str] = Query(None),
-    entity_type: Optional[str] = Query(None),
-    entity_id: Optional[str] = Query(None),
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None),
-    limit: int = Query(50, le=500),
-    offset: int = Query(0),
-    session: Session = Depends(get_session)
+def _filter_audit_logs(
+    query,
+    organization_id: Optional[str],
+    actor_id: Optional[str],
+    action: Optional[str],
+    entity_type: Optional[str],
+    entity_id: Optional[str],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
 ):
-    """List audit log entries with filters."""
-    query = select(AuditLog)
-
+    """Apply the list/export filters to an AuditLog query."""
     if organization_id:
         query = query.where(AuditLog.organization_id == organization_id)
     if actor_id:
@@ -85,31 +83,83 @@ def list_audit_logs(
         query = query.where(AuditLog.created_at >= start_date)
     if end_date:
         query = query.where(AuditLog.created_at <= end_date)
+    return query
+
 
-    query = query.order_by(AuditLog.created_at.desc()).offset(offset).limit(limit)
-    logs = session.exec(query).all()
-
-    result = []
-    for log in logs:
-        result.append(AuditLogResponse(
-            id=log.id,
-            actor_id=log.actor_id,
-            actor_type=log.actor_type,
-            actor_email=log.actor_email,
-            action=log.action,
-            entity_type=log.entity_type,
-            entity_id=log.entity_id,
-            entity_name=log.entity_name,
-            old_value=json.loads(log.old_value) if log.old_value else None,
-            new_value=json.loads(log.new_value) if log.new_value else None,
-            details=json.loads(log.details) if log.details else None,
-            ip_address=log.ip_address,
-            user_agent=log.user_agent,
-            organization_id=log.organization_id,
-            created_at=log.created_at,
-        ))
-
-    return result
+def _audit_rows(session: Session, logs: Sequence[AuditLog]) -> List[dict]:
+    """AuditLogResponse fields for a batch of audit logs."""
+    return [
+        {
+            "id": log.id,
+            "actor_id": log.actor_id,
+            "actor_type": log.actor_type,
+            "actor_email": log.actor_email,
+            "action": log.action,
+            "entity_type": log.entity_type,
+            "entity_id": log.entity_id,
+            "entity_name": log.entity_name,
+            "old_value": json.loads(log.old_value) if log.old_value else None,
+            "new_value": json.loads(log.new_value) if log.new_value else None,
+            "details": json.loads(log.details) if log.details else None,
+            "ip_address": log.ip_address,
+            "user_agent": log.user_agent,
+            "organization_id": log.organization_id,
+            "created_at": log.created_at,
+        }
+        for log in logs
+    ]
+
+
+@router.get("/", response_model=List[AuditLogResponse])
+def list_audit_logs(
+    response: Response,
+    organization_id: Optional[str] = Query(None),
+    actor_id: Optional[str] = Query(None),
+    action: Optional[str] = Query(None),
+    entity_type: Optional[str] = Query(None),
+    entity_id: Optional[str] = Query(None),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    limit: int = Query(50, le=500),
+    offset: int = Query(0),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header; takes precedence over offset"),
+    session: Session = Depends(get_session)
+):
+    """List audit log entries with filters, newest first.
+
+    The next page's cursor is returned in the X-Next-Cursor header.
+    """
+    query = _filter_audit_logs(
+        select(AuditLog), organization_id, actor_id, action, entity_type, entity_id, start_date, end_date
+    )
+
+    try:
+        logs, next_cursor = paginate(session, query, AuditLog, limit, offset, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return [AuditLogResponse(**row) for row in _audit_rows(session, logs)]
+
+
+@router.get("/export")
+def export_audit_logs(
+    format: ExportFormat = Query(ExportFormat.ndjson),
+    organization_id: Optional[str] = Query(None),
+    actor_id: Optional[str] = Query(None),
+    action: Optional[str] = Query(None),
+    entity_type: Optional[str] = Query(None),
+    entity_id: Optional[str] = Query(None),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+):
+    """Stream every matching audit log entry, oldest first."""
+    query = _filter_audit_logs(
+        select(AuditLog), organization_id, actor_id, action, entity_type, entity_id, start_date, end_date
+    )
+    query = query.order_by(AuditLog.created_at, AuditLog.id)
+    return export_response(query, _audit_rows, AuditLogResponse, format, "audit_logs")
 
 
 @router.get("/metrics", response_model=AuditMetrics)
@@ -274,32 +324,26 @@ def get_logs_by_actor(
 @router.get("/timeline")
 def get_audit_timeline(
     range: str = Query("last30days"),
+    bucket: Bucket = Query("day"),
     session: Session = Depends(get_session)
 ):
     """Get audit events over time."""
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
 
-    result = []
-    current_date = start_date.date()
-
-    while current_date <= end_date.date():
-        next_date = current_date + timedelta(days=1)
-
-        day_count = session.exec(
-            select(func.count(AuditLog.id))
-            .where(AuditLog.created_at >= datetime.combine(current_date, datetime.min.time()))
-            .where(AuditLog.created_at < datetime.combine(next_date, datetime.min.time()))
-        ).first() or 0
-
-        result.append({
-            "date": current_date.isoformat(),
-            "events": day_count,
-        })
-
-        current_date = next_date
+    series = time_series(
+        session,
+        AuditLog.created_at,
+        {"events": func.count(AuditLog.id)},
+        start_date,
+        end_date,
+        bucket=bucket,
+    )
 
-    return result
+    return [
+        {"date": bucket_label(bucket_start, bucket), "events": values["events"]}
+        for bucket_start, values in series
+    ]
 
 
 @router.get("/{log_id}", response_model=AuditLogResponse)
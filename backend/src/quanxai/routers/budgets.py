@@ -1,12 +1,16 @@
 """Budget Management API endpoints."""
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select, func
-from typing import Optional, List
+from sqlmodel import Session, select
+from typing import Optional, List, Dict
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 import json
 
 from quanxai.database import get_session, Budget, Team, User, APIKey
+from quanxai.services.hydration import load_values
+from quanxai.services.rollups import usage_series
+from quanxai.services.spend import get_reset_date
+from quanxai.services.timeseries import Bucket, bucket_label
 
 router = APIRouter()
 
@@ -93,6 +97,26 @@ def get_entity_name(entity_type: str, entity_id: str, session: Session) -> str:
         return "Organization"
 
 
+ENTITY_NAME_COLUMNS = {
+    "team": (Team.name, "Unknown Team"),
+    "user": (User.name, "Unknown User"),
+    "key": (APIKey.alias, "Unknown Key"),
+}
+
+
+def get_entity_names(budgets: List[Budget], session: Session) -> Dict[str, str]:
+    """Entity names for many budgets keyed by budget ID, one query per entity type."""
+    names = {b.id: "Organization" for b in budgets}
+    for entity_type, (column, unknown) in ENTITY_NAME_COLUMNS.items():
+        typed = [b for b in budgets if b.entity_type == entity_type]
+        if not typed:
+            continue
+        found = load_values(session, column, (b.entity_id for b in typed))
+        for b in typed:
+            names[b.id] = found[b.entity_id] if b.entity_id in found else unknown
+    return names
+
+
 def get_budget_status(spent: float, max_budget: float, threshold: float) -> tuple[str, List[str]]:
     """Calculate budget status and triggered alerts."""
     percent_used = (spent / max_budget * 100) if max_budget > 0 else 0
@@ -115,24 +139,6 @@ def get_budget_status(spent: float, max_budget: float, threshold: float) -> tupl
     return status, alerts
 
 
-def get_reset_date(period: str, period_start: datetime) -> Optional[datetime]:
-    """Calculate next reset date based on period."""
-    if period == "daily":
-        return period_start + timedelta(days=1)
-    elif period == "weekly":
-        return period_start + timedelta(weeks=1)
-    elif period == "monthly":
-        # Add roughly one month
-        next_month = period_start.month + 1
-        year = period_start.year
-        if next_month > 12:
-            next_month = 1
-            year += 1
-        return period_start.replace(year=year, month=next_month)
-    else:  # total - no reset
-        return None
-
-
 @router.get("/", response_model=List[BudgetResponse])
 def list_budgets(
     organization_id: Optional[str] = Query(None),
@@ -150,10 +156,11 @@ def list_budgets(
 
     query = query.order_by(Budget.created_at.desc())
     budgets = session.exec(query).all()
+    entity_names = get_entity_names(budgets, session)
 
     result = []
     for b in budgets:
-        entity_name = get_entity_name(b.entity_type, b.entity_id, session)
+        entity_name = entity_names[b.id]
         budget_status, alerts = get_budget_status(b.spent_usd, b.max_budget_usd, b.alert_threshold)
 
         if status and budget_status != status:
@@ -273,11 +280,12 @@ def list_budget_alerts(
 ):
     """List budget alerts."""
     budgets = session.exec(select(Budget).where(Budget.is_active == True)).all()
+    entity_names = get_entity_names(budgets, session)
 
     alerts = []
     for b in budgets:
         status, triggered = get_budget_status(b.spent_usd, b.max_budget_usd, b.alert_threshold)
-        entity_name = get_entity_name(b.entity_type, b.entity_id, session)
+        entity_name = entity_names[b.id]
         percent_used = (b.spent_usd / b.max_budget_usd * 100) if b.max_budget_usd > 0 else 0
 
         for threshold in triggered:
@@ -335,34 +343,20 @@ def get_budgets_by_entity_type(session: Session = Depends(get_session)):
 @router.get("/trend")
 def get_budget_trend(
     range: str = Query("last30days"),
+    bucket: Bucket = Query("day"),
     session: Session = Depends(get_session)
 ):
     """Get budget spend trend over time."""
-    from quanxai.database import UsageLog
-
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
 
-    result = []
-    current_date = start_date.date()
-
-    while current_date <= end_date.date():
-        next_date = current_date + timedelta(days=1)
-
-        day_spend = session.exec(
-            select(func.sum(UsageLog.total_cost_usd))
-            .where(UsageLog.created_at >= datetime.combine(current_date, datetime.min.time()))
-            .where(UsageLog.created_at < datetime.combine(next_date, datetime.min.time()))
-        ).first() or 0
-
-        result.append({
-            "date": current_date.isoformat(),
-            "daily_spend": float(day_spend),
-        })
-
-        current_date = next_date
-
-    return result
+    return [
+        {
+            "date": bucket_label(bucket_start, bucket),
+            "daily_spend": float(values["spend"]),
+        }
+        for bucket_start, values in usage_series(session, start_date, end_date, ["spend"], bucket=bucket)
+    ]
 
 
 @router.get("/{budget_id}", response_model=BudgetResponse)
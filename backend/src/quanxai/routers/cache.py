@@ -1,25 +1,17 @@
 """Cache Metrics API endpoints."""
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlmodel import Session, select, func
 from typing import Optional, List
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from quanxai.database import get_session, CacheEntry, CacheMetrics as CacheMetricsModel, UsageLog
+from quanxai.services.response_cache import EVICTION_POLICIES, CacheConfig, ResponseCache
+from quanxai.services.timeseries import Bucket, bucket_label, time_series
 
 router = APIRouter()
 
 
-class CacheConfig(BaseModel):
-    """Cache configuration."""
-    enabled: bool = True
-    default_ttl: int = 3600
-    max_cache_size: int = 1073741824  # 1GB
-    eviction_policy: str = "lru"
-    semantic_caching: bool = True
-    similarity_threshold: float = 0.95
-
-
 class CacheMetricsResponse(BaseModel):
     """Cache metrics response."""
     hit_rate: float
@@ -66,26 +58,25 @@ class TopCachedPrompt(BaseModel):
     last_hit: Optional[datetime]
 
 
-# In-memory cache config (would be stored in database in production)
-_cache_config = CacheConfig()
-
-
 @router.get("/config", response_model=CacheConfig)
-def get_cache_config():
+def get_cache_config(request: Request):
     """Get current cache configuration."""
-    return _cache_config
+    return request.app.state.response_cache.config
 
 
 @router.put("/config", response_model=CacheConfig)
-def update_cache_config(config: CacheConfig):
+def update_cache_config(config: CacheConfig, request: Request):
     """Update cache configuration."""
-    global _cache_config
-    _cache_config = config
-    return _cache_config
+    if config.eviction_policy not in EVICTION_POLICIES:
+        raise HTTPException(status_code=400, detail=f"Unknown eviction policy '{config.eviction_policy}'")
+    cache: ResponseCache = request.app.state.response_cache
+    cache.configure(config)
+    return cache.config
 
 
 @router.get("/metrics", response_model=CacheMetricsResponse)
 def get_cache_metrics(
+    request: Request,
     range: str = Query("last30days"),
     session: Session = Depends(get_session)
 ):
@@ -145,7 +136,7 @@ def get_cache_metrics(
         total_tokens_saved=tokens_saved,
         total_cost_saved=cost_saved,
         cache_size=cache_size_bytes,
-        max_cache_size=_cache_config.max_cache_size,
+        max_cache_size=request.app.state.response_cache.config.max_cache_size,
         entries_count=entries_count,
     )
 
@@ -240,36 +231,33 @@ def get_cache_by_model(session: Session = Depends(get_session)):
 @router.get("/daily-savings", response_model=List[DailyCacheSavings])
 def get_daily_cache_savings(
     range: str = Query("last30days"),
+    bucket: Bucket = Query("day"),
     session: Session = Depends(get_session)
 ):
     """Get daily cache savings."""
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
 
-    result = []
-    current_date = start_date.date()
-
-    while current_date <= end_date.date():
-        next_date = current_date + timedelta(days=1)
-
-        day_metrics = session.exec(
-            select(CacheMetricsModel)
-            .where(CacheMetricsModel.date >= datetime.combine(current_date, datetime.min.time()))
-            .where(CacheMetricsModel.date < datetime.combine(next_date, datetime.min.time()))
-        ).all()
-
-        cost_saved = sum(m.cost_saved_usd for m in day_metrics) if day_metrics else 0
-        tokens_saved = sum(m.tokens_saved for m in day_metrics) if day_metrics else 0
-
-        result.append(DailyCacheSavings(
-            date=current_date.isoformat(),
-            cost_saved=cost_saved,
-            tokens_saved=tokens_saved,
-        ))
-
-        current_date = next_date
+    series = time_series(
+        session,
+        CacheMetricsModel.date,
+        {
+            "cost_saved": func.sum(CacheMetricsModel.cost_saved_usd),
+            "tokens_saved": func.sum(CacheMetricsModel.tokens_saved),
+        },
+        start_date,
+        end_date,
+        bucket=bucket,
+    )
 
-    return result
+    return [
+        DailyCacheSavings(
+            date=bucket_label(bucket_start, bucket),
+            cost_saved=values["cost_saved"],
+            tokens_saved=values["tokens_saved"],
+        )
+        for bucket_start, values in series
+    ]
 
 
 @router.get("/top-prompts", response_model=List[TopCachedPrompt])
@@ -299,16 +287,11 @@ def get_top_cached_prompts(
 
 
 @router.get("/utilization")
-def get_cache_utilization(session: Session = Depends(get_session)):
+def get_cache_utilization(request: Request):
     """Get cache utilization stats."""
-    # Calculate total cached tokens
-    total_cached = session.exec(
-        select(func.sum(CacheEntry.tokens_cached))
-    ).first() or 0
-
-    # Estimate size (4 bytes per token)
-    used_bytes = (total_cached or 0) * 4
-    max_bytes = _cache_config.max_cache_size
+    cache: ResponseCache = request.app.state.response_cache
+    used_bytes = cache.size
+    max_bytes = cache.config.max_cache_size
     available_bytes = max_bytes - used_bytes
 
     percent_used = (used_bytes / max_bytes * 100) if max_bytes > 0 else 0
@@ -318,12 +301,14 @@ def get_cache_utilization(session: Session = Depends(get_session)):
         "available": available_bytes,
         "total": max_bytes,
         "percent_used": percent_used,
+        "entries": cache.entries_count,
     }
 
 
 @router.delete("/clear")
-def clear_cache(session: Session = Depends(get_session)):
+def clear_cache(request: Request, session: Session = Depends(get_session)):
     """Clear all cache entries."""
+    request.app.state.response_cache.clear()
     # Delete all cache entries
     entries = session.exec(select(CacheEntry)).all()
     for entry in entries:
@@ -334,13 +319,13 @@ def clear_cache(session: Session = Depends(get_session)):
 
 
 @router.delete("/entry/{entry_id}")
-def delete_cache_entry(entry_id: str, session: Session = Depends(get_session)):
+def delete_cache_entry(entry_id: str, request: Request, session: Session = Depends(get_session)):
     """Delete a specific cache entry."""
     entry = session.get(CacheEntry, entry_id)
     if not entry:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Cache entry not found")
 
+    request.app.state.response_cache.discard(entry_id)
     session.delete(entry)
     session.commit()
 
@@ -1,12 +1,18 @@
 """Guardrails API endpoints."""
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import case
 from sqlmodel import Session, select, func
-from typing import Optional, List
+from typing import Optional, List, Sequence
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 import json
 
 from quanxai.database import get_session, Guardrail, GuardrailViolation
+from quanxai.services.export import ExportFormat, export_response
+from quanxai.services.guardrails import compile_rules, guardrail_engine
+from quanxai.services.hydration import load_values
+from quanxai.services.pagination import NEXT_CURSOR_HEADER, paginate
+from quanxai.services.timeseries import Bucket, bucket_label, time_series
 
 router = APIRouter()
 
@@ -64,6 +70,14 @@ class ViolationResponse(BaseModel):
     created_at: datetime
 
 
+def _check_patterns(guardrail: Guardrail) -> None:
+    """Reject a guardrail whose patterns do not compile."""
+    try:
+        compile_rules(guardrail)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 class GuardrailMetrics(BaseModel):
     """Guardrail metrics response."""
     total_guardrails: int
@@ -93,19 +107,24 @@ def list_guardrails(
     query = query.order_by(Guardrail.name)
     guardrails = session.exec(query).all()
 
+    # Violation counts for every listed guardrail in one grouped query
+    counts = {
+        r.guardrail_id: r
+        for r in session.exec(
+            select(
+                GuardrailViolation.guardrail_id,
+                func.count(GuardrailViolation.id).label("violations"),
+                func.sum(case((GuardrailViolation.blocked == True, 1), else_=0)).label("blocked"),
+            )
+            .where(GuardrailViolation.guardrail_id.in_([g.id for g in guardrails]))
+            .group_by(GuardrailViolation.guardrail_id)
+        ).all()
+    }
+
     result = []
     for g in guardrails:
-        # Get violation counts
-        violations_count = session.exec(
-            select(func.count(GuardrailViolation.id))
-            .where(GuardrailViolation.guardrail_id == g.id)
-        ).first() or 0
-
-        blocked_count = session.exec(
-            select(func.count(GuardrailViolation.id))
-            .where(GuardrailViolation.guardrail_id == g.id)
-            .where(GuardrailViolation.blocked == True)
-        ).first() or 0
+        violations_count = counts[g.id].violations if g.id in counts else 0
+        blocked_count = (counts[g.id].blocked or 0) if g.id in counts else 0
 
         result.append(GuardrailResponse(
             id=g.id,
@@ -185,10 +204,12 @@ def create_guardrail(
         apply_to_models=json.dumps(data.apply_to_models) if data.apply_to_models else None,
         organization_id=data.organization_id,
     )
+    _check_patterns(guardrail)
 
     session.add(guardrail)
     session.commit()
     session.refresh(guardrail)
+    guardrail_engine.invalidate(guardrail.organization_id)
 
     return GuardrailResponse(
         id=guardrail.id,
@@ -207,6 +228,149 @@ def create_guardrail(
     )
 
 
+def _filter_violations(
+    query,
+    guardrail_id: Optional[str],
+    severity: Optional[str],
+    blocked: Optional[bool],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+):
+    """Apply the list/export filters to a GuardrailViolation query."""
+    if guardrail_id:
+        query = query.where(GuardrailViolation.guardrail_id == guardrail_id)
+    if severity:
+        query = query.where(GuardrailViolation.severity == severity)
+    if blocked is not None:
+        query = query.where(GuardrailViolation.blocked == blocked)
+    if start_date:
+        query = query.where(GuardrailViolation.created_at >= start_date)
+    if end_date:
+        query = query.where(GuardrailViolation.created_at <= end_date)
+    return query
+
+
+def _violation_rows(session: Session, violations: Sequence[GuardrailViolation]) -> List[dict]:
+    """ViolationResponse fields for a batch of violations."""
+    guardrail_names = load_values(session, Guardrail.name, (v.guardrail_id for v in violations))
+    return [
+        {
+            "id": v.id,
+            "guardrail_id": v.guardrail_id,
+            "guardrail_name": guardrail_names.get(v.guardrail_id, "Unknown"),
+            "request_id": v.request_id,
+            "api_key_id": v.api_key_id,
+            "violation_type": v.violation_type,
+            "severity": v.severity,
+            "blocked": v.blocked,
+            "details": json.loads(v.details),
+            "created_at": v.created_at,
+        }
+        for v in violations
+    ]
+
+
+@router.get("/violations", response_model=List[ViolationResponse])
+def list_violations(
+    response: Response,
+    guardrail_id: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    blocked: Optional[bool] = Query(None),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    limit: int = Query(50, le=500),
+    offset: int = Query(0),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header; takes precedence over offset"),
+    session: Session = Depends(get_session)
+):
+    """List guardrail violations, newest first.
+
+    The next page's cursor is returned in the X-Next-Cursor header.
+    """
+    query = _filter_violations(select(GuardrailViolation), guardrail_id, severity, blocked, start_date, end_date)
+
+    try:
+        violations, next_cursor = paginate(session, query, GuardrailViolation, limit, offset, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return [ViolationResponse(**row) for row in _violation_rows(session, violations)]
+
+
+@router.get("/violations/export")
+def export_violations(
+    format: ExportFormat = Query(ExportFormat.ndjson),
+    guardrail_id: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    blocked: Optional[bool] = Query(None),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+):
+    """Stream every matching guardrail violation, oldest first."""
+    query = _filter_violations(select(GuardrailViolation), guardrail_id, severity, blocked, start_date, end_date)
+    query = query.order_by(GuardrailViolation.created_at, GuardrailViolation.id)
+    return export_response(query, _violation_rows, ViolationResponse, format, "guardrail_violations")
+
+
+@router.get("/violations/by-type")
+def get_violations_by_type(
+    range: str = Query("last30days"),
+    session: Session = Depends(get_session)
+):
+    """Get violations grouped by type."""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
+
+    results = session.exec(
+        select(
+            GuardrailViolation.violation_type,
+            func.count(GuardrailViolation.id).label("count"),
+        )
+        .where(GuardrailViolation.created_at >= start_date)
+        .group_by(GuardrailViolation.violation_type)
+        .order_by(func.count(GuardrailViolation.id).desc())
+    ).all()
+
+    return [
+        {"type": r.violation_type, "count": r.count}
+        for r in results
+    ]
+
+
+@router.get("/violations/trend")
+def get_violations_trend(
+    range: str = Query("last30days"),
+    bucket: Bucket = Query("day"),
+    session: Session = Depends(get_session)
+):
+    """Get violations trend over time."""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
+
+    series = time_series(
+        session,
+        GuardrailViolation.created_at,
+        {
+            "violations": func.count(GuardrailViolation.id),
+            "blocked": func.sum(case((GuardrailViolation.blocked == True, 1), else_=0)),
+        },
+        start_date,
+        end_date,
+        bucket=bucket,
+    )
+
+    return [
+        {
+            "date": bucket_label(bucket_start, bucket),
+            "violations": values["violations"],
+            "blocked": values["blocked"],
+        }
+        for bucket_start, values in series
+    ]
+
+
 @router.get("/{guardrail_id}", response_model=GuardrailResponse)
 def get_guardrail(guardrail_id: str, session: Session = Depends(get_session)):
     """Get a specific guardrail."""
@@ -266,11 +430,14 @@ def update_guardrail(
     if data.apply_to_models is not None:
         guardrail.apply_to_models = json.dumps(data.apply_to_models)
 
+    _check_patterns(guardrail)
+
     guardrail.updated_at = datetime.utcnow()
 
     session.add(guardrail)
     session.commit()
     session.refresh(guardrail)
+    guardrail_engine.invalidate(guardrail.organization_id)
 
     return get_guardrail(guardrail_id, session)
 
@@ -282,120 +449,9 @@ def delete_guardrail(guardrail_id: str, session: Session = Depends(get_session))
     if not guardrail:
         raise HTTPException(status_code=404, detail="Guardrail not found")
 
+    organization_id = guardrail.organization_id
     session.delete(guardrail)
     session.commit()
+    guardrail_engine.invalidate(organization_id)
 
     return {"message": "Guardrail deleted successfully"}
-
-
-@router.get("/violations", response_model=List[ViolationResponse])
-def list_violations(
-    guardrail_id: Optional[str] = Query(None),
-    severity: Optional[str] = Query(None),
-    blocked: Optional[bool] = Query(None),
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None),
-    limit: int = Query(50, le=500),
-    offset: int = Query(0),
-    session: Session = Depends(get_session)
-):
-    """List guardrail violations."""
-    query = select(GuardrailViolation)
-
-    if guardrail_id:
-        query = query.where(GuardrailViolation.guardrail_id == guardrail_id)
-    if severity:
-        query = query.where(GuardrailViolation.severity == severity)
-    if blocked is not None:
-        query = query.where(GuardrailViolation.blocked == blocked)
-    if start_date:
-        query = query.where(GuardrailViolation.created_at >= start_date)
-    if end_date:
-        query = query.where(GuardrailViolation.created_at <= end_date)
-
-    query = query.order_by(GuardrailViolation.created_at.desc()).offset(offset).limit(limit)
-    violations = session.exec(query).all()
-
-    result = []
-    for v in violations:
-        guardrail = session.get(Guardrail, v.guardrail_id)
-        guardrail_name = guardrail.name if guardrail else "Unknown"
-
-        result.append(ViolationResponse(
-            id=v.id,
-            guardrail_id=v.guardrail_id,
-            guardrail_name=guardrail_name,
-            request_id=v.request_id,
-            api_key_id=v.api_key_id,
-            violation_type=v.violation_type,
-            severity=v.severity,
-            blocked=v.blocked,
-            details=json.loads(v.details),
-            created_at=v.created_at,
-        ))
-
-    return result
-
-
-@router.get("/violations/by-type")
-def get_violations_by_type(
-    range: str = Query("last30days"),
-    session: Session = Depends(get_session)
-):
-    """Get violations grouped by type."""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
-
-    results = session.exec(
-        select(
-            GuardrailViolation.violation_type,
-            func.count(GuardrailViolation.id).label("count"),
-        )
-        .where(GuardrailViolation.created_at >= start_date)
-        .group_by(GuardrailViolation.violation_type)
-        .order_by(func.count(GuardrailViolation.id).desc())
-    ).all()
-
-    return [
-        {"type": r.violation_type, "count": r.count}
-        for r in results
-    ]
-
-
-@router.get("/violations/trend")
-def get_violations_trend(
-    range: str = Query("last30days"),
-    session: Session = Depends(get_session)
-):
-    """Get violations trend over time."""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
-
-    result = []
-    current_date = start_date.date()
-
-    while current_date <= end_date.date():
-        next_date = current_date + timedelta(days=1)
-
-        day_count = session.exec(
-            select(func.count(GuardrailViolation.id))
-            .where(GuardrailViolation.created_at >= datetime.combine(current_date, datetime.min.time()))
-            .where(GuardrailViolation.created_at < datetime.combine(next_date, datetime.min.time()))
-        ).first() or 0
-
-        blocked_count = session.exec(
-            select(func.count(GuardrailViolation.id))
-            .where(GuardrailViolation.created_at >= datetime.combine(current_date, datetime.min.time()))
-            .where(GuardrailViolation.created_at < datetime.combine(next_date, datetime.min.time()))
-            .where(GuardrailViolation.blocked == True)
-        ).first() or 0
-
-        result.append({
-            "date": current_date.isoformat(),
-            "violations": day_count,
-            "blocked": blocked_count,
-        })
-
-        current_date = next_date
-
-    return result
@@ -9,6 +9,9 @@ import hashlib
 import json
 
 from quanxai.database import get_session, APIKey, Team, User
+from quanxai.services.hydration import load_values
+from quanxai.services.keys import key_cache
+from quanxai.services.tagging import set_api_key_tags
 
 router = APIRouter()
 
@@ -103,20 +106,12 @@ def list_keys(
     query = query.order_by(APIKey.created_at.desc()).offset(offset).limit(limit)
     keys = session.exec(query).all()
 
+    # Team and user names for the whole page
+    team_names = load_values(session, Team.name, (key.team_id for key in keys))
+    user_names = load_values(session, User.name, (key.user_id for key in keys))
+
     result = []
     for key in keys:
-        # Get team name
-        team_name = None
-        if key.team_id:
-            team = session.get(Team, key.team_id)
-            team_name = team.name if team else None
-
-        # Get user name
-        user_name = None
-        if key.user_id:
-            user = session.get(User, key.user_id)
-            user_name = user.name if user else None
-
         # Parse models
         models = json.loads(key.allowed_models) if key.allowed_models else []
         tags = json.loads(key.tags) if key.tags else []
@@ -134,9 +129,9 @@ def list_keys(
             alias=key.alias,
             key_prefix=key.key_prefix,
             team_id=key.team_id,
-            team_name=team_name,
+            team_name=team_names.get(key.team_id),
             user_id=key.user_id,
-            user_name=user_name,
+            user_name=user_names.get(key.user_id),
             models=models,
             rate_limit_rpm=key.rate_limit_rpm,
             rate_limit_tpm=key.rate_limit_tpm,
@@ -218,6 +213,7 @@ def create_key(
     )
 
     session.add(key)
+    set_api_key_tags(session, key.id, data.tags)
     session.commit()
     session.refresh(key)
 
@@ -306,9 +302,11 @@ def update_key(
         key.is_blocked = data.is_blocked
     if data.tags is not None:
         key.tags = json.dumps(data.tags)
+        set_api_key_tags(session, key.id, data.tags)
 
     session.add(key)
     session.commit()
+    key_cache.invalidate(key_id)
     session.refresh(key)
 
     return get_key(key_id, session)
@@ -321,8 +319,10 @@ def delete_key(key_id: str, session: Session = Depends(get_session)):
     if not key:
         raise HTTPException(status_code=404, detail="Key not found")
 
+    set_api_key_tags(session, key.id, None)
     session.delete(key)
     session.commit()
+    key_cache.invalidate(key_id)
 
     return {"message": "Key deleted successfully"}
 
@@ -341,6 +341,7 @@ def regenerate_key(key_id: str, session: Session = Depends(get_session)):
 
     session.add(key)
     session.commit()
+    key_cache.invalidate(key_id)
     session.refresh(key)
 
     return {
@@ -362,6 +363,7 @@ def toggle_block_key(key_id: str, session: Session = Depends(get_session)):
 
     session.add(key)
     session.commit()
+    key_cache.invalidate(key_id)
     session.refresh(key)
 
     return {
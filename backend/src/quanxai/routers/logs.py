@@ -1,11 +1,17 @@
 """Request Logs API endpoints."""
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select, func
-from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlmodel import Session, select
+from typing import Optional, List, Sequence
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+import json
 
-from quanxai.database import get_session, UsageLog, APIKey, Team, User
+from quanxai.database import get_session_runner, SessionRunner, UsageLog, APIKey, Team, User
+from quanxai.services.export import ExportFormat, export_response
+from quanxai.services.hydration import load_values
+from quanxai.services.pagination import NEXT_CURSOR_HEADER, paginate
+from quanxai.services.rollups import latency_sketch, usage_totals
+from quanxai.services.sketch import latency_fields
 
 router = APIRouter()
 
@@ -29,6 +35,9 @@ class LogResponse(BaseModel):
     total_cost_usd: float
     latency_ms: int
     is_streaming: bool
+    time_to_first_token_ms: Optional[int]
+    inter_token_latency_ms: Optional[float]
+    output_tokens_per_second: Optional[float]
     is_success: bool
     status_code: Optional[int]
     error_type: Optional[str]
@@ -56,25 +65,38 @@ class LogMetrics(BaseModel):
     total_tokens: int
     total_cost: float
     avg_latency_ms: float
+    p50_latency_ms: float
+    p90_latency_ms: float
     p95_latency_ms: float
-
-
-@router.get("/", response_model=List[LogResponse])
-def list_logs(
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None),
-    model: Optional[str] = Query(None),
-    status: Optional[str] = Query(None, description="success or failed"),
-    team_id: Optional[str] = Query(None),
-    user_id: Optional[str] = Query(None),
-    key_id: Optional[str] = Query(None),
-    limit: int = Query(50, le=500),
-    offset: int = Query(0),
-    session: Session = Depends(get_session)
+    p99_latency_ms: float
+
+
+class IngestionStats(BaseModel):
+    """Usage log write queue response."""
+    depth: int
+    capacity: int
+    enqueued: int
+    written: int
+    dropped: int
+    producer_waits: int
+    flushes: int
+    last_batch_size: int
+    last_flush_ms: float
+    avg_flush_ms: float
+    max_flush_ms: float
+
+
+def _filter_logs(
+    query,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    model: Optional[str],
+    status: Optional[str],
+    team_id: Optional[str],
+    user_id: Optional[str],
+    key_id: Optional[str],
 ):
-    """List request logs with filters."""
-    query = select(UsageLog)
-
+    """Apply the list/export filters to a UsageLog query."""
     # Apply date filters
     if start_date:
         query = query.where(UsageLog.created_at >= start_date)
@@ -98,12 +120,195 @@ def list_logs(
         query = query.where(UsageLog.user_id == user_id)
     if key_id:
         query = query.where(UsageLog.api_key_id == key_id)
+    return query
+
+
+def _log_rows(session: Session, logs: Sequence[UsageLog]) -> List[dict]:
+    """LogResponse fields for a batch of logs."""
+    # Related info for the whole batch, one query per entity type
+    key_aliases = load_values(session, APIKey.alias, (log.api_key_id for log in logs))
+    team_names = load_values(session, Team.name, (log.team_id for log in logs))
+    user_names = load_values(session, User.name, (log.user_id for log in logs))
+
+    return [
+        {
+            "id": log.id,
+            "request_id": log.request_id,
+            "api_key_id": log.api_key_id,
+            "key_alias": key_aliases.get(log.api_key_id),
+            "team_id": log.team_id,
+            "team_name": team_names.get(log.team_id),
+            "user_id": log.user_id,
+            "user_name": user_names.get(log.user_id),
+            "model_requested": log.model_requested,
+            "model_used": log.model_used,
+            "provider": log.provider,
+            "prompt_tokens": log.prompt_tokens,
+            "completion_tokens": log.completion_tokens,
+            "total_tokens": log.total_tokens,
+            "total_cost_usd": log.total_cost_usd,
+            "latency_ms": log.latency_ms,
+            "is_streaming": log.is_streaming,
+            "time_to_first_token_ms": log.time_to_first_token_ms,
+            "inter_token_latency_ms": log.inter_token_latency_ms,
+            "output_tokens_per_second": log.output_tokens_per_second,
+            "is_success": log.is_success,
+            "status_code": log.status_code,
+            "error_type": log.error_type,
+            "error_message": log.error_message,
+            "created_at": log.created_at,
+            "tags": json.loads(log.tags) if log.tags else [],
+        }
+        for log in logs
+    ]
+
+
+@router.get("/", response_model=List[LogResponse])
+async def list_logs(
+    response: Response,
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    model: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, description="success or failed"),
+    team_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    key_id: Optional[str] = Query(None),
+    limit: int = Query(50, le=500),
+    offset: int = Query(0),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header; takes precedence over offset"),
+    db: SessionRunner = Depends(get_session_runner)
+):
+    """List request logs with filters, newest first.
+
+    The next page's cursor is returned in the X-Next-Cursor header.
+    """
+    def read(session: Session):
+        query = _filter_logs(select(UsageLog), start_date, end_date, model, status, team_id, user_id, key_id)
+
+        try:
+            logs, next_cursor = paginate(session, query, UsageLog, limit, offset, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+        return [LogResponse(**row) for row in _log_rows(session, logs)]
+
+    return await db.run(read)
+
+
+@router.get("/export")
+def export_logs(
+    format: ExportFormat = Query(ExportFormat.ndjson),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    model: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, description="success or failed"),
+    team_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    key_id: Optional[str] = Query(None),
+):
+    """Stream every matching request log, oldest first.
+
+    Takes the same filters as the list endpoint, without a row limit.
+    """
+    query = _filter_logs(select(UsageLog), start_date, end_date, model, status, team_id, user_id, key_id)
+    query = query.order_by(UsageLog.created_at, UsageLog.id)
+    return export_response(query, _log_rows, LogResponse, format, "request_logs")
+
+
+@router.get("/metrics", response_model=LogMetrics)
+async def get_log_metrics(
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    db: SessionRunner = Depends(get_session_runner)
+):
+    """Get log metrics for dashboard."""
+    start_date = start_date or datetime.utcnow() - timedelta(days=30)
+    end_date = end_date or datetime.utcnow()
+
+    def read(session: Session):
+        totals = usage_totals(
+            session, start_date, end_date, ["requests", "successes", "tokens", "spend", "latency_sum"]
+        )
+        total_requests = totals["requests"]
+        successful_requests = totals["successes"]
+        failed_requests = total_requests - successful_requests
+
+        success_rate = (successful_requests / total_requests * 100) if total_requests > 0 else 100
+
+        return LogMetrics(
+            total_requests=total_requests,
+            successful_requests=successful_requests,
+            failed_requests=failed_requests,
+            success_rate=success_rate,
+            total_tokens=totals["tokens"],
+            total_cost=float(totals["spend"]),
+            avg_latency_ms=totals["latency_sum"] / total_requests if total_requests > 0 else 0,
+            **latency_fields(latency_sketch(session, start_date, end_date)),
+        )
+
+    return await db.run(read)
+
+
+@router.get("/ingestion", response_model=IngestionStats)
+def get_ingestion_stats(request: Request):
+    """Depth and flush latency of the queue the proxy writes usage logs through."""
+    return IngestionStats(**request.app.state.ingestion.stats())
 
-    query = query.order_by(UsageLog.created_at.desc()).offset(offset).limit(limit)
-    logs = session.exec(query).all()
 
-    result = []
-    for log in logs:
+@router.get("/errors")
+async def list_error_logs(
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    error_type: Optional[str] = Query(None),
+    limit: int = Query(50, le=500),
+    offset: int = Query(0),
+    db: SessionRunner = Depends(get_session_runner)
+):
+    """List only error logs."""
+    def read(session: Session):
+        query = select(UsageLog).where(UsageLog.is_success == False)
+
+        if start_date:
+            query = query.where(UsageLog.created_at >= start_date)
+        else:
+            query = query.where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=7))
+        if end_date:
+            query = query.where(UsageLog.created_at <= end_date)
+        if error_type:
+            query = query.where(UsageLog.error_type == error_type)
+
+        query = query.order_by(UsageLog.created_at.desc()).offset(offset).limit(limit)
+        logs = session.exec(query).all()
+
+        result = []
+        for log in logs:
+            result.append({
+                "id": log.id,
+                "request_id": log.request_id,
+                "model": log.model_used,
+                "error_type": log.error_type,
+                "error_message": log.error_message,
+                "status_code": log.status_code,
+                "created_at": log.created_at,
+            })
+
+        return result
+
+    return await db.run(read)
+
+
+@router.get("/{log_id}", response_model=LogDetailResponse)
+async def get_log_detail(log_id: str, db: SessionRunner = Depends(get_session_runner)):
+    """Get detailed log entry including request/response payloads."""
+    def read(session: Session):
+        log = session.get(UsageLog, log_id)
+        if not log:
+            raise HTTPException(status_code=404, detail="Log not found")
+
+        import json
+
         # Get related info
         key_alias = None
         if log.api_key_id:
@@ -120,11 +325,11 @@ def list_logs(
             user = session.get(User, log.user_id)
             user_name = user.name if user else None
 
-        # Parse tags
-        import json
         tags = json.loads(log.tags) if log.tags else []
+        request_payload = json.loads(log.request_payload) if log.request_payload else None
+        response_payload = json.loads(log.response_payload) if log.response_payload else None
 
-        result.append(LogResponse(
+        return LogDetailResponse(
             id=log.id,
             request_id=log.request_id,
             api_key_id=log.api_key_id,
@@ -148,203 +353,43 @@ def list_logs(
             error_message=log.error_message,
             created_at=log.created_at,
             tags=tags,
-        ))
-
-    return result
-
-
-@router.get("/metrics", response_model=LogMetrics)
-def get_log_metrics(
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None),
-    session: Session = Depends(get_session)
-):
-    """Get log metrics for dashboard."""
-    query = select(UsageLog)
-
-    if start_date:
-        query = query.where(UsageLog.created_at >= start_date)
-    else:
-        query = query.where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=30))
-    if end_date:
-        query = query.where(UsageLog.created_at <= end_date)
-
-    # Total requests
-    total_requests = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.created_at >= (start_date or datetime.utcnow() - timedelta(days=30)))
-    ).first() or 0
-
-    # Successful requests
-    successful_requests = session.exec(
-        select(func.count(UsageLog.id))
-        .where(UsageLog.created_at >= (start_date or datetime.utcnow() - timedelta(days=30)))
-        .where(UsageLog.is_success == True)
-    ).first() or 0
-
-    # Failed requests
-    failed_requests = total_requests - successful_requests
-
-    # Aggregates
-    result = session.exec(
-        select(
-            func.sum(UsageLog.total_tokens).label("total_tokens"),
-            func.sum(UsageLog.total_cost_usd).label("total_cost"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
+            request_payload=request_payload,
+            response_payload=response_payload,
+            cache_read_tokens=log.cache_read_tokens,
+            cache_creation_tokens=log.cache_creation_tokens,
+            prompt_cost_usd=log.prompt_cost_usd,
+            completion_cost_usd=log.completion_cost_usd,
         )
-        .where(UsageLog.created_at >= (start_date or datetime.utcnow() - timedelta(days=30)))
-    ).first()
-
-    # Get P95 latency (approximate using ordered query)
-    latency_logs = session.exec(
-        select(UsageLog.latency_ms)
-        .where(UsageLog.created_at >= (start_date or datetime.utcnow() - timedelta(days=30)))
-        .order_by(UsageLog.latency_ms)
-    ).all()
-
-    p95_latency = 0.0
-    if latency_logs:
-        p95_index = int(len(latency_logs) * 0.95)
-        p95_latency = float(latency_logs[min(p95_index, len(latency_logs) - 1)])
-
-    success_rate = (successful_requests / total_requests * 100) if total_requests > 0 else 100
-
-    return LogMetrics(
-        total_requests=total_requests,
-        successful_requests=successful_requests,
-        failed_requests=failed_requests,
-        success_rate=success_rate,
-        total_tokens=result.total_tokens or 0,
-        total_cost=float(result.total_cost or 0),
-        avg_latency_ms=float(result.avg_latency or 0),
-        p95_latency_ms=p95_latency,
-    )
-
-
-@router.get("/errors")
-def list_error_logs(
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None),
-    error_type: Optional[str] = Query(None),
-    limit: int = Query(50, le=500),
-    offset: int = Query(0),
-    session: Session = Depends(get_session)
-):
-    """List only error logs."""
-    query = select(UsageLog).where(UsageLog.is_success == False)
-
-    if start_date:
-        query = query.where(UsageLog.created_at >= start_date)
-    else:
-        query = query.where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=7))
-    if end_date:
-        query = query.where(UsageLog.created_at <= end_date)
-    if error_type:
-        query = query.where(UsageLog.error_type == error_type)
-
-    query = query.order_by(UsageLog.created_at.desc()).offset(offset).limit(limit)
-    logs = session.exec(query).all()
-
-    result = []
-    for log in logs:
-        result.append({
-            "id": log.id,
-            "request_id": log.request_id,
-            "model": log.model_used,
-            "error_type": log.error_type,
-            "error_message": log.error_message,
-            "status_code": log.status_code,
-            "created_at": log.created_at,
-        })
-
-    return result
-
 
-@router.get("/{log_id}", response_model=LogDetailResponse)
-def get_log_detail(log_id: str, session: Session = Depends(get_session)):
-    """Get detailed log entry including request/response payloads."""
-    log = session.get(UsageLog, log_id)
-    if not log:
-        raise HTTPException(status_code=404, detail="Log not found")
-
-    import json
-
-    # Get related info
-    key_alias = None
-    if log.api_key_id:
-        key = session.get(APIKey, log.api_key_id)
-        key_alias = key.alias if key else None
-
-    team_name = None
-    if log.team_id:
-        team = session.get(Team, log.team_id)
-        team_name = team.name if team else None
-
-    user_name = None
-    if log.user_id:
-        user = session.get(User, log.user_id)
-        user_name = user.name if user else None
-
-    tags = json.loads(log.tags) if log.tags else []
-    request_payload = json.loads(log.request_payload) if log.request_payload else None
-    response_payload = json.loads(log.response_payload) if log.response_payload else None
-
-    return LogDetailResponse(
-        id=log.id,
-        request_id=log.request_id,
-        api_key_id=log.api_key_id,
-        key_alias=key_alias,
-        team_id=log.team_id,
-        team_name=team_name,
-        user_id=log.user_id,
-        user_name=user_name,
-        model_requested=log.model_requested,
-        model_used=log.model_used,
-        provider=log.provider,
-        prompt_tokens=log.prompt_tokens,
-        completion_tokens=log.completion_tokens,
-        total_tokens=log.total_tokens,
-        total_cost_usd=log.total_cost_usd,
-        latency_ms=log.latency_ms,
-        is_streaming=log.is_streaming,
-        is_success=log.is_success,
-        status_code=log.status_code,
-        error_type=log.error_type,
-        error_message=log.error_message,
-        created_at=log.created_at,
-        tags=tags,
-        request_payload=request_payload,
-        response_payload=response_payload,
-        cache_read_tokens=log.cache_read_tokens,
-        cache_creation_tokens=log.cache_creation_tokens,
-        prompt_cost_usd=log.prompt_cost_usd,
-        completion_cost_usd=log.completion_cost_usd,
-    )
+    return await db.run(read)
 
 
 @router.get("/by-model/{model_name}")
-def get_logs_by_model(
+async def get_logs_by_model(
     model_name: str,
     limit: int = Query(50, le=500),
-    session: Session = Depends(get_session)
+    db: SessionRunner = Depends(get_session_runner)
 ):
     """Get logs for a specific model."""
-    logs = session.exec(
-        select(UsageLog)
-        .where(UsageLog.model_used == model_name)
-        .order_by(UsageLog.created_at.desc())
-        .limit(limit)
-    ).all()
-
-    return [
-        {
-            "id": log.id,
-            "request_id": log.request_id,
-            "total_tokens": log.total_tokens,
-            "total_cost_usd": log.total_cost_usd,
-            "latency_ms": log.latency_ms,
-            "is_success": log.is_success,
-            "created_at": log.created_at,
-        }
-        for log in logs
-    ]
+    def read(session: Session):
+        logs = session.exec(
+            select(UsageLog)
+            .where(UsageLog.model_used == model_name)
+            .order_by(UsageLog.created_at.desc())
+            .limit(limit)
+        ).all()
+
+        return [
+            {
+                "id": log.id,
+                "request_id": log.request_id,
+                "total_tokens": log.total_tokens,
+                "total_cost_usd": log.total_cost_usd,
+                "latency_ms": log.latency_ms,
+                "is_success": log.is_success,
+                "created_at": log.created_at,
+            }
+            for log in logs
+        ]
+
+    return await db.run(read)
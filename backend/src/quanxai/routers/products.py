@@ -1,11 +1,13 @@
 """AWS Products API endpoints (Bedrock & SageMaker)."""
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlmodel import Session, select, func
 from typing import Optional, List
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from quanxai.database import get_session, AWSProduct, AWSUsageLog, UsageLog
+from quanxai.services.rollups import usage_breakdown, usage_series, usage_totals
+from quanxai.services.timeseries import Bucket, bucket_label
 
 router = APIRouter()
 
@@ -68,6 +70,47 @@ class RegionalUsage(BaseModel):
     avg_latency: float
 
 
+class RegionRouting(BaseModel):
+    """Live routing statistics of a Bedrock model in one region."""
+    model_id: str
+    region: str
+    latency_ms: Optional[float]
+    outstanding: int
+    error_rate: float
+    cooldown_s: float
+    requests: int
+    errors: int
+    fallbacks: int
+
+
+class UpstreamHealth(BaseModel):
+    """Circuit breaker state of a provider and model (and region)."""
+    provider: str
+    model: str
+    region: Optional[str]
+    state: str
+    requests: int
+    failures: int
+    failure_rate: float
+    retry_after_s: float
+    times_opened: int
+
+
+class UpstreamQueue(BaseModel):
+    """Upstream slots and queue of one team on a provider."""
+    provider: str
+    concurrency: int
+    provider_in_flight: int
+    team_id: Optional[str]
+    weight: float
+    in_flight: int
+    queued: int
+    requests: int
+    queue_ms_p50: Optional[float] = None
+    queue_ms_p95: Optional[float] = None
+    queue_ms_p99: Optional[float] = None
+
+
 class CostAllocationEntry(BaseModel):
     """Cost allocation entry."""
     tag: str
@@ -101,26 +144,13 @@ def get_product_metrics(
         select(func.count(AWSProduct.id)).where(AWSProduct.service == "sagemaker")
     ).first() or 0
 
-    # Get Bedrock metrics from usage logs (provider contains 'bedrock')
-    bedrock_result = session.exec(
-        select(
-            func.count(UsageLog.id).label("requests"),
-            func.sum(UsageLog.total_cost_usd).label("cost"),
-            func.avg(UsageLog.latency_ms).label("avg_latency"),
-        )
-        .where(UsageLog.provider.contains("bedrock"))
-        .where(UsageLog.created_at >= start_date)
-    ).first()
-
-    # Get SageMaker metrics
-    sagemaker_result = session.exec(
-        select(
-            func.count(UsageLog.id).label("requests"),
-            func.sum(UsageLog.total_cost_usd).label("cost"),
-        )
-        .where(UsageLog.provider.contains("sagemaker"))
-        .where(UsageLog.created_at >= start_date)
-    ).first()
+    # Bedrock and SageMaker metrics from usage logs, by provider name
+    by_provider = usage_breakdown(
+        session, start_date, end_date, ["requests", "spend", "latency_sum"], group_by=["provider"]
+    )
+    bedrock = [r for r in by_provider if "bedrock" in r["provider"]]
+    sagemaker = [r for r in by_provider if "sagemaker" in r["provider"]]
+    bedrock_requests = sum(r["requests"] for r in bedrock)
 
     # Cross-region calls
     cross_region_calls = session.exec(
@@ -130,13 +160,15 @@ def get_product_metrics(
     ).first() or 0
 
     return ProductMetrics(
-        total_bedrock_spend=float(bedrock_result.cost or 0),
-        total_sagemaker_spend=float(sagemaker_result.cost or 0) if sagemaker_result else 0,
-        total_bedrock_requests=bedrock_result.requests or 0,
-        total_sagemaker_requests=sagemaker_result.requests if sagemaker_result else 0,
+        total_bedrock_spend=float(sum(r["spend"] for r in bedrock)),
+        total_sagemaker_spend=float(sum(r["spend"] for r in sagemaker)),
+        total_bedrock_requests=bedrock_requests,
+        total_sagemaker_requests=sum(r["requests"] for r in sagemaker),
         bedrock_models_count=bedrock_count,
         sagemaker_endpoints_count=sagemaker_count,
-        avg_bedrock_latency=float(bedrock_result.avg_latency or 0),
+        avg_bedrock_latency=(
+            sum(r["latency_sum"] for r in bedrock) / bedrock_requests if bedrock_requests > 0 else 0
+        ),
         cross_region_calls=cross_region_calls,
     )
 
@@ -158,22 +190,25 @@ def list_bedrock_models(
     query = query.order_by(AWSProduct.display_name)
     products = session.exec(query).all()
 
+    # Usage stats for every model in one grouped query
+    end_date = datetime.utcnow()
+    usage_by_model = {
+        r["model_used"]: r
+        for r in usage_breakdown(
+            session,
+            end_date - timedelta(days=30),
+            end_date,
+            ["requests", "tokens", "spend", "latency_sum"],
+            group_by=["model_used"],
+        )
+    }
+    no_usage = {"requests": 0, "tokens": 0, "spend": 0, "latency_sum": 0}
+
     result = []
     for product in products:
         import json
         regions = json.loads(product.regions_available) if product.regions_available else [product.region]
-
-        # Get usage stats for this model
-        usage_stats = session.exec(
-            select(
-                func.count(UsageLog.id).label("requests"),
-                func.sum(UsageLog.total_tokens).label("tokens"),
-                func.sum(UsageLog.total_cost_usd).label("cost"),
-                func.avg(UsageLog.latency_ms).label("avg_latency"),
-            )
-            .where(UsageLog.model_used == product.model_id)
-            .where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=30))
-        ).first()
+        usage_stats = usage_by_model.get(product.model_id, no_usage)
 
         result.append(BedrockModel(
             id=product.id,
@@ -190,10 +225,12 @@ def list_bedrock_models(
             supports_vision=product.supports_vision,
             supports_function_calling=product.supports_function_calling,
             is_active=product.is_active,
-            total_requests=usage_stats.requests or 0,
-            total_tokens=usage_stats.tokens or 0,
-            total_cost=float(usage_stats.cost or 0),
-            avg_latency_ms=float(usage_stats.avg_latency or 0),
+            total_requests=usage_stats["requests"],
+            total_tokens=usage_stats["tokens"],
+            total_cost=float(usage_stats["spend"]),
+            avg_latency_ms=(
+                usage_stats["latency_sum"] / usage_stats["requests"] if usage_stats["requests"] > 0 else 0
+            ),
         ))
 
     return result
@@ -202,6 +239,7 @@ def list_bedrock_models(
 @router.get("/bedrock/usage")
 def get_bedrock_usage(
     range: str = Query("last30days"),
+    bucket: Bucket = Query("day"),
     session: Session = Depends(get_session)
 ):
     """Get Bedrock usage analytics."""
@@ -214,48 +252,40 @@ def get_bedrock_usage(
         start_date = end_date - timedelta(days=30)
 
     # Usage by model
-    by_model = session.exec(
-        select(
-            UsageLog.model_used,
-            func.count(UsageLog.id).label("requests"),
-            func.sum(UsageLog.total_tokens).label("tokens"),
-            func.sum(UsageLog.total_cost_usd).label("cost"),
-        )
-        .where(UsageLog.provider.contains("bedrock"))
-        .where(UsageLog.created_at >= start_date)
-        .group_by(UsageLog.model_used)
-        .order_by(func.sum(UsageLog.total_cost_usd).desc())
-    ).all()
+    by_model = usage_breakdown(
+        session,
+        start_date,
+        end_date,
+        ["requests", "tokens", "spend"],
+        group_by=["model_used"],
+        filters={"provider__contains": "bedrock"},
+    )
+    by_model.sort(key=lambda r: r["spend"], reverse=True)
 
     # Daily trend
-    daily_trend = []
-    current_date = start_date.date()
-    while current_date <= end_date.date():
-        next_date = current_date + timedelta(days=1)
-        day_result = session.exec(
-            select(
-                func.count(UsageLog.id).label("requests"),
-                func.sum(UsageLog.total_cost_usd).label("cost"),
-            )
-            .where(UsageLog.provider.contains("bedrock"))
-            .where(UsageLog.created_at >= datetime.combine(current_date, datetime.min.time()))
-            .where(UsageLog.created_at < datetime.combine(next_date, datetime.min.time()))
-        ).first()
-
-        daily_trend.append({
-            "date": current_date.isoformat(),
-            "requests": day_result.requests or 0,
-            "cost": float(day_result.cost or 0),
-        })
-        current_date = next_date
+    daily_trend = [
+        {
+            "date": bucket_label(bucket_start, bucket),
+            "requests": values["requests"],
+            "cost": float(values["spend"]),
+        }
+        for bucket_start, values in usage_series(
+            session,
+            start_date,
+            end_date,
+            ["requests", "spend"],
+            bucket=bucket,
+            filters={"provider__contains": "bedrock"},
+        )
+    ]
 
     return {
         "by_model": [
             {
-                "model": r.model_used,
-                "requests": r.requests,
-                "tokens": r.tokens or 0,
-                "cost": float(r.cost or 0),
+                "model": r["model_used"],
+                "requests": r["requests"],
+                "tokens": r["tokens"],
+                "cost": float(r["spend"]),
             }
             for r in by_model
         ],
@@ -302,6 +332,24 @@ def get_bedrock_regional_usage(
     ]
 
 
+@router.get("/bedrock/routing", response_model=List[RegionRouting])
+def get_bedrock_routing(request: Request):
+    """Get the proxy's per-region latency and error statistics for Bedrock models."""
+    return request.app.state.regions.snapshot()
+
+
+@router.get("/health", response_model=List[UpstreamHealth])
+def get_upstream_health(request: Request):
+    """Get the proxy's circuit breaker states, open breakers first."""
+    return request.app.state.breakers.snapshot()
+
+
+@router.get("/scheduler", response_model=List[UpstreamQueue])
+def get_upstream_scheduler(request: Request):
+    """Get the proxy's upstream slots, queues and recent queue times per team."""
+    return request.app.state.scheduler.snapshot()
+
+
 @router.get("/sagemaker/endpoints", response_model=List[SageMakerEndpoint])
 def list_sagemaker_endpoints(
     region: Optional[str] = Query(None),
@@ -316,14 +364,18 @@ def list_sagemaker_endpoints(
     query = query.order_by(AWSProduct.display_name)
     products = session.exec(query).all()
 
+    # Requests in the last hour for every model in one grouped query
+    end_date = datetime.utcnow()
+    hourly_by_model = {
+        r["model_used"]: r["requests"]
+        for r in usage_breakdown(
+            session, end_date - timedelta(hours=1), end_date, ["requests"], group_by=["model_used"]
+        )
+    }
+
     result = []
     for product in products:
-        # Calculate hourly stats
-        hourly_requests = session.exec(
-            select(func.count(UsageLog.id))
-            .where(UsageLog.model_used == product.model_id)
-            .where(UsageLog.created_at >= datetime.utcnow() - timedelta(hours=1))
-        ).first() or 0
+        hourly_requests = hourly_by_model.get(product.model_id, 0)
 
         result.append(SageMakerEndpoint(
             id=product.id,
@@ -356,10 +408,7 @@ def get_cost_allocation(
         start_date = end_date - timedelta(days=30)
 
     # Get total cost
-    total_cost = session.exec(
-        select(func.sum(UsageLog.total_cost_usd))
-        .where(UsageLog.created_at >= start_date)
-    ).first() or 1.0
+    total_cost = usage_totals(session, start_date, end_date, ["spend"])["spend"] or 1.0
 
     if group_by == "team":
         # Group by team
@@ -0,0 +1,563 @@
+"""OpenAI-compatible LLM proxy endpoints."""
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import httpx
+from fastapi import APIRouter, Header, Request, Response
+from fastapi.responses import StreamingResponse
+
+from quanxai.config import settings
+from quanxai.database import UsageLog
+from quanxai.services.circuit_breakers import CircuitBreakers
+from quanxai.services.coalescing import SingleFlight
+from quanxai.services.errors import ProxyError
+from quanxai.services.guardrails import (
+    GuardrailMatch,
+    GuardrailPlan,
+    enforce,
+    guarded_call,
+    guardrail_engine,
+    guardrail_error,
+    record_violations,
+    request_text,
+    response_text,
+    run_during_call,
+)
+from quanxai.services.hedging import HEDGE_EXTENSION, HEDGE_REGION_EXTENSION, Hedger
+from quanxai.services.ingestion import IngestionQueue
+from quanxai.services.keys import KeyContext, bearer_token, check_key, resolve_key
+from quanxai.services.pricing import token_costs
+from quanxai.services.providers import ProviderPool
+from quanxai.services.rate_limits import RateLimiter
+from quanxai.services.regions import REGION_EXTENSION, Deployment, RegionRouter, aws_usage_log
+from quanxai.services.response_cache import ResponseCache, cache_lookup
+from quanxai.services.scheduling import BATCH, INTERACTIVE, QUEUE_EXTENSION, FairScheduler
+from quanxai.services.spend import SpendTracker
+from quanxai.services.streaming import estimate_tokens
+
+router = APIRouter()
+
+# Response headers added by the proxy
+REQUEST_ID_HEADER = "x-quanxai-request-id"
+OVERHEAD_HEADER = "x-quanxai-overhead-ms"
+CACHE_HEADER = "x-quanxai-cache"
+COALESCED_HEADER = "x-quanxai-coalesced"
+REGION_HEADER = "x-quanxai-region"
+QUEUE_HEADER = "x-quanxai-queue-ms"
+
+# Request header marking a request as batch traffic ("batch")
+PRIORITY_HEADER = "x-quanxai-priority"
+
+
+def build_usage_log(
+    request_id: str,
+    key: KeyContext,
+    model: str,
+    provider: str,
+    payload: Dict[str, Any],
+    status_code: Optional[int],
+    body: Optional[Dict[str, Any]],
+    latency_ms: float,
+    error_type: Optional[str] = None,
+    error_message: Optional[str] = None,
+    cache_hit: bool = False,
+    queue_ms: Optional[float] = None,
+    prices: Optional[Tuple[float, float]] = None,
+) -> UsageLog:
+    """UsageLog for one proxied request, costed from the upstream usage block.
+
+    ``prices`` (USD per 1M tokens, such as a Bedrock region's) override the
+    model's list prices. Responses served from the response cache cost
+    nothing.
+    """
+    usage = (body or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    prompt_cost, completion_cost = (
+        (0.0, 0.0) if cache_hit else token_costs(model, prompt_tokens, completion_tokens, prices)
+    )
+    is_success = status_code is not None and status_code < 400
+
+    return UsageLog(
+        request_id=request_id,
+        api_key_id=key.id,
+        organization_id=key.organization_id,
+        team_id=key.team_id,
+        user_id=key.user_id,
+        model_requested=payload.get("model", model),
+        model_used=(body or {}).get("model") or model,
+        provider=provider,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=usage.get("total_tokens") or prompt_tokens + completion_tokens,
+        cache_read_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+        prompt_cost_usd=prompt_cost,
+        completion_cost_usd=completion_cost,
+        total_cost_usd=prompt_cost + completion_cost,
+        latency_ms=int(latency_ms),
+        queue_time_ms=int(queue_ms) if queue_ms is not None else None,
+        is_streaming=bool(payload.get("stream")),
+        is_success=is_success,
+        status_code=status_code,
+        error_type=error_type or (None if is_success else "upstream_error"),
+        error_message=error_message,
+        request_payload=json.dumps(payload) if settings.PROXY_LOG_PAYLOADS else None,
+        response_payload=json.dumps(body) if settings.PROXY_LOG_PAYLOADS and body is not None else None,
+        tags=json.dumps(list(key.tags)) if key.tags else None,
+        created_at=datetime.utcnow(),
+    )
+
+
+def parse_payload(raw: bytes) -> Dict[str, Any]:
+    """The JSON request body, which must name a model."""
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        raise ProxyError(400, "Request body is not valid JSON")
+    if not isinstance(payload, dict) or not isinstance(payload.get("model"), str):
+        raise ProxyError(400, "'model' is required")
+    return payload
+
+
+def upstream_error_message(status_code: int, body: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The error message of a failed upstream response."""
+    if status_code >= 400 and body is not None:
+        return (body.get("error") or {}).get("message")
+    return None
+
+
+async def upstream_unavailable(
+    error: httpx.HTTPError,
+    request_id: str,
+    key: KeyContext,
+    model: str,
+    provider: str,
+    payload: Dict[str, Any],
+    upstream_ms: float,
+    ingestion: IngestionQueue,
+) -> ProxyError:
+    """Log a request whose provider could not be reached; returns the error to raise."""
+    await ingestion.submit(build_usage_log(
+        request_id, key, model, provider, payload, None, None, upstream_ms,
+        error_type=type(error).__name__, error_message=str(error) or None,
+    ))
+    return ProxyError(
+        502, f"Upstream provider '{provider}' is unreachable", type="api_error",
+        code="upstream_unavailable", headers={REQUEST_ID_HEADER: request_id},
+    )
+
+
+def upstream_call(
+    request: Request,
+    key: KeyContext,
+    provider: str,
+    upstream_model: str,
+    deployment: Optional[Deployment],
+    content: bytes,
+    stream: bool = False,
+) -> Callable[[], Awaitable[httpx.Response]]:
+    """The call sending a completion upstream.
+
+    Deployments are routed between their regions; other requests go
+    through the circuit breaker of their provider and model. Each call
+    waits for a slot of the provider in the fair scheduler
+    (services.scheduling), as batch traffic with ``x-quanxai-priority:
+    batch``. Non-streaming requests to deployments of the models in
+    HEDGE_MODELS are hedged to their next best region (services.hedging).
+    """
+    pool: ProviderPool = request.app.state.providers
+    hedger: Hedger = request.app.state.hedger
+    scheduler: FairScheduler = request.app.state.scheduler
+    priority = BATCH if (request.headers.get(PRIORITY_HEADER) or "").lower() == BATCH else INTERACTIVE
+    hedged = not stream and deployment is not None and hedger.applies(upstream_model)
+
+    def scheduled(send: Callable[[], Awaitable[httpx.Response]]) -> Callable[[], Awaitable[httpx.Response]]:
+        return lambda: scheduler.call(provider, key, send, priority, stream=stream)
+
+    if deployment is not None:
+        regions: RegionRouter = request.app.state.regions
+        if not hedged:
+            return scheduled(
+                lambda: regions.send(pool, provider, deployment, "/chat/completions", content, stream=stream)
+            )
+
+        async def send_hedged() -> httpx.Response:
+            order = regions.regions(provider, deployment)
+            hedge = None
+            if len(order) > 1:
+                hedge = scheduled(lambda: regions.send(
+                    pool, provider, deployment, "/chat/completions", content, order=order[1:],
+                ))
+            response = await hedger.call(
+                upstream_model,
+                scheduled(lambda: regions.send(pool, provider, deployment, "/chat/completions", content, order=order)),
+                hedge,
+            )
+            winner = response.extensions.get(HEDGE_EXTENSION)
+            if winner is not None:
+                # Where the other call started; a fallback may have moved it on
+                response.extensions[HEDGE_REGION_EXTENSION] = order[1] if winner == "primary" else order[0]
+            return response
+        return send_hedged
+    breakers: CircuitBreakers = request.app.state.breakers
+    breaker = breakers.get(provider, upstream_model)
+    post = pool.stream if stream else pool.post
+    return scheduled(lambda: breaker.call(lambda: post(provider, "/chat/completions", content)))
+
+
+def sse_error(error: ProxyError) -> bytes:
+    """An OpenAI-style error as a server-sent event."""
+    body = {"error": {"message": error.message, "type": error.type, "code": error.code}}
+    return b"data: " + json.dumps(body).encode() + b"\n\n"
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """A StreamingResponse that runs ``on_close`` however it ends.
+
+    The body generator's own cleanup does not run when the client goes away
+    before the first chunk is read, as the generator is never started;
+    ``on_close`` runs once the response is done with, sent or not, and is
+    shielded so that a disconnect does not cancel it.
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], on_close: Callable[[], Awaitable[None]], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await asyncio.shield(self.on_close())
+
+
+async def stream_completion(
+    request: Request,
+    key: KeyContext,
+    model: str,
+    provider: str,
+    payload: Dict[str, Any],
+    send: Callable[[], Awaitable[httpx.Response]],
+    request_id: str,
+    started: float,
+    guardrails: GuardrailPlan,
+    flight_key: Optional[Any],
+    deployment: Optional[Deployment],
+) -> Response:
+    """Forward an upstream SSE stream to the client chunk by chunk.
+
+    Output tokens are counted as the stream passes (the usage block is used
+    when the client asked for one) and the usage log, with time to first
+    token, inter-token latency and throughput, is queued when the response
+    closes, even if the client left before the first chunk. A blocking
+    during_call guardrail cancels the request before the first byte, or
+    ends the stream with an error event after it. The response cache and
+    post_call guardrails do not apply to streams.
+    """
+    pool: ProviderPool = request.app.state.providers
+    flights: SingleFlight = request.app.state.single_flight
+    limiter: RateLimiter = request.app.state.rate_limiter
+    spend: SpendTracker = request.app.state.spend
+    ingestion: IngestionQueue = request.app.state.ingestion
+    headers = {REQUEST_ID_HEADER: request_id}
+
+    await limiter.acquire(key)
+    checks = None
+    if guardrails.during_call:
+        checks = asyncio.create_task(run_during_call(guardrails.during_call, request_text(payload), pool))
+    shared, joined = flights.stream(flight_key, send)
+    holder = shared.hold()
+    if joined:
+        headers[COALESCED_HEADER] = "true"
+    upstream_started = time.perf_counter()
+    try:
+        try:
+            opened = shared.opened()
+            if await (opened if checks is None else guarded_call(opened, checks)) is None:
+                # Cancelled by a blocking during_call guardrail
+                await enforce(checks.result(), "during_call", request_id, key.id, ingestion, headers=headers)
+        except httpx.HTTPError as e:
+            upstream_ms = (time.perf_counter() - upstream_started) * 1000
+            raise await upstream_unavailable(e, request_id, key, model, provider, payload, upstream_ms, ingestion)
+        if shared.status_code != 200:
+            raw = b"".join([chunk async for chunk, _ in shared.chunks(holder)])
+    except BaseException:
+        shared.release(holder)
+        if checks is not None:
+            checks.cancel()
+        await limiter.release(key, 0)
+        raise
+
+    media_type = shared.headers.get("content-type", "text/event-stream")
+    region = shared.extensions.get(REGION_EXTENSION) if deployment is not None else None
+    prices = deployment.token_prices(region) if region is not None else None
+    if region is not None:
+        headers[REGION_HEADER] = region
+    queue_ms = shared.extensions.get(QUEUE_EXTENSION)
+    if queue_ms is not None:
+        headers[QUEUE_HEADER] = f"{queue_ms:.2f}"
+    if shared.status_code != 200:
+        shared.release(holder)
+        if checks is not None:
+            checks.cancel()
+        await limiter.release(key, 0)
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            body = None
+        upstream_ms = (time.perf_counter() - upstream_started) * 1000
+        log = build_usage_log(
+            request_id, key, model, provider, payload, shared.status_code, body, upstream_ms,
+            error_message=upstream_error_message(shared.status_code, body), queue_ms=queue_ms,
+            prices=prices,
+        )
+        await ingestion.submit(log)
+        if region is not None:
+            await ingestion.submit(aws_usage_log(log, deployment, region))
+        return Response(content=raw, status_code=shared.status_code, media_type=media_type, headers=headers)
+
+    first_token = last_token = None
+    deltas = 0
+    completed = False
+    error = None
+    blocked: List[GuardrailMatch] = []
+
+    async def finish() -> None:
+        shared.release(holder)
+        finished = time.perf_counter()
+        usage = (shared.usage.usage or {}) if completed else {}
+        prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(request_text(payload))
+        completion_tokens = usage.get("completion_tokens") or deltas
+        body = {
+            "model": shared.usage.model,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        error_type = error_message = None
+        if blocked:
+            error_type, error_message = "guardrail_violation", guardrail_error(blocked[0], "during_call").message
+        elif error is not None:
+            error_type, error_message = type(error).__name__, str(error) or None
+        log = build_usage_log(
+            request_id, key, model, provider, payload, 200, body, (finished - upstream_started) * 1000,
+            error_type=error_type, error_message=error_message, queue_ms=queue_ms, prices=prices,
+        )
+        if first_token is not None:
+            log.time_to_first_token_ms = int((first_token - started) * 1000)
+            if deltas > 1 and last_token > first_token:
+                log.inter_token_latency_ms = (last_token - first_token) * 1000 / (deltas - 1)
+                log.output_tokens_per_second = completion_tokens * (deltas - 1) / deltas / (last_token - first_token)
+
+        await limiter.release(key, log.total_tokens)
+        spend.add(key, log.total_cost_usd)
+        await ingestion.submit(log)
+        if region is not None:
+            await ingestion.submit(aws_usage_log(log, deployment, region))
+        if checks is not None:
+            # Too late to block; the violations are still recorded
+            matches = checks.result() if blocked else await checks
+            await record_violations(matches, "during_call", request_id, key.id, ingestion)
+
+    async def forward():
+        nonlocal first_token, last_token, deltas, completed, error, blocked
+        try:
+            async for chunk, chunk_deltas in shared.chunks(holder):
+                if checks is not None and checks.done():
+                    blocked = [match for match in checks.result() if match.rule.block]
+                    if blocked:
+                        yield sse_error(guardrail_error(blocked[0], "during_call"))
+                        return
+                if chunk_deltas:
+                    last_token = time.perf_counter()
+                    first_token = first_token or last_token
+                    deltas += chunk_deltas
+                yield chunk
+            completed = True
+        except httpx.HTTPError as e:
+            error = e
+
+    headers[OVERHEAD_HEADER] = f"{(upstream_started - started) * 1000:.2f}"
+    # finish() runs when the response closes, even if forward() never started
+    return ClosingStreamingResponse(forward(), finish, media_type=media_type, headers=headers)
+
+
+@router.post("/chat/completions")
+async def chat_completions(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+):
+    """Proxy a chat completion to the model's provider.
+
+    The key's budgets are checked first, then the organization's pre_call
+    guardrails, then the response cache is looked up (``Cache-Control:
+    no-cache`` skips it, ``no-store`` keeps the response out of it).
+    during_call guardrails run alongside the upstream request and post_call
+    guardrails check successful responses before they are cached or
+    returned. ``"stream": true`` requests are forwarded as server-sent
+    events (see stream_completion). Rate limits apply to requests sent
+    upstream (429 with Retry-After), and the usage log is queued for the
+    batched writer. On the way upstream:
+
+    - identical requests in flight at the same time share one upstream
+      call, but each is logged and billed
+    - Bedrock models the organization has AWSProduct deployments of are
+      routed between their regions (services.regions); the region is
+      returned in x-quanxai-region and recorded in an AWSUsageLog
+    - while the circuit breaker of a provider and model is open, requests
+      are rejected with a 503 without calling it
+    - slow requests for hedged models are sent again to another region;
+      the log records which call answered and what the other cost
+    - upstream calls are queued fairly between teams when a provider is
+      at its concurrency limit; the wait is returned in x-quanxai-queue-ms
+
+    The time spent in the proxy itself is returned in the
+    x-quanxai-overhead-ms header.
+    """
+    started = time.perf_counter()
+    raw_key = bearer_token(authorization)
+    payload = parse_payload(await request.body())
+    model = payload["model"]
+    key = check_key(await resolve_key(raw_key), model)
+    spend: SpendTracker = request.app.state.spend
+    spend.check(key)
+    request_id = str(uuid4())
+    ingestion: IngestionQueue = request.app.state.ingestion
+
+    guardrails = await guardrail_engine.plan(key.organization_id, model)
+    if guardrails.pre_call:
+        await enforce(guardrails.pre_call.scan(request_text(payload)), "pre_call", request_id, key.id, ingestion,
+                      headers={REQUEST_ID_HEADER: request_id})
+
+    cache: ResponseCache = request.app.state.response_cache
+    cache_control = (request.headers.get("cache-control") or "").lower()
+    lookup = None
+    if cache.config.enabled and not payload.get("stream"):
+        lookup = cache.lookup(key.organization_id, payload, read="no-cache" not in cache_control)
+        cached = lookup.entry
+        if cached is not None:
+            latency_ms = (time.perf_counter() - started) * 1000
+            await ingestion.submit(build_usage_log(
+                request_id, key, model, "cache", payload, 200,
+                {"model": cached.model, "usage": cached.usage}, latency_ms, cache_hit=True,
+            ))
+            return Response(
+                content=cached.body,
+                media_type=cached.media_type,
+                headers={
+                    REQUEST_ID_HEADER: request_id,
+                    OVERHEAD_HEADER: f"{latency_ms:.2f}",
+                    CACHE_HEADER: "semantic-hit" if lookup.semantic else "hit",
+                },
+            )
+
+    pool: ProviderPool = request.app.state.providers
+    provider, upstream_model = pool.resolve(model)
+    content = json.dumps({**payload, "model": upstream_model}).encode()
+    regions: RegionRouter = request.app.state.regions
+    deployment = None
+    if pool.providers[provider].default_region is not None:
+        deployment = await regions.deployment(key.organization_id, upstream_model)
+    flights: SingleFlight = request.app.state.single_flight
+    flight_key = None
+    if settings.PROXY_COALESCE_REQUESTS:
+        flight_key = ((lookup or cache_lookup(key.organization_id, payload)).key, bool(payload.get("stream")))
+    if payload.get("stream"):
+        return await stream_completion(
+            request, key, model, provider, payload,
+            upstream_call(request, key, provider, upstream_model, deployment, content, stream=True),
+            request_id, started, guardrails, flight_key, deployment,
+        )
+
+    limiter: RateLimiter = request.app.state.rate_limiter
+    await limiter.acquire(key)
+    used_tokens = 0
+    checks = None
+    if guardrails.during_call:
+        checks = asyncio.create_task(run_during_call(guardrails.during_call, request_text(payload), pool))
+    try:
+        upstream_started = time.perf_counter()
+        try:
+            send = upstream_call(request, key, provider, upstream_model, deployment, content)
+            call = flights.do(flight_key, send)
+            outcome = await (call if checks is None else guarded_call(call, checks))
+        except httpx.HTTPError as e:
+            upstream_ms = (time.perf_counter() - upstream_started) * 1000
+            raise await upstream_unavailable(e, request_id, key, model, provider, payload, upstream_ms, ingestion)
+        if outcome is None:
+            # Cancelled by a blocking during_call guardrail
+            await enforce(checks.result(), "during_call", request_id, key.id, ingestion,
+                          headers={REQUEST_ID_HEADER: request_id})
+        upstream, coalesced = outcome
+        upstream_ms = (time.perf_counter() - upstream_started) * 1000
+
+        try:
+            body = upstream.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            body = None
+        used_tokens = ((body or {}).get("usage") or {}).get("total_tokens") or 0
+    except BaseException:
+        if checks is not None:
+            checks.cancel()
+        raise
+    finally:
+        await limiter.release(key, used_tokens)
+    queue_ms = upstream.extensions.get(QUEUE_EXTENSION)
+    region = upstream.extensions.get(REGION_EXTENSION) if deployment is not None else None
+    log = build_usage_log(
+        request_id, key, model, provider, payload, upstream.status_code, body, upstream_ms,
+        error_message=upstream_error_message(upstream.status_code, body), queue_ms=queue_ms,
+        prices=deployment.token_prices(region) if region is not None else None,
+    )
+    hedge = upstream.extensions.get(HEDGE_EXTENSION)
+    if hedge is not None and not coalesced:
+        # The other call is assumed to have been billed for the prompt, at
+        # the prices of its region
+        hedge_region = upstream.extensions[HEDGE_REGION_EXTENSION]
+        log.hedge = hedge
+        log.hedge_cost_usd, _ = token_costs(model, log.prompt_tokens, 0, deployment.token_prices(hedge_region))
+        log.total_cost_usd += log.hedge_cost_usd
+    spend.add(key, log.total_cost_usd)
+    await ingestion.submit(log)
+    if region is not None:
+        await ingestion.submit(aws_usage_log(log, deployment, region))
+    if checks is not None:
+        await enforce(await checks, "during_call", request_id, key.id, ingestion,
+                      headers={REQUEST_ID_HEADER: request_id})
+
+    media_type = upstream.headers.get("content-type", "application/json")
+    headers = {REQUEST_ID_HEADER: request_id}
+    if coalesced:
+        headers[COALESCED_HEADER] = "true"
+    if region is not None:
+        headers[REGION_HEADER] = region
+    if queue_ms is not None:
+        headers[QUEUE_HEADER] = f"{queue_ms:.2f}"
+    if guardrails.post_call and upstream.status_code == 200 and body is not None:
+        await enforce(guardrails.post_call.scan(response_text(body)), "post_call", request_id, key.id, ingestion,
+                      headers=headers)
+    if lookup is not None:
+        headers[CACHE_HEADER] = "miss"
+        # The first of coalesced requests caches the response
+        if upstream.status_code == 200 and body is not None and not coalesced and "no-store" not in cache_control:
+            cache.put(lookup, model, upstream.content, media_type, body.get("usage") or {}, log.total_cost_usd)
+
+    overhead_ms = (time.perf_counter() - started) * 1000 - upstream_ms
+    headers[OVERHEAD_HEADER] = f"{overhead_ms:.2f}"
+    return Response(
+        content=upstream.content,
+        status_code=upstream.status_code,
+        media_type=media_type,
+        headers=headers,
+    )
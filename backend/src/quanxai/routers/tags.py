@@ -1,11 +1,13 @@
 """Tag Management API endpoints."""
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import delete
 from sqlmodel import Session, select, func
 from typing import Optional, List
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
-from quanxai.database import get_session, Tag, UsageLog, APIKey
+from quanxai.database import get_session, Tag, UsageLog, UsageLogTag, APIKeyTag
+from quanxai.services.tagging import key_counts_by_tag, usage_by_tag
 
 router = APIRouter()
 
@@ -63,23 +65,13 @@ def list_tags(
     query = query.order_by(Tag.name)
     tags = session.exec(query).all()
 
+    # Key counts and usage stats for every tag, one grouped query each
+    keys_counts = key_counts_by_tag(session)
+    usage = usage_by_tag(session, datetime.utcnow() - timedelta(days=30))
+
     result = []
     for tag in tags:
-        # Count keys with this tag
-        keys_count = session.exec(
-            select(func.count(APIKey.id))
-            .where(APIKey.tags.contains(tag.id))
-        ).first() or 0
-
-        # Get usage stats for this tag
-        usage_stats = session.exec(
-            select(
-                func.count(UsageLog.id).label("requests"),
-                func.sum(UsageLog.total_cost_usd).label("spend"),
-            )
-            .where(UsageLog.tags.contains(tag.id))
-            .where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=30))
-        ).first()
+        usage_stats = usage.get(tag.id)
 
         result.append(TagResponse(
             id=tag.id,
@@ -87,9 +79,9 @@ def list_tags(
             description=tag.description,
             color=tag.color,
             organization_id=tag.organization_id,
-            keys_count=keys_count,
-            requests_count=usage_stats.requests or 0,
-            total_spend=float(usage_stats.spend or 0),
+            keys_count=keys_counts.get(tag.id, 0),
+            requests_count=usage_stats.requests if usage_stats else 0,
+            total_spend=float(usage_stats.spend or 0) if usage_stats else 0.0,
             created_at=tag.created_at,
             updated_at=tag.updated_at,
             is_active=tag.is_active,
@@ -107,23 +99,16 @@ def get_tag_metrics(session: Session = Depends(get_session)):
 
     # Get total tagged requests and spend
     tags = session.exec(select(Tag).where(Tag.is_active == True)).all()
+    usage = usage_by_tag(session, datetime.utcnow() - timedelta(days=30))
 
     total_requests = 0
     total_spend = 0.0
     most_used_tag = {"name": "None", "requests_count": 0}
 
     for tag in tags:
-        usage_stats = session.exec(
-            select(
-                func.count(UsageLog.id).label("requests"),
-                func.sum(UsageLog.total_cost_usd).label("spend"),
-            )
-            .where(UsageLog.tags.contains(tag.id))
-            .where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=30))
-        ).first()
-
-        requests = usage_stats.requests or 0
-        spend = float(usage_stats.spend or 0)
+        usage_stats = usage.get(tag.id)
+        requests = usage_stats.requests if usage_stats else 0
+        spend = float(usage_stats.spend or 0) if usage_stats else 0.0
 
         total_requests += requests
         total_spend += spend
@@ -191,14 +176,12 @@ def get_spend_by_tag(
     start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
 
     tags = session.exec(select(Tag).where(Tag.is_active == True)).all()
+    usage = usage_by_tag(session, start_date)
 
     result = []
     for tag in tags:
-        spend = session.exec(
-            select(func.sum(UsageLog.total_cost_usd))
-            .where(UsageLog.tags.contains(tag.id))
-            .where(UsageLog.created_at >= start_date)
-        ).first() or 0
+        usage_stats = usage.get(tag.id)
+        spend = (usage_stats.spend or 0) if usage_stats else 0
 
         result.append({
             "name": tag.name,
@@ -219,14 +202,12 @@ def get_requests_by_tag(
     start_date = end_date - timedelta(days=30 if range == "last30days" else 7)
 
     tags = session.exec(select(Tag).where(Tag.is_active == True)).all()
+    usage = usage_by_tag(session, start_date)
 
     result = []
     for tag in tags:
-        requests = session.exec(
-            select(func.count(UsageLog.id))
-            .where(UsageLog.tags.contains(tag.id))
-            .where(UsageLog.created_at >= start_date)
-        ).first() or 0
+        usage_stats = usage.get(tag.id)
+        requests = usage_stats.requests if usage_stats else 0
 
         result.append({
             "name": tag.name,
@@ -245,8 +226,8 @@ def get_tag(tag_id: str, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Tag not found")
 
     keys_count = session.exec(
-        select(func.count(APIKey.id))
-        .where(APIKey.tags.contains(tag.id))
+        select(func.count(APIKeyTag.api_key_id))
+        .where(APIKeyTag.tag_id == tag.id)
     ).first() or 0
 
     usage_stats = session.exec(
@@ -254,8 +235,10 @@ def get_tag(tag_id: str, session: Session = Depends(get_session)):
             func.count(UsageLog.id).label("requests"),
             func.sum(UsageLog.total_cost_usd).label("spend"),
         )
-        .where(UsageLog.tags.contains(tag.id))
-        .where(UsageLog.created_at >= datetime.utcnow() - timedelta(days=30))
+        .select_from(UsageLogTag)
+        .join(UsageLog, UsageLog.id == UsageLogTag.usage_log_id)
+        .where(UsageLogTag.tag_id == tag.id)
+        .where(UsageLogTag.created_at >= datetime.utcnow() - timedelta(days=30))
     ).first()
 
     return TagResponse(
@@ -309,6 +292,8 @@ def delete_tag(tag_id: str, session: Session = Depends(get_session)):
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
 
+    session.exec(delete(UsageLogTag).where(UsageLogTag.tag_id == tag_id))
+    session.exec(delete(APIKeyTag).where(APIKeyTag.tag_id == tag_id))
     session.delete(tag)
     session.commit()
 
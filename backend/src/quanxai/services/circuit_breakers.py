@@ -0,0 +1,218 @@
+"""Circuit breakers for upstream providers on the LLM proxy.
+
+Every provider and model (and region, for regional providers) gets a
+breaker that counts the outcomes of its upstream calls over the last
+CIRCUIT_WINDOW_S seconds. A call fails on a 5xx or 429 response, a
+timeout or connection error, or, with CIRCUIT_SLOW_CALL_MS set, by taking
+longer than that. Once at least CIRCUIT_MIN_REQUESTS calls are in the
+window and CIRCUIT_FAILURE_RATE of them failed, the breaker opens: calls
+are rejected at once with a 503 for CIRCUIT_OPEN_S, instead of each paying
+for the degraded upstream. It is then half-open and lets
+CIRCUIT_HALF_OPEN_PROBES calls through at a time; a successful probe closes
+it with a fresh window, a failed one opens it again.
+
+With CIRCUIT_BREAKERS_ENABLED false breakers only keep their statistics.
+State is per process and used from the event loop only.
+"""
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from quanxai.config import settings
+from quanxai.services.errors import ProxyError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Breakers kept before idle closed ones are dropped
+MAX_BREAKERS = 10_000
+
+
+def is_failure(status_code: int) -> bool:
+    """Whether an upstream status counts against the provider's health."""
+    return status_code >= 500 or status_code == 429
+
+
+class _Window:
+    """Call and failure counts over the last ``seconds``, in one-second buckets."""
+
+    def __init__(self, seconds: int):
+        self.seconds = max(1, seconds)
+        # [second, calls, failures]
+        self._buckets = [[-1, 0, 0] for _ in range(self.seconds)]
+
+    def add(self, failed: bool) -> None:
+        second = int(time.monotonic())
+        bucket = self._buckets[second % self.seconds]
+        if bucket[0] != second:
+            bucket[:] = [second, 0, 0]
+        bucket[1] += 1
+        bucket[2] += failed
+
+    def counts(self) -> Tuple[int, int]:
+        """Calls and failures in the window."""
+        now = int(time.monotonic())
+        calls = failures = 0
+        for second, n, failed in self._buckets:
+            if now - second < self.seconds:
+                calls += n
+                failures += failed
+        return calls, failures
+
+    def clear(self) -> None:
+        for bucket in self._buckets:
+            bucket[:] = [-1, 0, 0]
+
+
+class CircuitBreaker:
+    """Health of one upstream (provider, model, region)."""
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        region: Optional[str] = None,
+        enabled: bool = settings.CIRCUIT_BREAKERS_ENABLED,
+        window_s: int = settings.CIRCUIT_WINDOW_S,
+        min_requests: int = settings.CIRCUIT_MIN_REQUESTS,
+        failure_rate: float = settings.CIRCUIT_FAILURE_RATE,
+        open_s: float = settings.CIRCUIT_OPEN_S,
+        half_open_probes: int = settings.CIRCUIT_HALF_OPEN_PROBES,
+        slow_call_ms: Optional[int] = settings.CIRCUIT_SLOW_CALL_MS,
+    ):
+        self.provider = provider
+        self.model = model
+        self.region = region
+        self.enabled = enabled
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_s = open_s
+        self.half_open_probes = half_open_probes
+        self.slow_call_ms = slow_call_ms
+        self.window = _Window(window_s)
+        self.times_opened = 0
+        self._open_until: Optional[float] = None
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._open_until is None:
+            return CLOSED
+        return OPEN if time.monotonic() < self._open_until else HALF_OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a call through again."""
+        if self._open_until is None:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def available(self) -> bool:
+        """Whether a call would be let through now."""
+        state = self.state
+        return (
+            not self.enabled
+            or state == CLOSED
+            or (state == HALF_OPEN and self._probes < self.half_open_probes)
+        )
+
+    def _open(self) -> None:
+        self._open_until = time.monotonic() + self.open_s
+        self.times_opened += 1
+
+    def _record(self, failed: bool, probe: bool) -> None:
+        self.window.add(failed)
+        if not self.enabled:
+            return
+        if probe:
+            self._probes -= 1
+            if failed:
+                self._open()
+            else:
+                self._open_until = None
+                self.window.clear()
+            return
+        if self._open_until is not None or not failed:
+            return
+        calls, failures = self.window.counts()
+        if calls >= self.min_requests and failures >= self.failure_rate * calls:
+            self._open()
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """``send()`` through the breaker, recording its outcome.
+
+        Raises a 503 ProxyError without calling it while the breaker is open.
+        """
+        if not self.available():
+            raise circuit_open_error(self)
+        probe = self.enabled and self.state == HALF_OPEN
+        if probe:
+            self._probes += 1
+        started = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError:
+            self._record(True, probe)
+            raise
+        except BaseException:
+            if probe:
+                self._probes -= 1
+            raise
+        slow = self.slow_call_ms is not None and (time.perf_counter() - started) * 1000 > self.slow_call_ms
+        self._record(is_failure(response.status_code) or slow, probe)
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls, failures = self.window.counts()
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "region": self.region,
+            "state": self.state,
+            "requests": calls,
+            "failures": failures,
+            "failure_rate": round(failures / calls, 4) if calls else 0.0,
+            "retry_after_s": round(self.retry_after(), 2),
+            "times_opened": self.times_opened,
+        }
+
+
+def circuit_open_error(breaker: CircuitBreaker) -> ProxyError:
+    """503 for a call rejected by an open breaker."""
+    where = f" in {breaker.region}" if breaker.region else ""
+    return ProxyError(
+        503,
+        f"Provider '{breaker.provider}' is failing for model '{breaker.model}'{where}; try again later",
+        type="api_error",
+        code="circuit_open",
+        headers={"Retry-After": str(max(1, math.ceil(breaker.retry_after())))},
+    )
+
+
+class CircuitBreakers:
+    """The breakers of every upstream seen so far."""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str, Optional[str]], CircuitBreaker] = {}
+
+    def get(self, provider: str, model: str, region: Optional[str] = None) -> CircuitBreaker:
+        breaker = self._breakers.get((provider, model, region))
+        if breaker is None:
+            if len(self._breakers) >= MAX_BREAKERS:
+                self._prune()
+            breaker = self._breakers[(provider, model, region)] = CircuitBreaker(provider, model, region)
+        return breaker
+
+    def _prune(self) -> None:
+        for key, breaker in list(self._breakers.items()):
+            if breaker.state == CLOSED and breaker.window.counts()[0] == 0:
+                del self._breakers[key]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """State and window counts of every breaker, unhealthy ones first."""
+        order = {OPEN: 0, HALF_OPEN: 1, CLOSED: 2}
+        snapshots = [breaker.snapshot() for breaker in self._breakers.values()]
+        snapshots.sort(key=lambda s: (order[s["state"]], s["provider"], s["model"], s["region"] or ""))
+        return snapshots
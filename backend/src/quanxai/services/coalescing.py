@@ -0,0 +1,86 @@
+"""Single-flight coalescing of identical concurrent upstream requests.
+
+Batch jobs and CI pipelines send byte-identical prompts at the same moment,
+before the first response can reach the response cache. The proxy keys
+upstream calls by the request's cache key: while one is in flight, callers
+with the same key wait for its result instead of sending their own.
+Streamed requests join the SharedStream in flight if it has not sent its
+first chunk yet, and get every chunk from its start. Each caller still
+logs and pays for the response it receives.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import httpx
+
+from quanxai.services.streaming import SharedStream
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class SingleFlight:
+    """In-flight calls by key, shared between the callers that want them.
+
+    The call runs in its own task, so a caller that is cancelled does not
+    cancel it for the others; it is only cancelled when no caller is left.
+    Used from the event loop only.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._streams: Dict[Hashable, SharedStream] = {}
+
+    def _done(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Optional[Hashable], fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Result of ``fn()``, or of the call already in flight for ``key``.
+
+        Also returns whether the result is shared, i.e. the caller joined a
+        call another caller started. Without a key ``fn()`` is not shared.
+        """
+        if key is None:
+            return await fn(), False
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _: self._done(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    def stream(
+        self,
+        key: Optional[Hashable],
+        open_stream: Callable[[], Awaitable[httpx.Response]],
+    ) -> Tuple[SharedStream, bool]:
+        """The joinable stream in flight for ``key``, or a new one.
+
+        Also returns whether the stream was joined rather than started; the
+        caller must hold() it before awaiting. Without a key the stream is
+        not shared.
+        """
+        shared = self._streams.get(key) if key is not None else None
+        joined = shared is not None and shared.joinable
+        if not joined:
+            shared = SharedStream(open_stream)
+            if key is not None:
+                self._streams[key] = shared
+                shared.task.add_done_callback(lambda _: self._stream_done(key, shared))
+        return shared, joined
+
+    def _stream_done(self, key: Hashable, shared: SharedStream) -> None:
+        if self._streams.get(key) is shared:
+            del self._streams[key]
@@ -0,0 +1,43 @@
+"""Errors raised on the LLM proxy path.
+
+The proxy answers failures in the OpenAI error format,
+``{"error": {"message", "type", "code"}}``, so OpenAI clients surface them
+as they would an upstream error.
+"""
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+class ProxyError(Exception):
+    """A request the proxy rejects or cannot complete."""
+
+    def __init__(
+        self,
+        status_code: int,
+        message: str,
+        type: str = "invalid_request_error",
+        code: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.type = type
+        self.code = code
+        self.headers = headers
+
+
+def error_response(exc: ProxyError) -> JSONResponse:
+    """OpenAI-style error response for a ProxyError."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": {"message": exc.message, "type": exc.type, "code": exc.code}},
+        headers=exc.headers,
+    )
+
+
+async def proxy_error_handler(request: Request, exc: ProxyError) -> JSONResponse:
+    """Exception handler rendering uncaught ProxyErrors."""
+    return error_response(exc)
@@ -0,0 +1,177 @@
+"""Streaming bulk exports in NDJSON, CSV or Parquet.
+
+Rows are read from a server-side cursor in batches and encoded as they
+arrive, so memory stays constant however large the result set is. The
+generators are synchronous; Starlette pulls them from a worker thread one
+chunk at a time, so a slow client holds back the database read instead of
+letting output pile up in memory.
+"""
+import csv
+import io
+import json
+import typing
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from quanxai.database.engine import engine
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = 5000
+
+
+class ExportFormat(str, Enum):
+    """Supported export encodings."""
+    ndjson = "ndjson"
+    csv = "csv"
+    parquet = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
+
+# A batch of ORM rows -> the exported records for it, as dicts
+RowsFn = Callable[[Session, Sequence[Any]], List[Dict[str, Any]]]
+
+
+def _plain_type(annotation: Any) -> Any:
+    """Field type with Optional stripped; containers collapse to dict."""
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if typing.get_origin(annotation) is typing.Union and len(args) == 1:
+        annotation = args[0]
+    if typing.get_origin(annotation) in (list, dict) or annotation in (list, dict):
+        return dict
+    return annotation
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _cell(value: Any) -> Any:
+    """Flat value for CSV and Parquet cells; nested values become JSON."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def iter_batches(query: Any, rows: RowsFn, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Exported records of ``query``, one batch at a time.
+
+    Opens its own session because the response body is produced after the
+    request's session has been closed.
+    """
+    with Session(engine) as session:
+        result = session.exec(query.execution_options(yield_per=batch_size))
+        # The identity map only holds rows weakly, so each batch is freed
+        # once it has been encoded
+        for partition in result.partitions():
+            yield rows(session, partition)
+
+
+def _ndjson(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(r, default=_json_default) + "\n" for r in batch).encode()
+
+
+def _csv(batches: Iterator[List[Dict[str, Any]]], fields: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in batches:
+        for r in batch:
+            writer.writerow([
+                v.isoformat() if isinstance(v, datetime) else _cell(v)
+                for v in (r[f] for f in fields)
+            ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow_schema(model: type) -> "pa.Schema":
+    types = {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_(),
+             datetime: pa.timestamp("us"), dict: pa.string()}
+    return pa.schema([
+        (name, types.get(_plain_type(field.annotation), pa.string()))
+        for name, field in model.model_fields.items()
+    ])
+
+
+def _parquet(batches: Iterator[List[Dict[str, Any]]], model: type) -> Iterator[bytes]:
+    # One row group per batch, flushed to the client as soon as it is written
+    schema = _arrow_schema(model)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            columns = {name: [_cell(r[name]) for r in batch] for name in schema.names}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_response(
+    query: Any,
+    rows: RowsFn,
+    model: type,
+    format: ExportFormat,
+    filename: str,
+) -> StreamingResponse:
+    """Stream ``query`` as an attachment; columns follow ``model``'s fields."""
+    if format == ExportFormat.parquet and pq is None:
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+
+    batches = iter_batches(query, rows)
+    if format == ExportFormat.ndjson:
+        body = _ndjson(batches)
+    elif format == ExportFormat.csv:
+        body = _csv(batches, list(model.model_fields))
+    else:
+        body = _parquet(batches, model)
+
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format.value}"'},
+    )
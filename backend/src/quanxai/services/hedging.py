@@ -0,0 +1,148 @@
+"""Hedged upstream requests for models with a long latency tail."""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from quanxai.config import settings
+from quanxai.services.circuit_breakers import is_failure
+from quanxai.services.sketch import LatencySketch
+
+# Which call answered a hedged request, in its response's extensions
+HEDGE_EXTENSION = "quanxai.hedge"
+
+# Region the other call of a hedged Bedrock request was sent to
+HEDGE_REGION_EXTENSION = "quanxai.hedge_region"
+
+# Hedges a model can save up while it is not hedging
+HEDGE_BURST = 10.0
+
+# How often the hedge delay of a model is recomputed from its sketches
+DELAY_REFRESH_S = 1.0
+
+
+@dataclass
+class _ModelLatency:
+    current: LatencySketch = field(default_factory=LatencySketch)
+    previous: LatencySketch = field(default_factory=LatencySketch)
+    rotated_at: float = field(default_factory=time.monotonic)
+    delay_s: Optional[float] = None
+    delay_at: float = 0.0
+    credit: float = 0.0
+
+
+class Hedger:
+    """Per-model hedge delays and budgets, and the hedged call itself.
+
+    The delay is the model's HEDGE_QUANTILE latency over the last one to
+    two HEDGE_WINDOW_S, once HEDGE_MIN_SAMPLES are in. Each request earns
+    HEDGE_MAX_RATE of a hedge, and a hedge is only sent when a whole one is
+    available. Used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        models=settings.HEDGE_MODELS,
+        quantile: float = settings.HEDGE_QUANTILE,
+        max_rate: float = settings.HEDGE_MAX_RATE,
+        min_samples: int = settings.HEDGE_MIN_SAMPLES,
+        window_s: float = settings.HEDGE_WINDOW_S,
+    ):
+        self.models = set(models)
+        self.quantile = quantile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window_s = window_s
+        self._latency: Dict[str, _ModelLatency] = {}
+        self.hedges = 0
+
+    def applies(self, model: str) -> bool:
+        """Whether requests for a model are hedged."""
+        return "*" in self.models or model in self.models
+
+    def _model(self, model: str) -> _ModelLatency:
+        latency = self._latency.get(model)
+        if latency is None:
+            latency = self._latency[model] = _ModelLatency()
+        return latency
+
+    def observe(self, model: str, latency_ms: float) -> None:
+        """Add an upstream latency of a model to its rolling window."""
+        latency = self._model(model)
+        now = time.monotonic()
+        if now - latency.rotated_at >= self.window_s:
+            latency.previous, latency.current = latency.current, LatencySketch()
+            latency.rotated_at = now
+        latency.current.add(latency_ms)
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging a request for a model, if known."""
+        latency = self._model(model)
+        now = time.monotonic()
+        if now - latency.delay_at >= DELAY_REFRESH_S:
+            sketch = LatencySketch()
+            sketch.merge(latency.current)
+            sketch.merge(latency.previous)
+            latency.delay_s = sketch.quantile(self.quantile) / 1000 if sketch.count >= self.min_samples else None
+            latency.delay_at = now
+        return latency.delay_s
+
+    async def call(
+        self,
+        model: str,
+        primary: Callable[[], Awaitable[httpx.Response]],
+        hedge: Optional[Callable[[], Awaitable[httpx.Response]]],
+    ) -> httpx.Response:
+        """``primary()``, hedged with ``hedge()`` if it is slow and the budget allows.
+
+        A hedged response says which call it came from under HEDGE_EXTENSION.
+        Without ``hedge`` the call is only timed.
+        """
+        latency = self._model(model)
+        latency.credit = min(latency.credit + self.max_rate, HEDGE_BURST)
+        delay = self.delay(model)
+        started = time.perf_counter()
+        first = asyncio.ensure_future(primary())
+        second = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done or hedge is None or latency.credit < 1:
+                response = await first
+                if not is_failure(response.status_code):
+                    self.observe(model, (time.perf_counter() - started) * 1000)
+                return response
+
+            latency.credit -= 1
+            self.hedges += 1
+            second = asyncio.ensure_future(hedge())
+            pending = {first, second}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in (first, second) if task in done and _good(task)), None)
+                if winner is not None or not pending:
+                    break
+            for task in pending:
+                task.cancel()
+        except BaseException:
+            first.cancel()
+            if second is not None:
+                second.cancel()
+            raise
+
+        if winner is not None:
+            # The primary's latency, or a lower bound of it if it lost
+            self.observe(model, (time.perf_counter() - started) * 1000)
+        else:
+            # Both failed; answer with the primary's failure
+            winner = first
+        response = winner.result()
+        response.extensions[HEDGE_EXTENSION] = "primary" if winner is first else "hedge"
+        return response
+
+
+def _good(task: asyncio.Future) -> bool:
+    if task.cancelled() or task.exception() is not None:
+        return False
+    return not is_failure(task.result().status_code)
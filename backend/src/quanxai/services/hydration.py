@@ -0,0 +1,41 @@
+"""Batched lookups of related rows for list endpoints.
+
+List endpoints collect the foreign IDs on a page of results and resolve each
+entity type with one ``IN`` query, instead of a ``session.get`` per row.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlmodel import Session, select
+
+# Stay well under SQLite's bound-parameter limit
+IN_BATCH_SIZE = 500
+
+
+def _distinct_ids(ids: Iterable[Optional[str]]) -> List[str]:
+    return list(dict.fromkeys(i for i in ids if i))
+
+
+def load_by_ids(session: Session, model: Any, ids: Iterable[Optional[str]]) -> Dict[str, Any]:
+    """Rows of ``model`` keyed by id; None and unknown IDs are skipped."""
+    wanted = _distinct_ids(ids)
+    rows = {}
+    for i in range(0, len(wanted), IN_BATCH_SIZE):
+        batch = wanted[i:i + IN_BATCH_SIZE]
+        for row in session.exec(select(model).where(model.id.in_(batch))).all():
+            rows[row.id] = row
+    return rows
+
+
+def load_values(session: Session, column: Any, ids: Iterable[Optional[str]]) -> Dict[str, Any]:
+    """One column of the rows with the given IDs, keyed by id.
+
+    ``column`` is a model attribute such as ``Team.name``; only the id and
+    that column are selected.
+    """
+    model = column.class_
+    wanted = _distinct_ids(ids)
+    values = {}
+    for i in range(0, len(wanted), IN_BATCH_SIZE):
+        batch = wanted[i:i + IN_BATCH_SIZE]
+        values.update(session.exec(select(model.id, column).where(model.id.in_(batch))).all())
+    return values
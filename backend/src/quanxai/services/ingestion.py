@@ -0,0 +1,171 @@
+"""Write-behind ingestion of usage logs, AWS usage logs and guardrail violations.
+
+Request handlers put records on an in-memory queue and move on; a single
+writer task drains it in batches, flushing once INGEST_BATCH_SIZE records
+are waiting or INGEST_FLUSH_INTERVAL_MS after the first of them arrived, so
+that many requests share one transaction. While a flush runs the next batch
+builds up, so batches grow with load. A full queue makes producers wait
+rather than letting memory grow. close() flushes whatever is still queued.
+
+A batch that keeps failing is written in halves, recursively, so that only
+the records that fail on their own (a foreign key violation, say) are
+dropped and logged.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from quanxai.config import settings
+from quanxai.services.usage_recorder import write_records
+
+logger = logging.getLogger(__name__)
+
+# Attempts per batch before it is split to isolate the failing records
+FLUSH_ATTEMPTS = 3
+
+_STOP = object()
+
+
+class IngestionQueue:
+    """Buffers records and writes them in batches from a background task."""
+
+    def __init__(
+        self,
+        max_size: int = settings.INGEST_QUEUE_SIZE,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        flush_interval_ms: int = settings.INGEST_FLUSH_INTERVAL_MS,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.producer_waits = 0
+        self.flushes = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def start(self) -> None:
+        """Start the writer task on the running event loop."""
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, record: Any) -> None:
+        """Queue a record for writing, waiting while the queue is full."""
+        if self._closed:
+            raise RuntimeError("Ingestion queue is closed")
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.producer_waits += 1
+            await self._queue.put(record)
+        self.enqueued += 1
+
+    async def close(self) -> None:
+        """Stop accepting records and flush everything already queued."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            record = await self._queue.get()
+            if record is _STOP:
+                return
+            batch = [record]
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Any]) -> None:
+        started = time.perf_counter()
+        written = len(batch)
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                await run_in_threadpool(write_records, batch)
+                break
+            except Exception:
+                if attempt == FLUSH_ATTEMPTS:
+                    logger.warning(
+                        "Flush of %d records failed %d times; writing it in parts", len(batch), attempt,
+                        exc_info=True,
+                    )
+                    written = await self._split(batch)
+                    break
+                logger.warning("Flush of %d records failed, retrying", len(batch), exc_info=True)
+                await asyncio.sleep(0.1 * attempt)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.written += written
+        self.flushes += 1
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._flush_ms_total += elapsed_ms
+
+    async def _split(self, batch: List[Any]) -> int:
+        """Write the halves of a failed batch, down to single records; returns how many were written.
+
+        Halves keep the batch's order, so records written before the ones
+        that refer to them still are.
+        """
+        middle = len(batch) // 2
+        written = 0
+        for part in (batch[:middle], batch[middle:]):
+            try:
+                await run_in_threadpool(write_records, part)
+                written += len(part)
+            except Exception:
+                if len(part) > 1:
+                    written += await self._split(part)
+                else:
+                    record = part[0]
+                    logger.exception("Dropped %s %s", type(record).__name__, getattr(record, "id", None))
+                    self.dropped += 1
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, throughput counters and flush latency."""
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self.max_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "producer_waits": self.producer_waits,
+            "flushes": self.flushes,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._flush_ms_total / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
@@ -0,0 +1,266 @@
+"""Virtual key authentication for the LLM proxy.
+
+A request's bearer token is hashed and resolved to a KeyContext: an
+immutable snapshot of the key with the team and organization its usage is
+billed to, so the hot path never holds ORM objects. Resolved snapshots are
+cached in-process, so authenticating a known key is a dict lookup.
+
+Changed keys are evicted at once in the process that changed them. With
+the redis rate limit backend, KeyInvalidations broadcasts the eviction to
+every worker; without it, other workers cache snapshots for only
+KEY_CACHE_LOCAL_TTL_S, which bounds how long they can serve a stale key.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, Optional, Set, Tuple
+
+from sqlmodel import Session, select, func
+
+from quanxai.config import settings
+from quanxai.database import APIKey, Team, User, run_in_session
+from quanxai.services.errors import ProxyError
+
+logger = logging.getLogger(__name__)
+
+# Redis channel that key invalidations are broadcast on
+INVALIDATION_CHANNEL = "quanxai:keys:invalidate"
+
+
+def hash_key(raw_key: str) -> str:
+    """Stored hash of a raw API key."""
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class KeyContext:
+    """What the proxy needs to know about an authenticated key."""
+    id: str
+    organization_id: str
+    team_id: Optional[str]
+    user_id: Optional[str]
+    tags: Tuple[str, ...]
+    allowed_models: Optional[FrozenSet[str]]
+    rate_limit_rpm: int
+    rate_limit_tpm: int
+    max_parallel_requests: int
+    max_budget_usd: float
+    spent_usd: float
+    expires_at: Optional[datetime]
+    is_active: bool
+    is_blocked: bool
+
+
+def load_key_context(session: Session, key_hash: str) -> Optional[KeyContext]:
+    """KeyContext for a key hash, or None if no key has it.
+
+    Team- and user-level keys inherit the organization of their team.
+    """
+    row = session.exec(
+        select(APIKey, User.team_id, Team.organization_id)
+        .outerjoin(User, User.id == APIKey.user_id)
+        .outerjoin(Team, Team.id == func.coalesce(APIKey.team_id, User.team_id))
+        .where(APIKey.key_hash == key_hash)
+    ).first()
+    if row is None:
+        return None
+
+    key, user_team_id, team_organization_id = row
+    return KeyContext(
+        id=key.id,
+        organization_id=key.organization_id or team_organization_id,
+        team_id=key.team_id or user_team_id,
+        user_id=key.user_id,
+        tags=tuple(json.loads(key.tags)) if key.tags else (),
+        allowed_models=frozenset(json.loads(key.allowed_models)) if key.allowed_models else None,
+        rate_limit_rpm=key.rate_limit_rpm,
+        rate_limit_tpm=key.rate_limit_tpm,
+        max_parallel_requests=key.max_parallel_requests,
+        max_budget_usd=key.max_budget_usd,
+        spent_usd=key.spent_usd,
+        expires_at=key.expires_at,
+        is_active=key.is_active,
+        is_blocked=key.is_blocked,
+    )
+
+
+class KeyCache:
+    """Key hash -> KeyContext snapshots with a TTL.
+
+    Unknown hashes are cached as None for a shorter TTL so that bad keys do
+    not reach the database on every request. The key admin endpoints call
+    invalidate() after committing, which takes effect immediately in this
+    process and is passed on to ``broadcast``, if set, for the others.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[Optional[KeyContext], float]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; lookups that started before one
+        # must not cache what they read
+        self.generation = 0
+        self.broadcast: Optional[Callable[[str], None]] = None
+
+    def get(self, key_hash: str) -> Tuple[bool, Optional[KeyContext]]:
+        """(hit, snapshot); a hit with None means the key is known not to exist."""
+        entry = self._entries.get(key_hash)
+        if entry is None or entry[1] <= time.monotonic():
+            return False, None
+        return True, entry[0]
+
+    def put(self, key_hash: str, key: Optional[KeyContext], generation: int) -> None:
+        """Cache a lookup result read while the cache was at ``generation``."""
+        ttl = self.ttl if key is not None else self.negative_ttl
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key_hash not in self._entries and len(self._entries) >= self.max_size:
+                # Evict the oldest entry
+                oldest = next(iter(self._entries))
+                oldest_key = self._entries.pop(oldest)[0]
+                if oldest_key is not None:
+                    self._hashes.pop(oldest_key.id, None)
+            self._entries[key_hash] = (key, time.monotonic() + ttl)
+            if key is not None:
+                self._hashes[key.id] = key_hash
+
+    def invalidate(self, key_id: str, broadcast: bool = True) -> None:
+        """Drop the snapshot of a key that was changed or deleted."""
+        with self._lock:
+            self.generation += 1
+            key_hash = self._hashes.pop(key_id, None)
+            if key_hash is not None:
+                self._entries.pop(key_hash, None)
+        if broadcast and self.broadcast is not None:
+            self.broadcast(key_id)
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._hashes.clear()
+
+
+key_cache = KeyCache(
+    settings.KEY_CACHE_TTL_S if settings.RATE_LIMIT_BACKEND == "redis" else settings.KEY_CACHE_LOCAL_TTL_S,
+    settings.KEY_CACHE_NEGATIVE_TTL_S,
+    settings.KEY_CACHE_MAX_SIZE,
+)
+
+
+class KeyInvalidations:
+    """Key invalidations shared between workers over Redis pub/sub.
+
+    Every invalidation in this process is published, and every one
+    received, including this process's own, evicts the key here. When the
+    subscription drops, invalidations may be missed, so the cache is
+    cleared once it is back. Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, cache: KeyCache, url: str, channel: str = INVALIDATION_CHANNEL):
+        from redis.asyncio import Redis
+
+        self.cache = cache
+        self.redis = Redis.from_url(url)
+        self.channel = channel
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._publishing: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._listen())
+        self.cache.broadcast = self.publish
+
+    def publish(self, key_id: str) -> None:
+        """Broadcast an invalidation; callable from the event loop or a thread."""
+        self._loop.call_soon_threadsafe(self._publish, key_id)
+
+    def _publish(self, key_id: str) -> None:
+        task = asyncio.ensure_future(self._send(key_id))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _send(self, key_id: str) -> None:
+        try:
+            await self.redis.publish(self.channel, key_id)
+        except Exception:
+            logger.warning("Could not broadcast invalidation of key %s", key_id, exc_info=True)
+
+    async def _listen(self) -> None:
+        subscribed_before = False
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    if subscribed_before:
+                        self.cache.clear()
+                    subscribed_before = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.cache.invalidate(message["data"].decode(), broadcast=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Key invalidation subscription lost; retrying", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def aclose(self) -> None:
+        self.cache.broadcast = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+        await self.redis.aclose()
+
+
+async def resolve_key(raw_key: str) -> Optional[KeyContext]:
+    """KeyContext for a raw key, from the cache or else the database."""
+    key_hash = hash_key(raw_key)
+    hit, key = key_cache.get(key_hash)
+    if hit:
+        return key
+    generation = key_cache.generation
+    key = await run_in_session(load_key_context, key_hash)
+    key_cache.put(key_hash, key, generation)
+    return key
+
+
+def bearer_token(authorization: Optional[str]) -> str:
+    """The raw key from an ``Authorization: Bearer`` header."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise ProxyError(401, "Missing API key; pass it as 'Authorization: Bearer <key>'",
+                         type="authentication_error", code="missing_api_key")
+    return token.strip()
+
+
+def check_key(key: Optional[KeyContext], model: str) -> KeyContext:
+    """Reject unknown, disabled or expired keys and disallowed models.
+
+    Budgets are enforced separately against live spend (services.spend).
+    """
+    if key is None:
+        raise ProxyError(401, "Invalid API key", type="authentication_error", code="invalid_api_key")
+    if not key.is_active or key.is_blocked:
+        raise ProxyError(403, "API key is blocked", type="permission_error", code="key_blocked")
+    if key.expires_at is not None and key.expires_at <= datetime.utcnow():
+        raise ProxyError(401, "API key has expired", type="authentication_error", code="key_expired")
+    if key.allowed_models is not None and model not in key.allowed_models:
+        raise ProxyError(403, f"API key is not allowed to use model '{model}'",
+                         type="permission_error", code="model_not_allowed")
+    return key
@@ -0,0 +1,65 @@
+"""Keyset (cursor) pagination for newest-first listings.
+
+Pages are ordered by ``(created_at desc, id desc)``. A cursor is an opaque
+token encoding the last row's ``(created_at, id)``; the next page starts
+strictly after it, so deep pages cost the same as the first one and rows
+inserted meanwhile do not shift results. Offset paging is still supported
+for existing callers.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlmodel import Session
+
+# Response header carrying the cursor of the next page, when there is one
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    """Opaque cursor for the position after a row."""
+    raw = json.dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def paginate(
+    session: Session,
+    query: Any,
+    model: Any,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """Run a newest-first page of ``query`` over ``model``.
+
+    Uses the cursor when given, otherwise ``offset``. Returns the rows and
+    the cursor of the next page (None on the last page).
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    elif offset:
+        query = query.offset(offset)
+
+    rows = session.exec(
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+    ).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.created_at, last.id)
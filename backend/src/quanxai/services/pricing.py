@@ -0,0 +1,29 @@
+"""Model prices used to cost proxied requests."""
+from typing import Dict, Optional, Tuple
+
+# USD per 1M tokens: input, output
+MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "claude-3-sonnet": (3.0, 15.0),
+    "claude-3-haiku": (0.25, 1.25),
+    "bedrock/claude-3-sonnet": (3.0, 15.0),
+    "bedrock/claude-3-haiku": (0.25, 1.25),
+    "llama-3-70b": (0.9, 0.9),
+    "gemini-pro": (0.5, 1.5),
+}
+
+
+def token_costs(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    prices: Optional[Tuple[float, float]] = None,
+) -> Tuple[float, float]:
+    """Prompt and completion cost in USD; unpriced models cost nothing.
+
+    ``prices`` (USD per 1M tokens) take precedence over MODEL_PRICING.
+    """
+    input_price, output_price = prices or MODEL_PRICING.get(model, (0.0, 0.0))
+    return prompt_tokens / 1_000_000 * input_price, completion_tokens / 1_000_000 * output_price
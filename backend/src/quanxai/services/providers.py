@@ -0,0 +1,161 @@
+"""Upstream LLM providers and their pooled HTTP clients.
+
+Every provider speaks the OpenAI chat completions API and gets one
+long-lived ``httpx.AsyncClient`` for the life of the app, so requests reuse
+warm keep-alive (and, where available, HTTP/2) connections instead of
+paying a TCP/TLS handshake each time. Regional providers (AWS Bedrock)
+have a base URL per region and one client per region, created when a
+request is first routed there (see services.regions).
+"""
+import importlib.util
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from quanxai.config import settings
+from quanxai.services.errors import ProxyError
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Base URL of the in-process mock provider
+MOCK_PROVIDER_BASE_URL = "http://mock-provider/v1"
+# Tells the mock provider which region it is serving as
+MOCK_REGION_HEADER = "x-mock-region"
+
+# Model name prefixes and the provider serving them; a "provider/model"
+# name picks the provider explicitly
+MODEL_PREFIXES = {
+    "gpt-": "openai",
+    "o1": "openai",
+    "o3": "openai",
+    "claude-": "anthropic",
+    "mock": "mock",
+    # Bedrock model IDs
+    "anthropic.": "bedrock",
+    "meta.": "bedrock",
+    "amazon.": "bedrock",
+    "mistral.": "bedrock",
+    "cohere.": "bedrock",
+}
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    """Where and how to reach one upstream provider."""
+    name: str
+    base_url: str
+    api_key: Optional[str] = None
+    # Regional providers: "{region}" in base_url is replaced by the region
+    # a request goes to, this one when it names none
+    default_region: Optional[str] = None
+
+
+def configured_providers() -> Dict[str, ProviderConfig]:
+    """Providers enabled by settings; the mock provider is always available.
+
+    Bedrock is served by the mock provider until BEDROCK_API_KEY is set.
+    """
+    mock_url = settings.MOCK_PROVIDER_URL or MOCK_PROVIDER_BASE_URL
+    providers = {
+        "mock": ProviderConfig("mock", mock_url),
+        "bedrock": ProviderConfig(
+            "bedrock",
+            settings.BEDROCK_BASE_URL if settings.BEDROCK_API_KEY else mock_url,
+            settings.BEDROCK_API_KEY,
+            default_region=settings.BEDROCK_DEFAULT_REGION,
+        ),
+    }
+    if settings.OPENAI_API_KEY:
+        providers["openai"] = ProviderConfig("openai", settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY)
+    if settings.ANTHROPIC_API_KEY:
+        providers["anthropic"] = ProviderConfig("anthropic", settings.ANTHROPIC_BASE_URL, settings.ANTHROPIC_API_KEY)
+    return providers
+
+
+def resolve_model(model: str, providers: Dict[str, ProviderConfig]) -> Tuple[str, str]:
+    """Provider name and upstream model name for a requested model."""
+    provider, _, upstream_model = model.partition("/")
+    if upstream_model and provider in providers:
+        return provider, upstream_model
+    for prefix, provider in MODEL_PREFIXES.items():
+        if model.startswith(prefix) and provider in providers:
+            return provider, model
+    if settings.PROXY_DEFAULT_PROVIDER in providers:
+        return settings.PROXY_DEFAULT_PROVIDER, model
+    raise ProxyError(400, f"No provider is configured for model '{model}'", code="model_not_found")
+
+
+class ProviderPool:
+    """One pooled AsyncClient per provider (and region), created at startup.
+
+    ``clients`` holds each provider's client, in its default region for
+    regional providers; clients of other regions are added on first use.
+    """
+
+    def __init__(self, providers: Optional[Dict[str, ProviderConfig]] = None):
+        self.providers = providers if providers is not None else configured_providers()
+        self.clients: Dict[str, httpx.AsyncClient] = {
+            name: self._client(config, config.default_region) for name, config in self.providers.items()
+        }
+        self._regional: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+
+    @staticmethod
+    def _client(config: ProviderConfig, region: Optional[str] = None) -> httpx.AsyncClient:
+        headers = {"Content-Type": "application/json"}
+        if config.api_key:
+            headers["Authorization"] = f"Bearer {config.api_key}"
+        timeout = httpx.Timeout(settings.UPSTREAM_TIMEOUT_S, connect=settings.UPSTREAM_CONNECT_TIMEOUT_S)
+        base_url = config.base_url.format(region=region) if region else config.base_url
+        if region and base_url in (MOCK_PROVIDER_BASE_URL, settings.MOCK_PROVIDER_URL):
+            headers[MOCK_REGION_HEADER] = region
+
+        if base_url == MOCK_PROVIDER_BASE_URL:
+            from quanxai.mock_provider import app as mock_app
+            return httpx.AsyncClient(
+                base_url=base_url, headers=headers, timeout=timeout,
+                transport=httpx.ASGITransport(app=mock_app),
+            )
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            http2=settings.UPSTREAM_HTTP2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+
+    def resolve(self, model: str) -> Tuple[str, str]:
+        """Provider name and upstream model name for a requested model."""
+        return resolve_model(model, self.providers)
+
+    def client(self, provider: str, region: Optional[str] = None) -> httpx.AsyncClient:
+        """The pooled client of a provider, or of one region of a regional provider."""
+        config = self.providers[provider]
+        if region is None or region == config.default_region or config.default_region is None:
+            return self.clients[provider]
+        client = self._regional.get((provider, region))
+        if client is None:
+            client = self._regional[(provider, region)] = self._client(config, region)
+        return client
+
+    async def post(self, provider: str, path: str, content: bytes, region: Optional[str] = None) -> httpx.Response:
+        """POST a JSON body to a provider over its pooled client."""
+        return await self.client(provider, region).post(path.lstrip("/"), content=content)
+
+    async def stream(self, provider: str, path: str, content: bytes, region: Optional[str] = None) -> httpx.Response:
+        """POST a JSON body and return as soon as the response headers arrive.
+
+        The caller reads the body as it streams and must close the response.
+        """
+        client = self.client(provider, region)
+        return await client.send(client.build_request("POST", path.lstrip("/"), content=content), stream=True)
+
+    async def aclose(self) -> None:
+        """Close every client and its connections."""
+        for client in [*self.clients.values(), *self._regional.values()]:
+            await client.aclose()
@@ -0,0 +1,221 @@
+"""Per-key rate limits for the LLM proxy.
+
+Each virtual key gets two token buckets, refilled continuously over a
+minute: one of ``rate_limit_rpm`` requests and one of ``rate_limit_tpm``
+tokens, plus a cap of ``max_parallel_requests`` requests in flight. A
+request takes one request token when admitted; its LLM tokens are only
+known once the provider answers, so they are charged on release and may
+leave the token bucket in debt, which holds back the key's next requests
+until it refills. A limit of 0 or less is not enforced.
+
+Limits are read from the cached KeyContext, so enforcing them never touches
+the database. MemoryRateLimiter keeps the buckets per process;
+RedisRateLimiter keeps them in Redis so that every worker shares them.
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from quanxai.config import settings
+from quanxai.services.errors import ProxyError
+from quanxai.services.keys import KeyContext
+
+# A key's buckets are full again after a minute without requests, at which
+# point forgetting them loses nothing
+IDLE_TTL_S = 60.0
+
+
+def rate_limit_error(message: str, retry_after: float) -> ProxyError:
+    """429 telling the client how many seconds to wait."""
+    return ProxyError(
+        429, message, type="rate_limit_error", code="rate_limit_exceeded",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class RateLimiter:
+    """Admits requests per key; this base class enforces nothing."""
+
+    async def acquire(self, key: KeyContext) -> None:
+        """Admit a request for ``key`` or raise a 429 ProxyError."""
+
+    async def release(self, key: KeyContext, tokens: int) -> None:
+        """Finish an admitted request that used ``tokens`` LLM tokens."""
+
+    async def aclose(self) -> None:
+        """Release the limiter's resources."""
+
+
+@dataclass
+class _KeyState:
+    requests: float
+    tokens: float
+    in_flight: int
+    updated: float
+    # Seconds after ``updated`` at which both buckets are full again
+    refill_s: float = 0.0
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Token buckets held in this process.
+
+    Only touched from the event loop, so no locking is needed. Keys idle for
+    long enough for their buckets to refill are swept at most once per
+    IDLE_TTL_S, bounding memory to the recently active keys.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, _KeyState] = {}
+        self._next_sweep = time.monotonic() + IDLE_TTL_S
+
+    def _state(self, key: KeyContext, now: float) -> _KeyState:
+        state = self._states.get(key.id)
+        if state is None:
+            state = _KeyState(key.rate_limit_rpm, key.rate_limit_tpm, 0, now)
+            self._states[key.id] = state
+        elapsed = now - state.updated
+        state.requests = min(key.rate_limit_rpm, state.requests + elapsed * key.rate_limit_rpm / 60)
+        state.tokens = min(key.rate_limit_tpm, state.tokens + elapsed * key.rate_limit_tpm / 60)
+        state.updated = now
+        return state
+
+    def _sweep(self, now: float) -> None:
+        self._next_sweep = now + IDLE_TTL_S
+        idle = [
+            key_id for key_id, state in self._states.items()
+            if state.in_flight == 0 and now - state.updated >= state.refill_s
+        ]
+        for key_id in idle:
+            del self._states[key_id]
+
+    async def acquire(self, key: KeyContext) -> None:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        state = self._state(key, now)
+
+        if key.max_parallel_requests > 0 and state.in_flight >= key.max_parallel_requests:
+            raise rate_limit_error(
+                f"Rate limit reached: {key.max_parallel_requests} parallel requests", 1)
+        if key.rate_limit_rpm > 0 and state.requests < 1:
+            raise rate_limit_error(
+                f"Rate limit reached: {key.rate_limit_rpm} requests per minute",
+                (1 - state.requests) * 60 / key.rate_limit_rpm)
+        if key.rate_limit_tpm > 0 and state.tokens <= 0:
+            raise rate_limit_error(
+                f"Rate limit reached: {key.rate_limit_tpm} tokens per minute",
+                -state.tokens * 60 / key.rate_limit_tpm)
+
+        state.requests -= 1
+        state.in_flight += 1
+
+    async def release(self, key: KeyContext, tokens: int) -> None:
+        state = self._state(key, time.monotonic())
+        state.tokens -= tokens
+        state.in_flight = max(0, state.in_flight - 1)
+        state.refill_s = IDLE_TTL_S
+        if key.rate_limit_tpm > 0 and state.tokens < 0:
+            state.refill_s += -state.tokens * 60 / key.rate_limit_tpm
+
+
+# Both scripts refill the buckets from the Redis clock, so workers agree on
+# time. Buckets are stored as a hash that expires once the key goes idle.
+_REFILL_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'in_flight', 'updated')
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local in_flight = tonumber(state[3]) or 0
+local elapsed = math.max(0, now - (tonumber(state[4]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+"""
+
+_STORE_LUA = """
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens),
+           'in_flight', in_flight, 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], ARGV[#ARGV])
+"""
+
+# ARGV: rpm, tpm, max_parallel, ttl_ms. Returns {0} or {limit, retry_after}
+_ACQUIRE_LUA = _REFILL_LUA + """
+local parallel = tonumber(ARGV[3])
+if parallel > 0 and in_flight >= parallel then
+    return {'parallel', '1'}
+end
+if rpm > 0 and requests < 1 then
+    return {'rpm', tostring((1 - requests) * 60 / rpm)}
+end
+if tpm > 0 and tokens <= 0 then
+    return {'tpm', tostring(-tokens * 60 / tpm)}
+end
+requests = requests - 1
+in_flight = in_flight + 1
+""" + _STORE_LUA + """
+return {0}
+"""
+
+# ARGV: rpm, tpm, used tokens, ttl_ms
+_RELEASE_LUA = _REFILL_LUA + """
+tokens = tokens - tonumber(ARGV[3])
+in_flight = math.max(0, in_flight - 1)
+""" + _STORE_LUA
+
+
+class RedisRateLimiter(RateLimiter):
+    """Token buckets shared by every worker through Redis.
+
+    Each acquire and release is one atomic script call. Needs the optional
+    ``redis`` package. A key's hash expires after it has been idle for
+    longer than any request may run, so a worker that dies mid-request
+    cannot hold a parallel slot forever.
+    """
+
+    def __init__(self, url: str, prefix: str = "quanxai:ratelimit:"):
+        from redis.asyncio import Redis
+
+        self.redis = Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl_ms = int((settings.UPSTREAM_TIMEOUT_S + IDLE_TTL_S) * 1000)
+        self._acquire = self.redis.register_script(_ACQUIRE_LUA)
+        self._release = self.redis.register_script(_RELEASE_LUA)
+
+    async def acquire(self, key: KeyContext) -> None:
+        result = await self._acquire(
+            keys=[self.prefix + key.id],
+            args=[key.rate_limit_rpm, key.rate_limit_tpm, key.max_parallel_requests, self.ttl_ms],
+        )
+        if result[0] == 0:
+            return
+        limit, retry_after = result[0].decode(), float(result[1])
+        if limit == "parallel":
+            message = f"{key.max_parallel_requests} parallel requests"
+        elif limit == "rpm":
+            message = f"{key.rate_limit_rpm} requests per minute"
+        else:
+            message = f"{key.rate_limit_tpm} tokens per minute"
+        raise rate_limit_error(f"Rate limit reached: {message}", retry_after)
+
+    async def release(self, key: KeyContext, tokens: int) -> None:
+        await self._release(
+            keys=[self.prefix + key.id],
+            args=[key.rate_limit_rpm, key.rate_limit_tpm, tokens, self.ttl_ms],
+        )
+
+    async def aclose(self) -> None:
+        await self.redis.aclose()
+
+
+def make_rate_limiter(backend: Optional[str] = None) -> RateLimiter:
+    """Rate limiter for the configured RATE_LIMIT_BACKEND."""
+    backend = backend or settings.RATE_LIMIT_BACKEND
+    if backend == "memory":
+        return MemoryRateLimiter()
+    if backend == "redis":
+        return RedisRateLimiter(settings.RATE_LIMIT_REDIS_URL)
+    if backend == "none":
+        return RateLimiter()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}'")
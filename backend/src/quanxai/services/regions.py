@@ -0,0 +1,303 @@
+"""Latency-aware routing of AWS Bedrock models across regions.
+
+An organization's Bedrock model runs in the regions its active AWSProduct
+rows name; each request goes to the region the RegionRouter rates best.
+"""
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from sqlmodel import Session, select
+
+from quanxai.config import settings
+from quanxai.database import AWSProduct, AWSUsageLog, UsageLog, run_in_session
+from quanxai.services.circuit_breakers import CircuitBreakers
+from quanxai.services.providers import ProviderPool
+
+# Upstream statuses that make a request fall back to another region
+THROTTLE_STATUSES = (429, 503)
+
+# Weight of each outcome in a region's moving error rate
+ERROR_RATE_WEIGHT = 0.2
+
+# Longest Retry-After honoured when cooling a region down
+MAX_COOLDOWN_S = 60.0
+
+# Key of the served region in a routed response's extensions
+REGION_EXTENSION = "quanxai.region"
+
+
+@dataclass(frozen=True)
+class Deployment:
+    """A Bedrock model and the regions an organization can run it in."""
+    model_id: str
+    home_region: str
+    regions: Tuple[str, ...]
+    # AWSProduct per region; regions only listed in regions_available are
+    # attributed to the home region's product
+    products: Dict[str, str] = field(hash=False)
+    # USD per 1M input and output tokens by AWSProduct ID, if priced
+    prices: Dict[str, Tuple[float, float]] = field(hash=False)
+
+    def product_id(self, region: str) -> str:
+        return self.products.get(region, self.products[self.home_region])
+
+    def token_prices(self, region: str) -> Optional[Tuple[float, float]]:
+        """Token prices of the product serving a region, if it has them."""
+        return self.prices.get(self.product_id(region))
+
+
+def _regions_available(raw: Optional[str]) -> List[str]:
+    try:
+        regions = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return [r for r in regions if isinstance(r, str)] if isinstance(regions, list) else []
+
+
+def load_deployments(session: Session, organization_id: str) -> Dict[str, Deployment]:
+    """Active Bedrock deployments of an organization by model ID."""
+    products = session.exec(
+        select(AWSProduct)
+        .where(AWSProduct.organization_id == organization_id)
+        .where(AWSProduct.service == "bedrock")
+        .where(AWSProduct.is_active == True)
+        .order_by(AWSProduct.created_at)
+    ).all()
+
+    by_model: Dict[str, List[AWSProduct]] = {}
+    for product in products:
+        by_model.setdefault(product.model_id, []).append(product)
+
+    deployments = {}
+    for model_id, rows in by_model.items():
+        regions: List[str] = []
+        for row in rows:
+            for region in [row.region, *_regions_available(row.regions_available)]:
+                if region not in regions:
+                    regions.append(region)
+        deployments[model_id] = Deployment(
+            model_id=model_id,
+            home_region=rows[0].region,
+            regions=tuple(regions),
+            products={row.region: row.id for row in reversed(rows)},
+            prices={
+                row.id: (row.input_cost_per_1k * 1000, row.output_cost_per_1k * 1000)
+                for row in rows
+                if row.input_cost_per_1k or row.output_cost_per_1k
+            },
+        )
+    return deployments
+
+
+@dataclass
+class RegionStats:
+    """Rolling latency and error statistics of one model in one region."""
+    latency_ms: Optional[float] = None
+    sampled_at: float = 0.0
+    # Last time the region was sampled or picked for a probe
+    probed_at: float = 0.0
+    outstanding: int = 0
+    error_rate: float = 0.0
+    cooldown_until: float = 0.0
+    requests: int = 0
+    errors: int = 0
+    fallbacks: int = 0
+
+    def observe(self, latency_ms: float, decay_s: float) -> None:
+        """Fold a latency sample into the time-decayed average."""
+        now = time.monotonic()
+        if self.latency_ms is None or decay_s <= 0:
+            self.latency_ms = latency_ms
+        else:
+            weight = 1 - math.exp(-(now - self.sampled_at) / decay_s)
+            self.latency_ms += weight * (latency_ms - self.latency_ms)
+        self.sampled_at = self.probed_at = now
+        self.error_rate *= 1 - ERROR_RATE_WEIGHT
+
+    def failed(self, cooldown_s: float) -> None:
+        """Count a failure and skip the region for ``cooldown_s``."""
+        self.errors += 1
+        self.error_rate += ERROR_RATE_WEIGHT * (1 - self.error_rate)
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown_s)
+
+    def cost(self, outstanding: int) -> float:
+        """Routing cost, given the model's outstanding requests in all regions.
+
+        The average latency, weighted by the region's share of outstanding
+        requests and by its error rate (each up to twice).
+        """
+        share = self.outstanding / outstanding if outstanding else 0.0
+        return (self.latency_ms or 0.0) * (1 + share) * (1 + self.error_rate)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return min(float(response.headers["retry-after"]), MAX_COOLDOWN_S)
+    except (KeyError, ValueError):
+        return None
+
+
+def aws_usage_log(log: UsageLog, deployment: Deployment, region: str) -> AWSUsageLog:
+    """AWSUsageLog recording which region served a proxied request."""
+    cross_region = region != deployment.home_region
+    return AWSUsageLog(
+        usage_log_id=log.id,
+        aws_product_id=deployment.product_id(region),
+        region=region,
+        cross_region=cross_region,
+        original_region=deployment.home_region if cross_region else None,
+        created_at=log.created_at,
+    )
+
+
+class RegionRouter:
+    """Picks the region of each Bedrock request from in-memory statistics.
+
+    Regions are ranked by RegionStats.cost. Regions without a measurement
+    are tried first, one idle for REGION_PROBE_INTERVAL_S gets the next
+    request, and throttled, unreachable or open-breaker regions are cooled
+    down and tried last. Deployments are cached per organization for
+    REGION_CATALOG_TTL_S. Used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        breakers: Optional[CircuitBreakers] = None,
+        enabled: bool = settings.REGION_ROUTING_ENABLED,
+        decay_s: float = settings.REGION_LATENCY_DECAY_S,
+        probe_interval: float = settings.REGION_PROBE_INTERVAL_S,
+        cooldown_s: float = settings.REGION_COOLDOWN_S,
+        catalog_ttl: float = settings.REGION_CATALOG_TTL_S,
+    ):
+        self.breakers = breakers if breakers is not None else CircuitBreakers()
+        self.enabled = enabled
+        self.decay_s = decay_s
+        self.probe_interval = probe_interval
+        self.cooldown_s = cooldown_s
+        self.catalog_ttl = catalog_ttl
+        self._catalogs: Dict[str, Tuple[Dict[str, Deployment], float]] = {}
+        self._stats: Dict[Tuple[str, str], RegionStats] = {}
+
+    async def deployment(self, organization_id: str, model_id: str) -> Optional[Deployment]:
+        """The organization's deployment of a model, if it has one."""
+        entry = self._catalogs.get(organization_id)
+        if entry is None or entry[1] <= time.monotonic():
+            deployments = await run_in_session(load_deployments, organization_id)
+            entry = self._catalogs[organization_id] = (deployments, time.monotonic() + self.catalog_ttl)
+        return entry[0].get(model_id)
+
+    def stats(self, model_id: str, region: str) -> RegionStats:
+        stats = self._stats.get((model_id, region))
+        if stats is None:
+            stats = self._stats[(model_id, region)] = RegionStats()
+        return stats
+
+    def regions(self, provider: str, deployment: Deployment) -> List[str]:
+        """Regions to try for a request, best first.
+
+        Cooling-down regions and those with an open breaker come last,
+        soonest available first, so that a request still has somewhere to
+        go when every region throttles.
+        """
+        if not self.enabled:
+            return [deployment.home_region]
+        now = time.monotonic()
+        stats = {region: self.stats(deployment.model_id, region) for region in deployment.regions}
+        # When each region takes requests again; None if it does now
+        available_at: Dict[str, Optional[float]] = {}
+        for region in deployment.regions:
+            breaker = self.breakers.get(provider, deployment.model_id, region)
+            if not breaker.available():
+                available_at[region] = max(stats[region].cooldown_until, now + breaker.retry_after())
+            elif stats[region].cooldown_until > now:
+                available_at[region] = stats[region].cooldown_until
+            else:
+                available_at[region] = None
+        ready = [r for r in deployment.regions if available_at[r] is None]
+        cooling = [r for r in deployment.regions if available_at[r] is not None]
+        outstanding = sum(s.outstanding for s in stats.values())
+        ready.sort(key=lambda r: (stats[r].cost(outstanding), stats[r].outstanding))
+        cooling.sort(key=lambda r: available_at[r])
+        for region in ready[1:]:
+            if now - stats[region].probed_at >= self.probe_interval:
+                stats[region].probed_at = now
+                ready.remove(region)
+                ready.insert(0, region)
+                break
+        return ready + cooling
+
+    async def send(
+        self,
+        pool: ProviderPool,
+        provider: str,
+        deployment: Deployment,
+        path: str,
+        content: bytes,
+        stream: bool = False,
+        order: Optional[List[str]] = None,
+    ) -> httpx.Response:
+        """POST to the best region of a deployment, falling back when throttled.
+
+        ``order`` overrides the regions tried, as returned by ``regions()``.
+        With ``stream`` the response is returned once its headers arrive
+        (see ProviderPool.stream). The region that served it is in its
+        extensions, under REGION_EXTENSION.
+        """
+        regions = order or self.regions(provider, deployment)
+        for attempt, region in enumerate(regions):
+            last = attempt == len(regions) - 1
+            stats = self.stats(deployment.model_id, region)
+            breaker = self.breakers.get(provider, deployment.model_id, region)
+            if not breaker.available() and not last:
+                stats.fallbacks += 1
+                continue
+            stats.requests += 1
+            stats.outstanding += 1
+            started = time.perf_counter()
+            try:
+                send = pool.stream if stream else pool.post
+                response = await breaker.call(lambda: send(provider, path, content, region=region))
+            except httpx.HTTPError:
+                stats.failed(self.cooldown_s)
+                if last:
+                    raise
+                stats.fallbacks += 1
+                continue
+            finally:
+                stats.outstanding -= 1
+
+            if response.status_code in THROTTLE_STATUSES:
+                retry_after = _retry_after(response)
+                stats.failed(self.cooldown_s if retry_after is None else retry_after)
+                if not last:
+                    stats.fallbacks += 1
+                    await response.aclose()
+                    continue
+            elif response.status_code >= 500:
+                stats.failed(self.cooldown_s)
+            else:
+                stats.observe((time.perf_counter() - started) * 1000, self.decay_s)
+            response.extensions[REGION_EXTENSION] = region
+            return response
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Current statistics of every model and region seen so far."""
+        now = time.monotonic()
+        return [
+            {
+                "model_id": model_id,
+                "region": region,
+                "latency_ms": round(stats.latency_ms, 2) if stats.latency_ms is not None else None,
+                "outstanding": stats.outstanding,
+                "error_rate": round(stats.error_rate, 4),
+                "cooldown_s": round(max(0.0, stats.cooldown_until - now), 2),
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "fallbacks": stats.fallbacks,
+            }
+            for (model_id, region), stats in sorted(self._stats.items())
+        ]
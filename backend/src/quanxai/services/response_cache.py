@@ -0,0 +1,436 @@
+"""Exact-match and semantic response cache for the LLM proxy."""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from quanxai.config import settings
+from quanxai.database import CacheEntry, CacheMetrics, engine
+from quanxai.services import semantic_index
+from quanxai.services.semantic_index import Embedder, SemanticIndex, load_embedder, prompt_text
+
+logger = logging.getLogger(__name__)
+
+# Request fields that do not change the completion
+UNCACHED_FIELDS = frozenset({"stream", "stream_options", "user", "metadata"})
+
+# Nearest cached prompts tried on a semantic lookup, in case some expired
+SEMANTIC_CANDIDATES = 5
+
+
+class CacheConfig(BaseModel):
+    """Cache configuration."""
+    enabled: bool = True
+    default_ttl: int = 3600
+    max_cache_size: int = 1073741824  # 1GB
+    eviction_policy: str = "lru"
+    semantic_caching: bool = False
+    similarity_threshold: float = 0.95
+
+
+def _normalize(message: Any) -> Any:
+    if isinstance(message, dict) and isinstance(message.get("content"), str):
+        return {**message, "content": message["content"].strip()}
+    return message
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@dataclass
+class CacheLookup:
+    """A request's cache keys and, on a hit, the response to serve."""
+    key: str
+    prompt_hash: str
+    # Organization, model, parameters and every message but the final user
+    # message; semantic matches stay within it. None without a final user
+    # message, which is not matched semantically
+    scope: Optional[str]
+    organization_id: str
+    messages: List[Any]
+    vector: Any = None
+    entry: Optional["CachedResponse"] = None
+    semantic: bool = False
+
+
+def cache_lookup(organization_id: str, payload: Dict[str, Any]) -> CacheLookup:
+    """Cache keys of a chat completion request.
+
+    The key hashes the organization, the model and other parameters and the
+    messages with surrounding whitespace stripped, in canonical JSON. The
+    semantic scope leaves out a final user message, which is compared by
+    embedding instead, so a shared long prompt cannot make different
+    questions look alike.
+    """
+    messages = [_normalize(m) for m in payload.get("messages") or []]
+    params = {k: v for k, v in payload.items() if k not in UNCACHED_FIELDS and k != "messages"}
+    base = _digest([organization_id, params])
+    final_user = messages and isinstance(messages[-1], dict) and messages[-1].get("role") == "user"
+    return CacheLookup(
+        key=_digest([base, messages]),
+        prompt_hash=_digest(messages)[:16],
+        scope=_digest([base, messages[:-1]]) if final_user else None,
+        organization_id=organization_id,
+        messages=messages,
+    )
+
+
+class LRUPolicy:
+    """Evicts the least recently used entry."""
+
+    def __init__(self):
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, key: str) -> None:
+        self._order[key] = None
+
+    def touch(self, key: str) -> None:
+        self._order.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        del self._order[key]
+
+    def victim(self) -> str:
+        return next(iter(self._order))
+
+
+class LFUPolicy:
+    """Evicts the least frequently used entry, oldest first among equals.
+
+    Keys are bucketed by hit count so every operation is O(1).
+    """
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = defaultdict(OrderedDict)
+        self._min_count = 0
+
+    def _unlink(self, key: str) -> int:
+        count = self._counts.pop(key)
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+        return count
+
+    def add(self, key: str) -> None:
+        self._counts[key] = 1
+        self._buckets[1][key] = None
+        self._min_count = 1
+
+    def touch(self, key: str) -> None:
+        count = self._unlink(key) + 1
+        self._counts[key] = count
+        self._buckets[count][key] = None
+        if self._min_count not in self._buckets:
+            self._min_count = count
+
+    def remove(self, key: str) -> None:
+        self._unlink(key)
+
+    def victim(self) -> str:
+        if self._min_count not in self._buckets:
+            self._min_count = min(self._buckets)
+        return next(iter(self._buckets[self._min_count]))
+
+
+EVICTION_POLICIES = {"lru": LRUPolicy, "lfu": LFUPolicy}
+
+
+@dataclass
+class CachedResponse:
+    """A cached upstream response body and what serving it saves."""
+    body: bytes
+    media_type: str
+    model: str
+    organization_id: str
+    usage: Dict[str, Any]
+    cost_usd: float
+    expires_at: float
+    size: int
+
+
+@dataclass
+class _Stats:
+    hits: int = 0
+    misses: int = 0
+    tokens_saved: int = 0
+    cost_saved_usd: float = 0.0
+
+
+class ResponseCache:
+    """In-memory response cache with byte-bounded LRU/LFU eviction.
+
+    Hit and miss counts are written to CacheEntry, whose ids are the cache
+    keys, and the daily CacheMetrics every CACHE_STATS_FLUSH_INTERVAL_S, off
+    the request path. Used from the event loop only.
+    """
+
+    def __init__(self, config: Optional[CacheConfig] = None,
+                 stats_interval_s: float = settings.CACHE_STATS_FLUSH_INTERVAL_S):
+        self.config = config or CacheConfig()
+        self.stats_interval = stats_interval_s
+        self.size = 0
+        self._entries: Dict[str, CachedResponse] = {}
+        self._policy = EVICTION_POLICIES[self.config.eviction_policy]()
+        self._indexes: Dict[str, SemanticIndex] = {}
+        self._scopes: Dict[str, str] = {}
+        self._embedder: Optional[Embedder] = None
+
+        self._stored: Dict[str, Dict[str, Any]] = {}
+        self._entry_stats: Dict[str, _Stats] = defaultdict(_Stats)
+        self._org_stats: Dict[str, _Stats] = defaultdict(_Stats)
+        self._last_hit: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def configure(self, config: CacheConfig) -> None:
+        """Apply a new configuration, evicting down to the new size."""
+        if config.eviction_policy != self.config.eviction_policy:
+            policy = EVICTION_POLICIES[config.eviction_policy]()
+            for key in self._entries:
+                policy.add(key)
+            self._policy = policy
+        self.config = config
+        if not config.enabled:
+            self.clear()
+        self._evict(0)
+
+    def clear(self) -> int:
+        """Drop every entry; returns how many there were."""
+        count = len(self._entries)
+        self._entries.clear()
+        self._policy = EVICTION_POLICIES[self.config.eviction_policy]()
+        self._indexes.clear()
+        self._scopes.clear()
+        self.size = 0
+        return count
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.config.semantic_caching and semantic_index.np is not None
+
+    def _embed(self, lookup: CacheLookup) -> Any:
+        if lookup.vector is None:
+            if self._embedder is None:
+                self._embedder = load_embedder(settings.SEMANTIC_CACHE_EMBEDDER)
+            lookup.vector = self._embedder([prompt_text(lookup.messages[-1:])])[0]
+        return lookup.vector
+
+    def discard(self, key: str) -> None:
+        """Drop one entry if it is cached."""
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._policy.remove(key)
+        self.size -= entry.size
+        scope = self._scopes.pop(key, None)
+        if scope is not None:
+            index = self._indexes[scope]
+            index.remove(key)
+            if not len(index):
+                del self._indexes[scope]
+
+    def _evict(self, needed: int) -> None:
+        while self._entries and self.size + needed > self.config.max_cache_size:
+            self._remove(self._policy.victim())
+
+    def _live(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        return entry
+
+    def _similar(self, lookup: CacheLookup) -> Tuple[Optional[str], Optional[CachedResponse]]:
+        """The most similar live entry in the lookup's scope, if similar enough."""
+        index = self._indexes.get(lookup.scope) if lookup.scope is not None else None
+        if index is None:
+            return None, None
+        for key, similarity in index.nearest(self._embed(lookup), SEMANTIC_CANDIDATES):
+            if similarity < self.config.similarity_threshold:
+                break
+            entry = self._live(key)
+            if entry is not None:
+                return key, entry
+        return None, None
+
+    def lookup(self, organization_id: str, payload: Dict[str, Any], read: bool = True) -> CacheLookup:
+        """Look a request up, exactly and then semantically.
+
+        With ``read`` false only the keys are computed, for storing the
+        response afterwards.
+        """
+        lookup = cache_lookup(organization_id, payload)
+        if not read:
+            return lookup
+        key = lookup.key
+        entry = self._live(key)
+        if entry is None and self.semantic_enabled:
+            key, entry = self._similar(lookup)
+            lookup.semantic = entry is not None
+        if entry is None:
+            self._org_stats[organization_id].misses += 1
+            return lookup
+
+        lookup.entry = entry
+        self._hit(key, entry)
+        return lookup
+
+    def _hit(self, key: str, entry: CachedResponse) -> None:
+        self._policy.touch(key)
+
+        tokens = entry.usage.get("total_tokens") or 0
+        for stats in (self._entry_stats[key], self._org_stats[entry.organization_id]):
+            stats.hits += 1
+            stats.tokens_saved += tokens
+            stats.cost_saved_usd += entry.cost_usd
+        self._last_hit[key] = datetime.utcnow()
+
+    def put(
+        self,
+        lookup: CacheLookup,
+        model: str,
+        body: bytes,
+        media_type: str,
+        usage: Dict[str, Any],
+        cost_usd: float,
+    ) -> None:
+        """Cache a response, evicting others to make room.
+
+        Its size counts the body, the key and the prompt's embedding.
+        """
+        if not self.config.enabled:
+            return
+        key = lookup.key
+        vector = self._embed(lookup) if self.semantic_enabled and lookup.scope is not None else None
+        size = len(body) + len(key) + (vector.nbytes if vector is not None else 0)
+        if size > self.config.max_cache_size:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._evict(size)
+        ttl = self.config.default_ttl
+        self._entries[key] = CachedResponse(
+            body, media_type, model, lookup.organization_id, usage, cost_usd, time.monotonic() + ttl, size)
+        self._policy.add(key)
+        self.size += size
+        if vector is not None:
+            index = self._indexes.get(lookup.scope)
+            if index is None:
+                index = self._indexes[lookup.scope] = SemanticIndex(len(vector))
+            index.add(key, vector)
+            self._scopes[key] = lookup.scope
+        self._stored[key] = {
+            "prompt_hash": lookup.prompt_hash,
+            "model": model,
+            "organization_id": lookup.organization_id,
+            "tokens_cached": usage.get("total_tokens") or 0,
+            "expires_at": datetime.utcnow() + timedelta(seconds=ttl),
+        }
+
+    @property
+    def entries_count(self) -> int:
+        return len(self._entries)
+
+    async def flush(self) -> None:
+        """Write the hit and miss counts gathered since the last flush."""
+        stored, self._stored = self._stored, {}
+        entry_stats, self._entry_stats = self._entry_stats, defaultdict(_Stats)
+        org_stats, self._org_stats = self._org_stats, defaultdict(_Stats)
+        last_hit, self._last_hit = self._last_hit, {}
+        if not (stored or entry_stats or org_stats):
+            return
+        try:
+            await run_in_threadpool(write_cache_stats, stored, entry_stats, org_stats, last_hit)
+        except Exception:
+            logger.exception("Failed to write cache stats")
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.stats_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def start(self) -> None:
+        """Start writing stats periodically."""
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the periodic writes and write what is pending."""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+def write_cache_stats(
+    stored: Dict[str, Dict[str, Any]],
+    entry_stats: Dict[str, _Stats],
+    org_stats: Dict[str, _Stats],
+    last_hit: Dict[str, datetime],
+) -> None:
+    """Upsert CacheEntry rows and add to today's CacheMetrics, in one transaction."""
+    with Session(engine) as session:
+        existing = set(session.exec(select(CacheEntry.id).where(CacheEntry.id.in_(list(stored))))) if stored else set()
+        for key, values in stored.items():
+            if key in existing:
+                session.exec(
+                    update(CacheEntry)
+                    .where(CacheEntry.id == key)
+                    .values(miss_count=CacheEntry.miss_count + 1, tokens_cached=values["tokens_cached"],
+                            expires_at=values["expires_at"])
+                )
+            else:
+                session.add(CacheEntry(id=key, miss_count=1, **values))
+        session.flush()
+
+        for key, stats in entry_stats.items():
+            session.exec(
+                update(CacheEntry)
+                .where(CacheEntry.id == key)
+                .values(
+                    hit_count=CacheEntry.hit_count + stats.hits,
+                    tokens_saved=CacheEntry.tokens_saved + stats.tokens_saved,
+                    cost_saved_usd=CacheEntry.cost_saved_usd + stats.cost_saved_usd,
+                    last_hit_at=last_hit.get(key),
+                )
+            )
+
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = {
+            row.organization_id: row
+            for row in session.exec(
+                select(CacheMetrics)
+                .where(CacheMetrics.date == today, CacheMetrics.model == None)
+                .where(CacheMetrics.organization_id.in_(list(org_stats)))
+            ).all()
+        } if org_stats else {}
+        for organization_id, stats in org_stats.items():
+            row = rows.get(organization_id)
+            if row is None:
+                row = CacheMetrics(date=today, organization_id=organization_id)
+                session.add(row)
+            row.total_hits = (row.total_hits or 0) + stats.hits
+            row.total_misses = (row.total_misses or 0) + stats.misses
+            row.tokens_saved = (row.tokens_saved or 0) + stats.tokens_saved
+            row.cost_saved_usd = (row.cost_saved_usd or 0.0) + stats.cost_saved_usd
+            total = row.total_hits + row.total_misses
+            row.hit_rate = row.total_hits / total if total else 0.0
+        session.commit()
@@ -0,0 +1,513 @@
+"""Usage rollups and the dashboard query planner.
+
+Hourly and daily rollup rows hold additive UsageLog measures per bucket and
+(organization, team, user, key, model, provider). They are kept current by
+``apply_usage_logs`` as logs are ingested and can be recomputed from raw logs
+with ``rebuild_usage_rollups``.
+
+``usage_totals``, ``usage_breakdown`` and ``usage_series`` split the requested
+time range into the coarsest pieces the rollups can answer (whole days, then
+whole hours) and only scan ``usage_logs`` for partial hours at the edges, or
+when a filter or grouping is not a rollup dimension. ``latency_sketches``
+plans the same way and merges the per-row sketches of latency, time to
+first token or streaming throughput for percentiles.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, func, insert
+from sqlalchemy import select as select_rows  # yields rows even for a single column
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+from quanxai.config import settings
+from quanxai.database import UsageLog, UsageRollupDaily, UsageRollupHourly, UsageRollupState
+from quanxai.database.models import generate_uuid
+from quanxai.services.sketch import LatencySketch
+from quanxai.services.tagging import tagged_with
+from quanxai.services.timeseries import (
+    Bucket,
+    bucket_key,
+    bucket_starts,
+    dialect_name,
+    floor_to_bucket,
+    next_bucket_start,
+    start_key,
+)
+
+ROLLUP_DIMENSIONS = ("organization_id", "team_id", "user_id", "api_key_id", "model_used", "provider")
+
+ROLLUP_MEASURES = (
+    "requests",
+    "errors",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "cache_read_tokens",
+    "cache_creation_tokens",
+    "total_cost_usd",
+    "latency_sum_ms",
+    "hedged_requests",
+    "hedge_wins",
+    "hedge_cost_usd",
+)
+
+# Measures kept as quantile sketches: UsageLog column -> rollup sketch column.
+# Logs where the column is null (ttft and throughput of unstreamed requests)
+# are left out of the sketch.
+SKETCHES = {
+    "latency": ("latency_ms", "latency_sketch"),
+    "ttft": ("time_to_first_token_ms", "ttft_sketch"),
+    "throughput": ("output_tokens_per_second", "throughput_sketch"),
+}
+
+# Named additive metrics: (aggregate over usage_logs, aggregate over a rollup table)
+USAGE_METRICS = {
+    "requests": (lambda: func.count(UsageLog.id), lambda t: func.sum(t.requests)),
+    "spend": (lambda: func.sum(UsageLog.total_cost_usd), lambda t: func.sum(t.total_cost_usd)),
+    "tokens": (lambda: func.sum(UsageLog.total_tokens), lambda t: func.sum(t.total_tokens)),
+    "input_tokens": (lambda: func.sum(UsageLog.prompt_tokens), lambda t: func.sum(t.prompt_tokens)),
+    "output_tokens": (lambda: func.sum(UsageLog.completion_tokens), lambda t: func.sum(t.completion_tokens)),
+    "cache_read": (lambda: func.sum(UsageLog.cache_read_tokens), lambda t: func.sum(t.cache_read_tokens)),
+    "cache_creation": (
+        lambda: func.sum(UsageLog.cache_creation_tokens),
+        lambda t: func.sum(t.cache_creation_tokens),
+    ),
+    "successes": (
+        lambda: func.sum(case((UsageLog.is_success == True, 1), else_=0)),
+        lambda t: func.sum(t.requests - t.errors),
+    ),
+    "errors": (
+        lambda: func.sum(case((UsageLog.is_success == False, 1), else_=0)),
+        lambda t: func.sum(t.errors),
+    ),
+    "latency_sum": (lambda: func.sum(UsageLog.latency_ms), lambda t: func.sum(t.latency_sum_ms)),
+    "hedged": (
+        lambda: func.sum(case((UsageLog.hedge != None, 1), else_=0)),
+        lambda t: func.sum(t.hedged_requests),
+    ),
+    "hedge_wins": (
+        lambda: func.sum(case((UsageLog.hedge == "hedge", 1), else_=0)),
+        lambda t: func.sum(t.hedge_wins),
+    ),
+    "hedge_spend": (lambda: func.sum(UsageLog.hedge_cost_usd), lambda t: func.sum(t.hedge_cost_usd)),
+}
+
+# Raw columns needed to build rollup rows
+_RAW_COLUMNS = (
+    UsageLog.created_at,
+    *(getattr(UsageLog, name) for name in ROLLUP_DIMENSIONS),
+    UsageLog.is_success,
+    UsageLog.prompt_tokens,
+    UsageLog.completion_tokens,
+    UsageLog.total_tokens,
+    UsageLog.cache_read_tokens,
+    UsageLog.cache_creation_tokens,
+    UsageLog.total_cost_usd,
+    UsageLog.latency_ms,
+    UsageLog.hedge,
+    UsageLog.hedge_cost_usd,
+    UsageLog.time_to_first_token_ms,
+    UsageLog.output_tokens_per_second,
+)
+
+
+@dataclass
+class Segment:
+    """A slice of a time range answered from a single source table."""
+    source: Any  # UsageLog, UsageRollupHourly or UsageRollupDaily
+    start: datetime
+    end: datetime
+    include_end: bool = False
+
+
+# =============================================================================
+# Maintenance
+# =============================================================================
+
+def _aggregate(logs: Iterable[Any]) -> Tuple[Dict[tuple, Dict[str, Any]], Dict[tuple, Dict[str, Any]]]:
+    """Sum log measures into hourly and daily groups keyed by (bucket_start, *dimensions).
+
+    Each group also carries a LatencySketch under each SKETCHES column name.
+    """
+    hourly: Dict[tuple, Dict[str, Any]] = {}
+    daily: Dict[tuple, Dict[str, Any]] = {}
+    for log in logs:
+        dimensions = tuple(getattr(log, name) for name in ROLLUP_DIMENSIONS)
+        for groups, bucket in ((hourly, "hour"), (daily, "day")):
+            key = (floor_to_bucket(log.created_at, bucket), *dimensions)
+            measures = groups.get(key)
+            if measures is None:
+                measures = groups[key] = dict.fromkeys(ROLLUP_MEASURES, 0)
+                for _, sketch_column in SKETCHES.values():
+                    measures[sketch_column] = LatencySketch()
+            measures["requests"] += 1
+            measures["errors"] += 0 if log.is_success else 1
+            measures["prompt_tokens"] += log.prompt_tokens
+            measures["completion_tokens"] += log.completion_tokens
+            measures["total_tokens"] += log.total_tokens
+            measures["cache_read_tokens"] += log.cache_read_tokens
+            measures["cache_creation_tokens"] += log.cache_creation_tokens
+            measures["total_cost_usd"] += log.total_cost_usd
+            measures["latency_sum_ms"] += log.latency_ms
+            if log.hedge is not None:
+                measures["hedged_requests"] += 1
+                measures["hedge_wins"] += log.hedge == "hedge"
+                measures["hedge_cost_usd"] += log.hedge_cost_usd or 0.0
+            for column, sketch_column in SKETCHES.values():
+                value = getattr(log, column)
+                if value is not None:
+                    measures[sketch_column].add(value)
+    return hourly, daily
+
+
+def _rollup_key(row: Any) -> tuple:
+    return (row.bucket_start, *(getattr(row, name) for name in ROLLUP_DIMENSIONS))
+
+
+def apply_usage_logs(session: Session, logs: Iterable[Any]) -> None:
+    """Add newly ingested logs to the hourly and daily rollups.
+
+    Runs in the caller's transaction so logs and rollups commit together.
+    """
+    hourly, daily = _aggregate(logs)
+    for table, groups in ((UsageRollupHourly, hourly), (UsageRollupDaily, daily)):
+        if not groups:
+            continue
+        existing = {
+            _rollup_key(row): row
+            for row in session.exec(
+                select(table)
+                .where(table.bucket_start.in_({key[0] for key in groups}))
+                .where(table.organization_id.in_({key[1] for key in groups}))
+            ).all()
+        }
+        for key, measures in groups.items():
+            row = existing.get(key)
+            if row is None:
+                row = table(bucket_start=key[0], **dict(zip(ROLLUP_DIMENSIONS, key[1:])))
+                session.add(row)
+            for name in ROLLUP_MEASURES:
+                setattr(row, name, (getattr(row, name) or 0) + measures[name])
+            for _, sketch_column in SKETCHES.values():
+                if not measures[sketch_column].count:
+                    continue
+                sketch = LatencySketch.from_json(getattr(row, sketch_column))
+                sketch.merge(measures[sketch_column])
+                setattr(row, sketch_column, sketch.to_json())
+
+
+def _insert_groups(session: Session, table: Any, groups: Mapping[tuple, Dict[str, Any]]) -> None:
+    rows = [
+        {
+            "id": generate_uuid(),
+            "bucket_start": key[0],
+            **dict(zip(ROLLUP_DIMENSIONS, key[1:])),
+            **{name: measures[name] for name in ROLLUP_MEASURES},
+            **{
+                sketch_column: measures[sketch_column].to_json() if measures[sketch_column].count else None
+                for _, sketch_column in SKETCHES.values()
+            },
+        }
+        for key, measures in groups.items()
+    ]
+    if rows:
+        session.exec(insert(table), params=rows)
+
+
+def rebuild_usage_rollups(
+    session: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> int:
+    """Recompute rollups from usage_logs, one day at a time.
+
+    Without a range every day that has logs is rebuilt and the rollups are
+    marked complete, which lets the planner start using them. Returns the
+    number of days rebuilt.
+    """
+    full_rebuild = start is None and end is None
+    if start is None:
+        start = session.exec(select(func.min(UsageLog.created_at))).first()
+    if end is None:
+        end = session.exec(select(func.max(UsageLog.created_at))).first()
+
+    days = 0
+    if start is not None and end is not None:
+        for day in bucket_starts(start, end, "day"):
+            next_day = next_bucket_start(day, "day")
+            session.exec(
+                delete(UsageRollupHourly)
+                .where(UsageRollupHourly.bucket_start >= day)
+                .where(UsageRollupHourly.bucket_start < next_day)
+            )
+            session.exec(delete(UsageRollupDaily).where(UsageRollupDaily.bucket_start == day))
+
+            logs = session.exec(
+                select(*_RAW_COLUMNS)
+                .where(UsageLog.created_at >= day)
+                .where(UsageLog.created_at < next_day)
+                .execution_options(yield_per=10000)
+            )
+            hourly, daily = _aggregate(logs)
+            _insert_groups(session, UsageRollupHourly, hourly)
+            _insert_groups(session, UsageRollupDaily, daily)
+            session.commit()
+            days += 1
+
+    if full_rebuild:
+        session.merge(UsageRollupState(id="usage", rebuilt_at=datetime.utcnow()))
+        session.commit()
+    return days
+
+
+# =============================================================================
+# Query planner
+# =============================================================================
+
+def rollups_available(session: Session) -> bool:
+    """Whether rollups are enabled and have been backfilled."""
+    return settings.ROLLUPS_ENABLED and session.get(UsageRollupState, "usage") is not None
+
+
+def _ceil_to_bucket(value: datetime, bucket: Bucket) -> datetime:
+    floored = floor_to_bucket(value, bucket)
+    return floored if floored == value else next_bucket_start(floored, bucket)
+
+
+def plan_segments(
+    start: datetime,
+    end: datetime,
+    include_end: bool = False,
+    allow_daily: bool = True,
+) -> List[Segment]:
+    """Split a range into raw, hourly and daily segments, coarsest first.
+
+    Whole days come from the daily rollup, remaining whole hours from the
+    hourly rollup, and partial hours at either edge from usage_logs.
+    """
+    first_hour = _ceil_to_bucket(start, "hour")
+    last_hour = floor_to_bucket(end, "hour")
+    if first_hour >= last_hour:
+        return [Segment(UsageLog, start, end, include_end)]
+
+    segments = []
+    if start < first_hour:
+        segments.append(Segment(UsageLog, start, first_hour))
+
+    first_day = _ceil_to_bucket(first_hour, "day")
+    last_day = floor_to_bucket(last_hour, "day")
+    if allow_daily and first_day < last_day:
+        if first_hour < first_day:
+            segments.append(Segment(UsageRollupHourly, first_hour, first_day))
+        segments.append(Segment(UsageRollupDaily, first_day, last_day))
+        if last_day < last_hour:
+            segments.append(Segment(UsageRollupHourly, last_day, last_hour))
+    else:
+        segments.append(Segment(UsageRollupHourly, first_hour, last_hour))
+
+    if last_hour < end or include_end:
+        segments.append(Segment(UsageLog, last_hour, end, include_end))
+    return segments
+
+
+def _split_filter(name: str) -> Tuple[str, bool]:
+    if name.endswith("__contains"):
+        return name[: -len("__contains")], True
+    return name, False
+
+
+def filter_clauses(source: Any, filters: Optional[Mapping[str, Any]] = None) -> List[ColumnElement]:
+    """Build where-clauses on a source table from a ``{column: value}`` mapping.
+
+    Keys are column names compared for equality; a ``__contains`` suffix
+    matches a substring instead (e.g. ``provider__contains``). ``tag_id``
+    matches logs linked to that tag. None values are ignored.
+    """
+    clauses = []
+    for name, value in (filters or {}).items():
+        if value is None:
+            continue
+        if name == "tag_id":
+            clauses.append(tagged_with(value))
+            continue
+        column_name, contains = _split_filter(name)
+        column = getattr(source, column_name)
+        clauses.append(column.contains(value) if contains else column == value)
+    return clauses
+
+
+def _rollup_compatible(filters: Optional[Mapping[str, Any]], group_by: Sequence[str]) -> bool:
+    names = [_split_filter(name)[0] for name, value in (filters or {}).items() if value is not None]
+    return all(name in ROLLUP_DIMENSIONS for name in [*names, *group_by])
+
+
+def _segments(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    filters: Optional[Mapping[str, Any]],
+    group_by: Sequence[str],
+    include_end: bool,
+    allow_daily: bool = True,
+) -> List[Segment]:
+    if rollups_available(session) and _rollup_compatible(filters, group_by):
+        return plan_segments(start, end, include_end, allow_daily)
+    return [Segment(UsageLog, start, end, include_end)]
+
+
+def _time_clauses(segment: Segment) -> Tuple[Any, List[ColumnElement]]:
+    source = segment.source
+    time_column = source.created_at if source is UsageLog else source.bucket_start
+    upper = time_column <= segment.end if segment.include_end else time_column < segment.end
+    return time_column, [time_column >= segment.start, upper]
+
+
+def _query_usage(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    metrics: Sequence[str],
+    filters: Optional[Mapping[str, Any]] = None,
+    group_by: Sequence[str] = (),
+    bucket: Optional[Bucket] = None,
+    origin: Optional[datetime] = None,
+    include_end: bool = False,
+) -> Dict[tuple, Dict[str, Any]]:
+    """Run a usage aggregate across planned segments and merge the results.
+
+    Returns metric totals keyed by the group-by values (plus the bucket key
+    when bucketing).
+    """
+    segments = _segments(session, start, end, filters, group_by, include_end, allow_daily=bucket != "hour")
+
+    dialect = dialect_name(session)
+    totals: Dict[tuple, Dict[str, Any]] = {}
+    for segment in segments:
+        source = segment.source
+        raw = source is UsageLog
+        time_column, time_clauses = _time_clauses(segment)
+
+        columns = [getattr(source, name) for name in group_by]
+        if bucket:
+            columns.append(bucket_key(time_column, origin, bucket, dialect).label("bucket_key"))
+        aggregates = [
+            (USAGE_METRICS[name][0]() if raw else USAGE_METRICS[name][1](source)).label(name)
+            for name in metrics
+        ]
+        query = select_rows(*columns, *aggregates).where(*time_clauses, *filter_clauses(source, filters))
+        if columns:
+            query = query.group_by(*columns)
+
+        for row in session.exec(query).all():
+            key = tuple(row[:len(columns)])
+            merged = totals.get(key)
+            if merged is None:
+                merged = totals[key] = dict.fromkeys(metrics, 0)
+            for name in metrics:
+                merged[name] += getattr(row, name) or 0
+    return totals
+
+
+def usage_totals(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    metrics: Sequence[str],
+    filters: Optional[Mapping[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Totals of named USAGE_METRICS for ``start <= created_at <= end``."""
+    totals = _query_usage(session, start, end, metrics, filters, include_end=True)
+    return totals.get((), dict.fromkeys(metrics, 0))
+
+
+def usage_breakdown(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    metrics: Sequence[str],
+    group_by: Sequence[str],
+    filters: Optional[Mapping[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Named USAGE_METRICS grouped by UsageLog columns, one dict per group."""
+    totals = _query_usage(session, start, end, metrics, filters, group_by, include_end=True)
+    return [{**dict(zip(group_by, key)), **values} for key, values in totals.items()]
+
+
+def usage_series(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    metrics: Sequence[str],
+    bucket: Bucket = "day",
+    filters: Optional[Mapping[str, Any]] = None,
+) -> List[Tuple[datetime, Dict[str, Any]]]:
+    """Zero-filled time series of named USAGE_METRICS."""
+    starts = bucket_starts(start, end, bucket)
+    if not starts:
+        return []
+    origin = starts[0]
+    totals = _query_usage(
+        session,
+        origin,
+        next_bucket_start(starts[-1], bucket),
+        metrics,
+        filters,
+        bucket=bucket,
+        origin=origin,
+    )
+    return [
+        (bucket_start, totals.get((start_key(bucket_start, origin, bucket),), dict.fromkeys(metrics, 0)))
+        for bucket_start in starts
+    ]
+
+
+def latency_sketches(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    filters: Optional[Mapping[str, Any]] = None,
+    group_by: Sequence[str] = (),
+    measure: str = "latency",
+) -> Dict[tuple, LatencySketch]:
+    """Sketches of a SKETCHES measure for ``start <= created_at <= end`` keyed by group-by values.
+
+    Rollup segments merge the stored per-row sketches; raw segments stream
+    values into a sketch, so memory stays bounded for any window.
+    """
+    column, sketch_column = SKETCHES[measure]
+    sketches: Dict[tuple, LatencySketch] = {}
+    for segment in _segments(session, start, end, filters, group_by, include_end=True):
+        source = segment.source
+        raw = source is UsageLog
+        _, time_clauses = _time_clauses(segment)
+
+        columns = [getattr(source, name) for name in group_by]
+        value = getattr(source, column if raw else sketch_column)
+        rows = session.exec(
+            select_rows(*columns, value)
+            .where(*time_clauses, *filter_clauses(source, filters), value.isnot(None))
+            .execution_options(yield_per=10000)
+        )
+        for row in rows:
+            key = tuple(row[:len(columns)])
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = LatencySketch()
+            if raw:
+                sketch.add(row[-1])
+            else:
+                sketch.merge(LatencySketch.from_json(row[-1]))
+    return sketches
+
+
+def latency_sketch(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    filters: Optional[Mapping[str, Any]] = None,
+    measure: str = "latency",
+) -> LatencySketch:
+    """Single sketch of a measure for ``start <= created_at <= end``."""
+    return latency_sketches(session, start, end, filters, measure=measure).get((), LatencySketch())
@@ -0,0 +1,369 @@
+"""Fair sharing of upstream concurrency between teams and keys.
+
+The FairScheduler caps the requests in flight per provider and hands freed
+slots to waiting requests by weighted fair queuing between teams.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+from sqlmodel import Session, select
+
+from quanxai.config import settings
+from quanxai.database import Team, run_in_session
+from quanxai.services.errors import ProxyError
+from quanxai.services.keys import KeyContext
+from quanxai.services.sketch import LatencySketch
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Milliseconds a response waited for an upstream slot, in its extensions
+QUEUE_EXTENSION = "quanxai.queue_ms"
+
+
+def load_team_weights(
+    session: Session,
+    explicit: Dict[str, float],
+    budget_per_weight_usd: float,
+) -> Dict[str, float]:
+    """Scheduling weight of every team by ID."""
+    weights = {}
+    for team_id, name, monthly_budget in session.exec(select(Team.id, Team.name, Team.monthly_budget_usd)).all():
+        weight = explicit.get(team_id, explicit.get(name))
+        if weight is None:
+            weight = (monthly_budget or 0.0) / budget_per_weight_usd if budget_per_weight_usd > 0 else 0.0
+        weights[team_id] = max(1.0, weight)
+    return weights
+
+
+def queue_timeout_error(provider: str) -> ProxyError:
+    """503 for a request that waited too long for an upstream slot."""
+    return ProxyError(
+        503,
+        f"Provider '{provider}' is at capacity; try again later",
+        type="api_error",
+        code="upstream_busy",
+        headers={"Retry-After": "1"},
+    )
+
+
+@dataclass
+class _Flow:
+    """Requests of one key to one provider."""
+    group: str
+    finish: float = 0.0
+    queued: int = 0
+    in_flight: int = 0
+
+
+@dataclass
+class _Entry:
+    flow: _Flow
+    team_id: Optional[str]
+    priority: str
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.perf_counter)
+    dispatched: bool = False
+    cancelled: bool = False
+
+
+@dataclass
+class _TeamStats:
+    weight: float = 1.0
+    queued: int = 0
+    in_flight: int = 0
+    requests: int = 0
+    current: LatencySketch = field(default_factory=LatencySketch)
+    previous: LatencySketch = field(default_factory=LatencySketch)
+    rotated_at: float = field(default_factory=time.monotonic)
+
+    def observe(self, queue_ms: float, window_s: float) -> None:
+        now = time.monotonic()
+        if now - self.rotated_at >= window_s:
+            self.previous, self.current = self.current, LatencySketch()
+            self.rotated_at = now
+        self.current.add(queue_ms)
+        self.requests += 1
+
+
+class _Upstream:
+    """Slots and queues of one provider."""
+
+    def __init__(self, provider: str, concurrency: int, interactive_reserve: float):
+        self.provider = provider
+        self.concurrency = max(1, concurrency)
+        reserve = math.ceil(self.concurrency * interactive_reserve)
+        self.batch_concurrency = max(1, self.concurrency - reserve)
+        self.in_flight = 0
+        self.batch_in_flight = 0
+        self.vtime = 0.0
+        self.queues: Dict[str, List[Tuple[float, int, _Entry]]] = {INTERACTIVE: [], BATCH: []}
+        self.flows: Dict[str, _Flow] = {}
+        # Keys with requests queued or in flight, per team (or lone key)
+        self.active: Dict[str, Set[str]] = {}
+        self.teams: Dict[Optional[str], _TeamStats] = {}
+
+    def has_room(self, priority: str) -> bool:
+        if self.in_flight >= self.concurrency:
+            return False
+        return priority == INTERACTIVE or self.batch_in_flight < self.batch_concurrency
+
+    def _head(self, priority: str) -> Optional[_Entry]:
+        queue = self.queues[priority]
+        # Entries whose caller gave up, or is giving up, are dropped
+        while queue and (queue[0][2].cancelled or queue[0][2].future.done()):
+            heapq.heappop(queue)
+        return queue[0][2] if queue else None
+
+    def waiting(self, priority: str) -> bool:
+        """Whether a request of ``priority`` would have to queue behind others."""
+        if self._head(INTERACTIVE) is not None:
+            return True
+        return priority == BATCH and self._head(BATCH) is not None
+
+    def next(self) -> Optional[_Entry]:
+        """The waiting request to start next, removed from its queue."""
+        for priority in (INTERACTIVE, BATCH):
+            if self._head(priority) is not None and self.has_room(priority):
+                start, _, entry = heapq.heappop(self.queues[priority])
+                self.vtime = max(self.vtime, start)
+                return entry
+        return None
+
+
+class Slot:
+    """An upstream slot held by one request; release() it when done."""
+
+    def __init__(self, scheduler: "FairScheduler", upstream: _Upstream, key_id: str, entry: _Entry):
+        self._scheduler = scheduler
+        self._upstream = upstream
+        self._key_id = key_id
+        self._entry = entry
+        self.queue_ms = (time.perf_counter() - entry.queued_at) * 1000
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._finish(self._upstream, self._key_id, self._entry)
+
+
+class _SlotStream(httpx.AsyncByteStream):
+    """A streamed response body that releases its slot when closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, slot: Slot):
+        self._stream = stream
+        self._slot = slot
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._slot.release()
+
+
+class FairScheduler:
+    """Admits upstream requests per provider, fairly between teams.
+
+    Waiting requests are tagged with a virtual start time, the later of the
+    virtual clock and the finish tag of their key's previous request, which
+    then moves on by one over the key's weight; a freed slot goes to the
+    earliest tag. A team's weight is split evenly between its keys with
+    requests queued or in flight, and keys without a team weigh 1. Batch
+    requests only take slots no interactive request is waiting for. State
+    is per process and used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = settings.SCHEDULER_ENABLED,
+        concurrency: Dict[str, int] = settings.SCHEDULER_CONCURRENCY,
+        default_concurrency: int = settings.UPSTREAM_MAX_CONNECTIONS,
+        interactive_reserve: float = settings.SCHEDULER_INTERACTIVE_RESERVE,
+        team_weights: Dict[str, float] = settings.SCHEDULER_TEAM_WEIGHTS,
+        budget_per_weight_usd: float = settings.SCHEDULER_BUDGET_PER_WEIGHT_USD,
+        queue_timeout_s: float = settings.SCHEDULER_QUEUE_TIMEOUT_S,
+        weights_ttl: float = settings.SCHEDULER_WEIGHTS_TTL_S,
+        metrics_window_s: float = settings.SCHEDULER_METRICS_WINDOW_S,
+    ):
+        self.enabled = enabled
+        self.concurrency = dict(concurrency)
+        self.default_concurrency = default_concurrency
+        self.interactive_reserve = interactive_reserve
+        self.team_weights = dict(team_weights)
+        self.budget_per_weight_usd = budget_per_weight_usd
+        self.queue_timeout_s = queue_timeout_s
+        self.weights_ttl = weights_ttl
+        self.metrics_window_s = metrics_window_s
+        self._upstreams: Dict[str, _Upstream] = {}
+        self._weights: Dict[str, float] = {}
+        self._weights_until = 0.0
+        self._loading: Optional[asyncio.Future] = None
+        self._seq = itertools.count()
+
+    def _upstream(self, provider: str) -> _Upstream:
+        upstream = self._upstreams.get(provider)
+        if upstream is None:
+            concurrency = self.concurrency.get(provider, self.default_concurrency)
+            upstream = self._upstreams[provider] = _Upstream(provider, concurrency, self.interactive_reserve)
+        return upstream
+
+    async def weight(self, team_id: Optional[str]) -> float:
+        """Scheduling weight of a team, reloaded every SCHEDULER_WEIGHTS_TTL_S."""
+        if team_id is None:
+            return 1.0
+        if self._weights_until <= time.monotonic():
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(
+                    run_in_session(load_team_weights, self.team_weights, self.budget_per_weight_usd)
+                )
+            loading = self._loading
+            try:
+                self._weights = await asyncio.shield(loading)
+                self._weights_until = time.monotonic() + self.weights_ttl
+            finally:
+                if self._loading is loading and loading.done():
+                    self._loading = None
+        return self._weights.get(team_id, 1.0)
+
+    async def acquire(self, provider: str, key: KeyContext, priority: str = INTERACTIVE) -> Slot:
+        """Wait for a slot of ``provider`` for a request of ``key``.
+
+        Raises a 503 ProxyError after SCHEDULER_QUEUE_TIMEOUT_S.
+        """
+        weight = await self.weight(key.team_id)
+        upstream = self._upstream(provider)
+        group = key.team_id or f"key:{key.id}"
+        flow = upstream.flows.get(key.id)
+        if flow is None:
+            flow = upstream.flows[key.id] = _Flow(group)
+        keys = upstream.active.setdefault(group, set())
+        keys.add(key.id)
+        team = upstream.teams.get(key.team_id)
+        if team is None:
+            team = upstream.teams[key.team_id] = _TeamStats()
+        team.weight = weight
+
+        start = max(upstream.vtime, flow.finish)
+        flow.finish = start + len(keys) / weight
+        entry = _Entry(flow, key.team_id, priority, asyncio.get_running_loop().create_future())
+        if upstream.has_room(priority) and not upstream.waiting(priority):
+            upstream.vtime = max(upstream.vtime, start)
+            self._start(upstream, entry)
+            return Slot(self, upstream, key.id, entry)
+
+        heapq.heappush(upstream.queues[priority], (start, next(self._seq), entry))
+        flow.queued += 1
+        team.queued += 1
+        try:
+            await asyncio.wait_for(entry.future, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            raise queue_timeout_error(provider)
+        except BaseException:
+            if entry.dispatched:
+                # Given a slot just as the caller went away
+                self._finish(upstream, key.id, entry)
+            raise
+        finally:
+            if not entry.dispatched:
+                entry.cancelled = True
+                flow.queued -= 1
+                team.queued -= 1
+                self._forget(upstream, key.id, flow)
+        return Slot(self, upstream, key.id, entry)
+
+    def _start(self, upstream: _Upstream, entry: _Entry) -> None:
+        entry.dispatched = True
+        upstream.in_flight += 1
+        if entry.priority == BATCH:
+            upstream.batch_in_flight += 1
+        entry.flow.in_flight += 1
+        team = upstream.teams[entry.team_id]
+        team.in_flight += 1
+        team.observe((time.perf_counter() - entry.queued_at) * 1000, self.metrics_window_s)
+
+    def _finish(self, upstream: _Upstream, key_id: str, entry: _Entry) -> None:
+        upstream.in_flight -= 1
+        if entry.priority == BATCH:
+            upstream.batch_in_flight -= 1
+        entry.flow.in_flight -= 1
+        upstream.teams[entry.team_id].in_flight -= 1
+        self._forget(upstream, key_id, entry.flow)
+        while True:
+            waiting = upstream.next()
+            if waiting is None:
+                break
+            waiting.flow.queued -= 1
+            upstream.teams[waiting.team_id].queued -= 1
+            self._start(upstream, waiting)
+            waiting.future.set_result(None)
+
+    def _forget(self, upstream: _Upstream, key_id: str, flow: _Flow) -> None:
+        # An idle key starts again from the virtual clock
+        if flow.queued or flow.in_flight:
+            return
+        upstream.flows.pop(key_id, None)
+        keys = upstream.active.get(flow.group)
+        if keys is not None:
+            keys.discard(key_id)
+            if not keys:
+                del upstream.active[flow.group]
+
+    async def call(
+        self,
+        provider: str,
+        key: KeyContext,
+        send: Callable[[], Awaitable[httpx.Response]],
+        priority: str = INTERACTIVE,
+        stream: bool = False,
+    ) -> httpx.Response:
+        """``send()`` once a slot is free, holding it until the response is read.
+
+        With ``stream`` the slot is held until the response is closed.
+        """
+        if not self.enabled:
+            return await send()
+        slot = await self.acquire(provider, key, priority)
+        try:
+            response = await send()
+        except BaseException:
+            slot.release()
+            raise
+        response.extensions[QUEUE_EXTENSION] = slot.queue_ms
+        if stream:
+            response.stream = _SlotStream(response.stream, slot)
+        else:
+            slot.release()
+        return response
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Slots, queues and recent queue times per provider and team."""
+        snapshots = []
+        for provider, upstream in sorted(self._upstreams.items()):
+            for team_id, team in upstream.teams.items():
+                sketch = LatencySketch()
+                sketch.merge(team.current)
+                sketch.merge(team.previous)
+                percentiles = sketch.percentiles((50, 95, 99)) if sketch.count else {}
+                snapshots.append({
+                    "provider": provider,
+                    "concurrency": upstream.concurrency,
+                    "provider_in_flight": upstream.in_flight,
+                    "team_id": team_id,
+                    "weight": team.weight,
+                    "in_flight": team.in_flight,
+                    "queued": team.queued,
+                    "requests": team.requests,
+                    **{f"queue_ms_{p}": round(v, 2) for p, v in percentiles.items()},
+                })
+        return snapshots
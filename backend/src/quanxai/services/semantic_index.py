@@ -0,0 +1,123 @@
+"""Prompt embeddings and the vector index behind semantic caching.
+
+Prompts are embedded into unit vectors by a pluggable function, by default
+a local feature-hashing embedding of word unigrams and bigrams that needs
+no model. Each SemanticIndex keeps its vectors in one contiguous NumPy
+matrix, so a lookup is a single matrix-vector product of cosine scores.
+Rows are appended as entries are cached and swapped out as they are
+evicted, so the index never needs a full rebuild.
+
+Needs the optional ``numpy`` package (the ``semantic`` extra).
+"""
+import importlib
+import re
+import zlib
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Semantic caching is optional
+    np = None
+
+# texts -> (len(texts), dim) float32 matrix of unit rows
+Embedder = Callable[[Sequence[str]], Any]
+
+HASHING_DIM = 1024
+
+_WORD = re.compile(r"\w+")
+
+
+def hashing_embedding(texts: Sequence[str], dim: int = HASHING_DIM) -> Any:
+    """Signed feature hashing of lowercased word unigrams and bigrams."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vectors[row], hashes % dim, signs)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+EMBEDDERS: Dict[str, Embedder] = {"hashing": hashing_embedding}
+
+
+def load_embedder(name: str) -> Embedder:
+    """A registered embedder, or one given as ``package.module:function``."""
+    if name in EMBEDDERS:
+        return EMBEDDERS[name]
+    module, _, attribute = name.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown embedder '{name}'")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def prompt_text(messages: Sequence[Any]) -> str:
+    """The text of a chat prompt, one ``role: content`` line per message."""
+    lines = []
+    for message in messages:
+        if not isinstance(message, dict):
+            continue
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        if content:
+            lines.append(f"{message.get('role', '')}: {content}")
+    return "\n".join(lines)
+
+
+class SemanticIndex:
+    """Unit vectors of cached prompts, one row per cache key."""
+
+    MIN_CAPACITY = 64
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((self.MIN_CAPACITY, dim), dtype=np.float32)
+        self.keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _resize(self, capacity: int) -> None:
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self.keys)] = self.vectors[:len(self.keys)]
+        self.vectors = vectors
+
+    def add(self, key: str, vector: Any) -> None:
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.vectors):
+                self._resize(2 * row)
+            self.keys.append(key)
+            self._rows[key] = row
+        self.vectors[row] = vector
+
+    def remove(self, key: str) -> None:
+        """Drop a key, moving the last row into its place."""
+        row = self._rows.pop(key)
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.vectors[row] = self.vectors[last]
+            self.keys[row] = moved
+            self._rows[moved] = row
+        self.keys.pop()
+        if len(self.vectors) > self.MIN_CAPACITY and len(self.keys) < len(self.vectors) // 4:
+            self._resize(len(self.vectors) // 2)
+
+    def nearest(self, vector: Any, limit: int = 1) -> List[Tuple[str, float]]:
+        """Up to ``limit`` most similar keys and their cosine similarities, best first."""
+        if not self.keys:
+            return []
+        scores = self.vectors[:len(self.keys)] @ vector
+        if limit < len(scores):
+            rows = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.argsort(-scores[rows])]
+        return [(self.keys[row], float(scores[row])) for row in rows]
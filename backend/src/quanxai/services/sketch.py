@@ -0,0 +1,116 @@
+"""Mergeable quantile sketch for latency percentiles.
+
+A DDSketch-style sketch: values are counted in logarithmic bins whose width
+guarantees a relative error of at most ``relative_accuracy`` on any quantile.
+Sketches built from disjoint sets of values merge by adding bin counts, so
+one can be stored per rollup bucket and combined at query time. The number
+of bins is capped, which keeps memory bounded regardless of how many values
+were added.
+"""
+import json
+import math
+from typing import Dict, Optional, Sequence
+
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+class LatencySketch:
+    """Quantile sketch over non-negative values."""
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint (in relative terms) of the bin (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add a value to the sketch ``count`` times."""
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = self._index(value)
+            self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += count
+
+    def merge(self, other: "LatencySketch") -> None:
+        """Add the contents of another sketch with the same accuracy."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        # Fold the lowest bins together; tail percentiles keep full accuracy
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins
+        target = indexes[excess]
+        for index in indexes[:excess]:
+            self.bins[target] += self.bins.pop(index)
+
+    def quantile(self, q: float) -> float:
+        """Approximate value at quantile q (0 <= q <= 1)."""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        running = self.zero_count
+        if rank < running:
+            return 0.0
+        index = None
+        for index in sorted(self.bins):
+            running += self.bins[index]
+            if running > rank:
+                break
+        return self._value(index)
+
+    def percentiles(self, percentiles: Sequence[int] = LATENCY_PERCENTILES) -> Dict[str, float]:
+        """Percentiles keyed ``p50``, ``p95`` etc."""
+        return {f"p{p}": self.quantile(p / 100) for p in percentiles}
+
+    def to_json(self) -> str:
+        """Serialize for storage in a text column."""
+        return json.dumps({
+            "a": self.relative_accuracy,
+            "z": self.zero_count,
+            "b": {str(index): count for index, count in self.bins.items()},
+        }, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> "LatencySketch":
+        """Load a sketch stored with to_json; None gives an empty sketch."""
+        if not data:
+            return cls()
+        raw = json.loads(data)
+        sketch = cls(relative_accuracy=raw["a"])
+        sketch.zero_count = raw["z"]
+        sketch.bins = {int(index): count for index, count in raw["b"].items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+def percentile_fields(sketch: Optional[LatencySketch], suffix: str) -> Dict[str, float]:
+    """Percentiles as response fields (``p50_<suffix>`` ... ``p99_<suffix>``)."""
+    values = (sketch or LatencySketch()).percentiles()
+    return {f"{name}_{suffix}": value for name, value in values.items()}
+
+
+def latency_fields(sketch: Optional[LatencySketch]) -> Dict[str, float]:
+    """Percentiles as response fields (``p50_latency_ms`` ... ``p99_latency_ms``)."""
+    return percentile_fields(sketch, "latency_ms")
@@ -0,0 +1,212 @@
+"""Real-time spend tracking for budget enforcement on the LLM proxy.
+
+Spend is accumulated in memory per key and per active Budget as requests
+complete, and checked before a request is forwarded against the key's own
+``max_budget_usd`` and the budgets on its key, user, team and organization,
+which costs a few dict lookups. Every SPEND_FLUSH_INTERVAL_S the deltas are
+written with ``UPDATE ... SET spent_usd = spent_usd + :delta`` and the
+totals are re-read, which also picks up spend recorded by other workers and
+budgets changed through the API. The counters start from the database, so
+a restart resumes from the last flush; at most one interval of spend is
+lost if the process dies without shutting down.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from quanxai.config import settings
+from quanxai.database import APIKey, Budget, engine
+from quanxai.services.errors import ProxyError
+from quanxai.services.keys import KeyContext, key_cache
+
+logger = logging.getLogger(__name__)
+
+
+def get_reset_date(period: str, period_start: datetime) -> Optional[datetime]:
+    """Calculate next reset date based on period."""
+    if period == "daily":
+        return period_start + timedelta(days=1)
+    elif period == "weekly":
+        return period_start + timedelta(weeks=1)
+    elif period == "monthly":
+        # Add roughly one month
+        next_month = period_start.month + 1
+        year = period_start.year
+        if next_month > 12:
+            next_month = 1
+            year += 1
+        return period_start.replace(year=year, month=next_month)
+    else:  # total - no reset
+        return None
+
+
+@dataclass(frozen=True)
+class BudgetLimit:
+    """An active budget as loaded at the last flush."""
+    id: str
+    name: str
+    max_budget_usd: float
+    spent_usd: float
+
+
+def key_entities(key: KeyContext) -> List[Tuple[str, str]]:
+    """(entity_type, entity_id) of every budget scope a key's spend counts toward."""
+    entities = [("key", key.id)]
+    if key.user_id:
+        entities.append(("user", key.user_id))
+    if key.team_id:
+        entities.append(("team", key.team_id))
+    entities.append(("organization", key.organization_id))
+    return entities
+
+
+def _roll_over(session: Session, budgets: Sequence[Budget], now: datetime) -> None:
+    """Start a new period for budgets whose period has ended.
+
+    Guarded on the old period_start so that only one worker resets each.
+    """
+    for budget in budgets:
+        period_start = budget.period_start
+        reset = get_reset_date(budget.period, period_start)
+        if reset is None or reset > now:
+            continue
+        while reset <= now:
+            period_start, reset = reset, get_reset_date(budget.period, reset)
+        session.exec(
+            update(Budget)
+            .where(Budget.id == budget.id, Budget.period_start == budget.period_start)
+            .values(spent_usd=0.0, period_start=period_start)
+        )
+
+
+def write_spend(
+    key_deltas: Dict[str, float],
+    budget_deltas: Dict[str, float],
+    key_ids: Sequence[str],
+) -> Tuple[Dict[str, float], Dict[Tuple[str, str], List[BudgetLimit]]]:
+    """Apply spend deltas atomically, then read back key and budget totals."""
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        _roll_over(session, session.exec(select(Budget).where(Budget.is_active == True)).all(), now)
+        for key_id, delta in key_deltas.items():
+            session.exec(update(APIKey).where(APIKey.id == key_id).values(spent_usd=APIKey.spent_usd + delta))
+        for budget_id, delta in budget_deltas.items():
+            session.exec(
+                update(Budget)
+                .where(Budget.id == budget_id)
+                .values(spent_usd=Budget.spent_usd + delta, updated_at=now)
+            )
+        session.commit()
+
+        key_spent: Dict[str, float] = {}
+        if key_ids:
+            key_spent = dict(session.exec(select(APIKey.id, APIKey.spent_usd).where(APIKey.id.in_(key_ids))).all())
+        budgets: Dict[Tuple[str, str], List[BudgetLimit]] = defaultdict(list)
+        for budget in session.exec(select(Budget).where(Budget.is_active == True)).all():
+            budgets[(budget.entity_type, budget.entity_id)].append(
+                BudgetLimit(budget.id, budget.name, budget.max_budget_usd, budget.spent_usd)
+            )
+    return key_spent, dict(budgets)
+
+
+class SpendTracker:
+    """In-memory spend counters, flushed to the database periodically.
+
+    check() and add() are called from the event loop; flushes swap the
+    pending deltas out there too, so no locking is needed. Spend being
+    flushed still counts toward the limits until the new totals are read.
+    """
+
+    def __init__(self, flush_interval_s: float = settings.SPEND_FLUSH_INTERVAL_S):
+        self.flush_interval = flush_interval_s
+        self._key_spent: Dict[str, float] = {}
+        self._budgets: Dict[Tuple[str, str], List[BudgetLimit]] = {}
+        self._key_pending: Dict[str, float] = defaultdict(float)
+        self._budget_pending: Dict[str, float] = defaultdict(float)
+        self._key_flushing: Dict[str, float] = {}
+        self._budget_flushing: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def key_spent(self, key: KeyContext) -> float:
+        """Current spend of a key."""
+        spent = self._key_spent.get(key.id, key.spent_usd)
+        return spent + self._key_flushing.get(key.id, 0.0) + self._key_pending.get(key.id, 0.0)
+
+    def budget_spent(self, budget: BudgetLimit) -> float:
+        """Current spend of a budget in its period."""
+        return (budget.spent_usd + self._budget_flushing.get(budget.id, 0.0)
+                + self._budget_pending.get(budget.id, 0.0))
+
+    def check(self, key: KeyContext) -> None:
+        """Reject a request whose key or any budget above it is exhausted."""
+        if key.max_budget_usd > 0 and self.key_spent(key) >= key.max_budget_usd:
+            raise ProxyError(429, "API key budget exceeded", type="insufficient_quota", code="budget_exceeded")
+        for entity in key_entities(key):
+            for budget in self._budgets.get(entity, ()):
+                if budget.max_budget_usd > 0 and self.budget_spent(budget) >= budget.max_budget_usd:
+                    raise ProxyError(429, f"Budget '{budget.name}' exceeded",
+                                     type="insufficient_quota", code="budget_exceeded")
+
+    def add(self, key: KeyContext, cost: float) -> None:
+        """Count a completed request's cost toward its key and budgets."""
+        if cost <= 0:
+            return
+        self._key_spent.setdefault(key.id, key.spent_usd)
+        self._key_pending[key.id] += cost
+        for entity in key_entities(key):
+            for budget in self._budgets.get(entity, ()):
+                self._budget_pending[budget.id] += cost
+
+    async def flush(self) -> None:
+        """Write pending spend and reload the totals."""
+        self._key_flushing, self._key_pending = self._key_pending, defaultdict(float)
+        self._budget_flushing, self._budget_pending = self._budget_pending, defaultdict(float)
+        # Keys without spend since the last flush are forgotten; their next
+        # KeyContext is loaded after that flush, so it starts from its total
+        key_ids = list(self._key_flushing)
+        try:
+            key_spent, budgets = await run_in_threadpool(
+                write_spend, self._key_flushing, self._budget_flushing, key_ids)
+        except Exception:
+            logger.exception("Spend flush failed; keeping the deltas for the next one")
+            for key_id, delta in self._key_flushing.items():
+                self._key_pending[key_id] += delta
+            for budget_id, delta in self._budget_flushing.items():
+                self._budget_pending[budget_id] += delta
+            self._key_flushing, self._budget_flushing = {}, {}
+            return
+
+        self._key_spent = {key_id: key_spent[key_id] for key_id in key_ids if key_id in key_spent}
+        self._budgets = budgets
+        self._key_flushing, self._budget_flushing = {}, {}
+        # Cached KeyContexts carry the spend they were loaded with
+        for key_id in key_ids:
+            key_cache.invalidate(key_id)
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    async def start(self) -> None:
+        """Load the budgets and start flushing periodically."""
+        await self.flush()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the periodic flush and write what is pending."""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
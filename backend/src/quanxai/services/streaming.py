@@ -0,0 +1,167 @@
+"""Streamed (server-sent event) chat completions from upstream providers.
+
+The proxy forwards the provider's SSE bytes to the client as they arrive,
+without buffering the response or re-encoding chunks. StreamUsage follows
+the stream on the side to count output tokens, one per content delta, and
+picks up the usage block if the client asked for one; only that event is
+parsed as JSON. SharedStream reads the upstream response once and replays
+its chunks to every caller holding it, which is how coalesced requests
+share a stream (services.coalescing).
+"""
+import asyncio
+import itertools
+import json
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+_CONTENT = re.compile(rb'"content"\s*:\s*"(?!")')
+_USAGE = re.compile(rb'"usage"\s*:\s*\{')
+_MODEL = re.compile(rb'"model"\s*:\s*"([^"]*)"')
+
+# Rough characters per token, for prompts of streams that report no usage
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class StreamUsage:
+    """Token accounting of an OpenAI-style SSE stream, fed its raw chunks."""
+
+    def __init__(self):
+        self._pending = b""
+        self.content_events = 0
+        self.usage: Optional[Dict[str, Any]] = None
+        self.model: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> int:
+        """Account for a chunk; returns the content deltas it completed."""
+        self._pending += chunk
+        *events, self._pending = self._pending.split(b"\n\n")
+        deltas = 0
+        for event in events:
+            for line in event.splitlines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    continue
+                if self.model is None:
+                    match = _MODEL.search(data)
+                    if match:
+                        self.model = match.group(1).decode()
+                if _CONTENT.search(data):
+                    deltas += 1
+                if _USAGE.search(data):
+                    try:
+                        self.usage = json.loads(data).get("usage")
+                    except ValueError:
+                        pass
+        self.content_events += deltas
+        return deltas
+
+
+class SharedStream:
+    """An upstream streamed response, read once and replayed to its holders.
+
+    Callers hold() it while they use it and release() it when done; when
+    the last holder lets go before the stream has ended, the upstream
+    request is cancelled. A chunk is kept until every holder has read it,
+    so holders can only be added while the stream is joinable, before its
+    first chunk.
+    """
+
+    def __init__(self, open_stream: Callable[[], Awaitable[httpx.Response]]):
+        self.status_code: Optional[int] = None
+        self.headers: Optional[httpx.Headers] = None
+        self.extensions: Dict[str, Any] = {}
+        self.usage = StreamUsage()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # (chunk, content deltas it completed); self._offset chunks were dropped
+        self._chunks: List[Tuple[bytes, int]] = []
+        self._offset = 0
+        # Index of the next chunk of each holder
+        self._positions: Dict[int, int] = {}
+        self._holder_ids = itertools.count()
+        self._opened = asyncio.Event()
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._read(open_stream))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _read(self, open_stream: Callable[[], Awaitable[httpx.Response]]) -> None:
+        try:
+            response = await open_stream()
+            try:
+                self.status_code = response.status_code
+                self.headers = response.headers
+                self.extensions = response.extensions
+                self._opened.set()
+                async for chunk in response.aiter_bytes():
+                    deltas = self.usage.feed(chunk) if response.status_code == 200 else 0
+                    self._chunks.append((chunk, deltas))
+                    self._notify()
+            finally:
+                await response.aclose()
+        except (Exception, asyncio.CancelledError) as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._opened.set()
+            self._notify()
+
+    async def opened(self) -> "SharedStream":
+        """Wait for the response headers; raises if the request failed."""
+        await self._opened.wait()
+        if self.status_code is None:
+            raise self.error
+        return self
+
+    @property
+    def joinable(self) -> bool:
+        """Whether a new holder would still get the stream from its start."""
+        return not self.done and not self._offset and not self._chunks
+
+    def _trim(self) -> None:
+        read = min(self._positions.values(), default=self._offset + len(self._chunks))
+        del self._chunks[:read - self._offset]
+        self._offset = read
+
+    async def chunks(self, holder: int) -> AsyncIterator[Tuple[bytes, int]]:
+        """Every chunk from the start of the stream, as it arrives.
+
+        Raises the upstream error if the stream broke off.
+        """
+        index = self._positions[holder]
+        while holder in self._positions:
+            changed = self._changed
+            while holder in self._positions and index < self._offset + len(self._chunks):
+                chunk = self._chunks[index - self._offset]
+                index += 1
+                self._positions[holder] = index
+                self._trim()
+                yield chunk
+            if self.done:
+                if self.error is not None and not isinstance(self.error, asyncio.CancelledError):
+                    raise self.error
+                return
+            await changed.wait()
+
+    def hold(self) -> int:
+        """Add a holder, reading from the start; returns its id."""
+        holder = next(self._holder_ids)
+        self._positions[holder] = 0
+        return holder
+
+    def release(self, holder: int) -> None:
+        del self._positions[holder]
+        self._trim()
+        if not self._positions and not self.done:
+            self.task.cancel()
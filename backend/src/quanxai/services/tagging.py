@@ -0,0 +1,117 @@
+"""Tag association tables and per-tag aggregates.
+
+``UsageLog.tags`` and ``APIKey.tags`` stay the JSON source of truth returned
+by the API; ``usage_log_tags`` and ``api_key_tags`` mirror them as indexed
+rows so per-tag filters and breakdowns are joins instead of ``LIKE`` scans.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+from quanxai.database import APIKey, APIKeyTag, UsageLog, UsageLogTag
+
+
+def parse_tag_ids(tags: Optional[str]) -> List[str]:
+    """Distinct tag IDs from a JSON tags column, in order."""
+    return list(dict.fromkeys(json.loads(tags))) if tags else []
+
+
+def usage_log_tag_links(logs: Iterable[Any]) -> List[Dict[str, Any]]:
+    """usage_log_tags rows for logs (anything with id, tags and created_at)."""
+    return [
+        {"usage_log_id": log.id, "tag_id": tag_id, "created_at": log.created_at}
+        for log in logs
+        for tag_id in parse_tag_ids(log.tags)
+    ]
+
+
+def add_usage_log_tags(session: Session, logs: Iterable[Any]) -> None:
+    """Link newly ingested logs to their tags in the caller's transaction."""
+    rows = usage_log_tag_links(logs)
+    if rows:
+        session.exec(insert(UsageLogTag), params=rows)
+
+
+def set_api_key_tags(session: Session, api_key_id: str, tag_ids: Optional[Sequence[str]]) -> None:
+    """Replace the api_key_tags rows of a key in the caller's transaction."""
+    session.exec(delete(APIKeyTag).where(APIKeyTag.api_key_id == api_key_id))
+    rows = [{"api_key_id": api_key_id, "tag_id": tag_id} for tag_id in dict.fromkeys(tag_ids or [])]
+    if rows:
+        session.exec(insert(APIKeyTag), params=rows)
+
+
+def backfill_tag_links(session: Session, batch_size: int = 10000) -> Dict[str, int]:
+    """Rebuild both association tables from the JSON tags columns.
+
+    Returns the number of links written per table.
+    """
+    session.exec(delete(APIKeyTag))
+    key_links = [
+        {"api_key_id": key_id, "tag_id": tag_id}
+        for key_id, tags in session.exec(select(APIKey.id, APIKey.tags).where(APIKey.tags != None)).all()
+        for tag_id in parse_tag_ids(tags)
+    ]
+    if key_links:
+        session.exec(insert(APIKeyTag), params=key_links)
+    session.commit()
+
+    session.exec(delete(UsageLogTag))
+    session.commit()
+    log_links = 0
+    last_id = ""
+    while True:
+        batch = session.exec(
+            select(UsageLog.id, UsageLog.tags, UsageLog.created_at)
+            .where(UsageLog.id > last_id)
+            .where(UsageLog.tags != None)
+            .order_by(UsageLog.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        rows = usage_log_tag_links(batch)
+        if rows:
+            session.exec(insert(UsageLogTag), params=rows)
+        session.commit()
+        log_links += len(rows)
+        last_id = batch[-1].id
+
+    return {"api_key_tags": len(key_links), "usage_log_tags": log_links}
+
+
+def tagged_with(tag_id: str) -> ColumnElement:
+    """Where-clause matching usage logs that carry a tag."""
+    return UsageLog.id.in_(select(UsageLogTag.usage_log_id).where(UsageLogTag.tag_id == tag_id))
+
+
+def usage_by_tag(
+    session: Session,
+    start: datetime,
+    end: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Requests, tokens and spend per tag ID, from one grouped join."""
+    query = (
+        select(
+            UsageLogTag.tag_id,
+            func.count(UsageLog.id).label("requests"),
+            func.sum(UsageLog.total_tokens).label("tokens"),
+            func.sum(UsageLog.total_cost_usd).label("spend"),
+        )
+        .join(UsageLog, UsageLog.id == UsageLogTag.usage_log_id)
+        .where(UsageLogTag.created_at >= start)
+    )
+    if end is not None:
+        query = query.where(UsageLogTag.created_at <= end)
+    return {row.tag_id: row for row in session.exec(query.group_by(UsageLogTag.tag_id)).all()}
+
+
+def key_counts_by_tag(session: Session) -> Dict[str, int]:
+    """Number of API keys per tag ID."""
+    rows = session.exec(
+        select(APIKeyTag.tag_id, func.count(APIKeyTag.api_key_id)).group_by(APIKeyTag.tag_id)
+    ).all()
+    return dict(rows)
@@ -0,0 +1,133 @@
+"""Time-bucketed aggregation for dashboard trend endpoints.
+
+A whole series is produced by one grouped query: every row is mapped to the
+index of the bucket it falls in, aggregates are grouped by that index, and
+buckets without rows are zero-filled in Python.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Literal, Mapping, Sequence, Tuple
+
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+Bucket = Literal["hour", "day", "week", "month"]
+
+BUCKET_WIDTHS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+
+def floor_to_bucket(value: datetime, bucket: Bucket) -> datetime:
+    """Truncate a datetime to the start of the bucket containing it."""
+    if bucket == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    if bucket == "month":
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    # Days and weeks are anchored at midnight of the first day in range
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_bucket_start(bucket_start: datetime, bucket: Bucket) -> datetime:
+    """Start of the bucket following the one starting at bucket_start."""
+    if bucket == "month":
+        year, month = divmod(bucket_start.month, 12)
+        return bucket_start.replace(year=bucket_start.year + year, month=month + 1)
+    return bucket_start + BUCKET_WIDTHS[bucket]
+
+
+def bucket_starts(start: datetime, end: datetime, bucket: Bucket) -> List[datetime]:
+    """List the start of every bucket between start and end (inclusive)."""
+    current = floor_to_bucket(start, bucket)
+    starts = []
+    while current <= end:
+        starts.append(current)
+        current = next_bucket_start(current, bucket)
+    return starts
+
+
+def dialect_name(session: Session) -> str:
+    """Name of the SQL dialect the session is bound to."""
+    return session.get_bind().dialect.name
+
+
+def bucket_key(column: Any, origin: datetime, bucket: Bucket, dialect: str) -> ColumnElement:
+    """SQL expression mapping a timestamp column to its bucket key.
+
+    Fixed-width buckets map to an integer offset from ``origin``; months map
+    to a ``YYYY-MM`` string.
+    """
+    if bucket == "month":
+        if dialect == "postgresql":
+            return func.to_char(column, "YYYY-MM")
+        return func.strftime("%Y-%m", column)
+
+    width = BUCKET_WIDTHS[bucket].total_seconds()
+    if dialect == "postgresql":
+        elapsed = func.extract("epoch", column - origin)
+        return cast(func.floor(elapsed / width), Integer)
+    # SQLite: integer epoch seconds, floor-divided, so that rows on a bucket
+    # boundary land in the bucket they start (fractional julianday() can fall
+    # short of it). Timestamps are stored as text; their first 19 characters
+    # are the whole seconds, which strftime() would otherwise round
+    elapsed = (
+        cast(func.strftime("%s", func.substr(column, 1, 19)), Integer)
+        - cast(func.strftime("%s", origin), Integer)
+    )
+    return elapsed // int(width)
+
+
+def start_key(start: datetime, origin: datetime, bucket: Bucket) -> Any:
+    """Bucket key for a bucket start, matching what bucket_key produces."""
+    if bucket == "month":
+        return start.strftime("%Y-%m")
+    return int((start - origin) / BUCKET_WIDTHS[bucket])
+
+
+def time_series(
+    session: Session,
+    column: Any,
+    aggregates: Mapping[str, ColumnElement],
+    start: datetime,
+    end: datetime,
+    bucket: Bucket = "day",
+    where: Sequence[ColumnElement] = (),
+) -> List[Tuple[datetime, Dict[str, Any]]]:
+    """Aggregate rows into time buckets with a single grouped query.
+
+    Returns one ``(bucket_start, values)`` pair per bucket from the bucket
+    containing ``start`` up to the one containing ``end``. Buckets without
+    rows get zero for every aggregate.
+    """
+    starts = bucket_starts(start, end, bucket)
+    if not starts:
+        return []
+    origin = starts[0]
+    range_end = next_bucket_start(starts[-1], bucket)
+
+    key = bucket_key(column, origin, bucket, dialect_name(session)).label("bucket_key")
+    labelled = [expr.label(name) for name, expr in aggregates.items()]
+    rows = session.exec(
+        select(key, *labelled)
+        .where(column >= origin)
+        .where(column < range_end)
+        .where(*where)
+        .group_by(key)
+    ).all()
+
+    by_key = {row.bucket_key: row for row in rows}
+    series = []
+    for bucket_start in starts:
+        row = by_key.get(start_key(bucket_start, origin, bucket))
+        values = {name: (getattr(row, name) or 0) if row else 0 for name in aggregates}
+        series.append((bucket_start, values))
+    return series
+
+
+def bucket_label(bucket_start: datetime, bucket: Bucket) -> str:
+    """Display label for a bucket start used in trend responses."""
+    if bucket == "hour":
+        return bucket_start.isoformat()
+    return bucket_start.strftime("%Y-%m-%d")
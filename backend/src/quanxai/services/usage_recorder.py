@@ -0,0 +1,56 @@
+"""Persisting proxied requests as usage logs.
+
+The proxy builds the UsageLog rows while serving a request; the ingestion
+queue writes them in batches together with their tag links, the usage
+rollups and the keys' last use. Spend is tracked by services.spend.
+"""
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import insert, update
+from sqlmodel import Session
+
+from quanxai.database import APIKey, UsageLog, engine
+from quanxai.services.rollups import apply_usage_logs
+from quanxai.services.tagging import add_usage_log_tags
+
+# Rollup rows are read-modify-written; one writer at a time keeps
+# concurrent requests from losing each other's increments
+_write_lock = threading.Lock()
+
+
+def _apply_usage(session: Session, logs: List[Any]) -> None:
+    last_used: Dict[str, datetime] = {}
+    for log in logs:
+        last_used[log.api_key_id] = max(log.created_at, last_used.get(log.api_key_id, log.created_at))
+
+    add_usage_log_tags(session, logs)
+    apply_usage_logs(session, logs)
+    for key_id, used_at in last_used.items():
+        session.exec(update(APIKey).where(APIKey.id == key_id).values(last_used_at=used_at))
+
+
+def write_records(records: Sequence[Any]) -> None:
+    """Bulk-insert records of any table in one transaction.
+
+    Usage logs also get their tag links, rollups and the keys' last use.
+    """
+    by_table: Dict[type, List[Any]] = defaultdict(list)
+    for record in records:
+        by_table[type(record)].append(record)
+
+    # Plain rows: the records are not loaded into the session, and reading
+    # attributes off ORM instances would dominate the rollup aggregation
+    rows_by_table = {table: [row.model_dump() for row in rows] for table, rows in by_table.items()}
+
+    with _write_lock, Session(engine) as session:
+        connection = session.connection()
+        for table, rows in rows_by_table.items():
+            connection.execute(insert(table.__table__), rows)
+        if UsageLog in rows_by_table:
+            _apply_usage(session, [SimpleNamespace(**row) for row in rows_by_table[UsageLog]])
+        session.commit()
+
@@ -118,7 +118,10 @@ export interface UsageSummary {
   total_tokens: number;
   error_rate: number;
   avg_latency_ms: number;
+  p50_latency_ms: number;
+  p90_latency_ms: number;
   p95_latency_ms: number;
+  p99_latency_ms: number;
   cache_hit_rate: number;
 }
 